@@ -3,7 +3,8 @@ from dataclasses import dataclass
 
 @dataclass
 class Book:
-    path: str
+    # the processed text of each chapter, in reading order
+    chapters: List[str]
     title: str
     authors: List[str]
     image: str
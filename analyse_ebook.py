@@ -1,10 +1,221 @@
 #!/usr/bin/env python3
-import sys
-from book_utils import analyse_ebook
+"""
+Analyse one or more japanese ebooks.
+Arguments can be files, directories (searched recursively for .epub and .txt
+files) or glob patterns. Books are analysed in parallel by --jobs worker
+processes, which share the resources (MeCab tagger, frequency lists)
+loaded once by the parent process. Books that have
+already been analysed are skipped. Every finished book is recorded in the
+--state file as soon as it is done, so an interrupted run can simply be
+started again (books that changed since, or were analysed with another
+analysis version, are analysed again), and a machine-readable summary is
+written to --report, including the time and peak memory of every stage of
+each analysis.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
 
-print(sys.argv)
-assert len(sys.argv) == 2, "Usage: ./analyse_ebook.py filename"
-filename = sys.argv[1]
+from book_utils import analyse_ebook, sha256sum, load_cached_analysis
+from constants import ALLOWED_EXTENSIONS, TOKENIZER_WORKERS, RENDER_PLOT_IMAGES
+from plot_service import wait_for_images
+from resources import get_resources
+from storage import is_book_hash, load_profile
 
-book_data = analyse_ebook(filename)
-print(book_data)
+def find_books(paths: List[str]) -> Iterator[str]:
+    """
+    Yields every ebook file given by the given paths, each one only once.
+    Arguments:
+    paths: List[str] - Files, directories or glob patterns
+    """
+    seen = set()
+    for path in paths:
+        if os.path.isdir(path):
+            matches = sorted(str(p) for p in Path(path).rglob('*') if p.is_file())
+        elif os.path.isfile(path):
+            matches = [path]
+        else:
+            matches = sorted(glob.glob(path, recursive=True))
+        for match in matches:
+            extension = match.rsplit('.', 1)[-1].lower()
+            if extension in ALLOWED_EXTENSIONS and match not in seen:
+                seen.add(match)
+                yield match
+
+def read_state(state_file: str) -> Dict[str, dict]:
+    """
+    Reads the entries recorded by an earlier (possibly interrupted) run,
+    returning the latest entry for every path.
+    Arguments:
+    state_file: str - The path to the state file
+    """
+    entries = {}
+    try:
+        with open(state_file, 'r', encoding='utf-8') as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # the last line may be cut off by a crash
+                    continue
+                entries[entry['path']] = entry
+    except FileNotFoundError:
+        pass
+    return entries
+
+def record(state, entry: dict) -> None:
+    """
+    Appends an entry to the state file and makes sure it reaches the disk
+    """
+    state.write(json.dumps(entry, ensure_ascii=False) + '\n')
+    state.flush()
+    os.fsync(state.fileno())
+
+def analyse_one(path: str,
+                file_hash: str,
+                analysis_version: str,
+                workers: int,
+                render_images: bool,
+                previous: Optional[str] = None,
+                capture_profile: bool = False
+                ) -> dict:
+    """
+    Analyses a single book in a worker process and returns its entry for the report
+    """
+    start = time.perf_counter()
+    try:
+        summary = analyse_ebook(path,
+                                workers=workers,
+                                file_hash=file_hash,
+                                render_images=render_images,
+                                previous=previous,
+                                capture_profile=capture_profile)
+        wait_for_images()
+        entry = {
+            'path': path,
+            'file_hash': file_hash,
+            'analysis_version': analysis_version,
+            'status': 'done',
+            'title': summary['title'],
+            'n_words': summary['n_words'],
+            'n_words_unique': summary['n_words_unique'],
+            'seconds': round(time.perf_counter() - start, 3),
+        }
+        profile = load_profile(file_hash)
+        if profile is not None:
+            entry['peak_rss'] = profile['peak_rss']
+            entry['stages'] = {name: stage['seconds'] for name, stage in profile['stages'].items()}
+        return entry
+    except Exception as e:
+        traceback.print_exc()
+        return {
+            'path': path,
+            'file_hash': file_hash,
+            'analysis_version': analysis_version,
+            'status': 'failed',
+            'error': f'{type(e).__name__}: {e}',
+            'seconds': round(time.perf_counter() - start, 3),
+        }
+
+def book_hash(value: str) -> str:
+    """argparse type for book hashes"""
+    if not is_book_hash(value):
+        raise argparse.ArgumentTypeError(f'{value} is not a book hash')
+    return value
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('paths', nargs='+', help='Ebook files, directories or glob patterns')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='Number of books to analyse in parallel')
+    parser.add_argument('-w', '--workers', type=int, default=TOKENIZER_WORKERS,
+                        help='Number of processes to tokenize each book with')
+    parser.add_argument('--report', default='batch-report.json',
+                        help='File to write the summary report to')
+    parser.add_argument('--state', default='batch-state.jsonl',
+                        help='File recording finished books, used to resume a run')
+    parser.add_argument('--retry-failed', action='store_true',
+                        help='Analyse books that failed in an earlier run again')
+    parser.add_argument('--no-images', action='store_true',
+                        help='Do not render plot images')
+    parser.add_argument('--previous', type=book_hash, metavar='HASH',
+                        help='Hash of an earlier version of the book(s), e.g. a serial before '
+                             'new chapters were added. Unchanged chapters are not tokenized again')
+    parser.add_argument('--profile', action='store_true',
+                        help='Also profile each analysis with cProfile and tracemalloc (slow). '
+                             'The results are saved in the book directory')
+    args = parser.parse_args()
+
+    started = time.time()
+    # load the shared resources once, before the worker processes are
+    # forked, so that the workers share them instead of loading their own
+    resources = get_resources()
+    resources.preload()
+    analysis_version = resources.analysis_version()
+
+    previous = read_state(args.state)
+    entries = []
+    to_analyse = []
+    # file hash -> the path it is analysed from
+    queued: Dict[str, str] = {}
+    for path in find_books(args.paths):
+        file_hash = sha256sum(path)
+        entry = previous.get(path)
+        # an earlier entry only stands while neither the file nor the
+        # analysis version (dictionary, word lists, ...) has changed
+        if (entry and entry.get('file_hash') == file_hash
+                and entry.get('analysis_version') == analysis_version
+                and (entry['status'] != 'failed' or not args.retry_failed)):
+            entries.append(entry)
+            continue
+        if load_cached_analysis(file_hash, analysis_version) is not None:
+            entries.append({'path': path, 'file_hash': file_hash,
+                            'analysis_version': analysis_version, 'status': 'skipped'})
+            continue
+        if file_hash in queued:
+            # the same book at another path: every analysis of it writes
+            # the same book directory, so it is only analysed once
+            entries.append({'path': path, 'file_hash': file_hash, 'analysis_version': analysis_version,
+                            'status': 'skipped', 'duplicate_of': queued[file_hash]})
+            continue
+        queued[file_hash] = path
+        to_analyse.append((path, file_hash))
+
+    print(f'{len(to_analyse)} books to analyse, {len(entries)} already done')
+    render_images = RENDER_PLOT_IMAGES and not args.no_images
+    with open(args.state, 'a', encoding='utf-8') as state, \
+            ProcessPoolExecutor(max_workers=args.jobs) as pool:
+        futures = [pool.submit(analyse_one, path, file_hash, analysis_version, args.workers,
+                               render_images, args.previous, args.profile)
+                   for path, file_hash in to_analyse]
+        for i, future in enumerate(as_completed(futures)):
+            entry = future.result()
+            record(state, entry)
+            entries.append(entry)
+            print(f'[{i + 1}/{len(futures)}] {entry["status"]}: {entry["path"]}')
+
+    statuses = [entry['status'] for entry in entries]
+    report = {
+        'started': started,
+        'finished': time.time(),
+        'analysis_version': analysis_version,
+        'n_books': len(entries),
+        'n_done': statuses.count('done'),
+        'n_skipped': statuses.count('skipped'),
+        'n_failed': statuses.count('failed'),
+        'books': entries,
+    }
+    with open(args.report, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2)
+    print(f'{report["n_done"]} analysed, {report["n_skipped"]} skipped, '
+          f'{report["n_failed"]} failed. Report written to {args.report}')
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,56 @@
-from typing import List, Set, Tuple, Dict, NamedTuple, Union, Any
-from utils import parse_sentence
-from frequency_lists import get_frequency, FrequencyList, Word
+from typing import List, Set, Tuple, Dict, NamedTuple, Union, Any, Iterable, Callable, Optional, Sequence
+from collections import Counter
+import numpy as np
+from tokenizer import count_units, TokenCounts
+from frequency_index import FrequencyIndex
+from checkpoints import CheckpointStore
+from metrics import Profile, NullProfile
+from ngrams import HeavyHitters
+from readability import STAT_COLUMNS, text_stats
+from sentence_index import SentenceIndex
+from vocabulary import Vocabulary
 
 class CharAnalysis(NamedTuple):
-    all: List[str]
-    unique: Set[str]
-    with_uses: List[Dict[str, Union[str, int]]]
-    used_once: Set[str]
+    total: int
+    vocabulary: Vocabulary
+
+    @property
+    def n_unique(self) -> int:
+        return len(self.vocabulary)
+
+    @property
+    def n_used_once(self) -> int:
+        return int(self.vocabulary.used_once.sum())
 
 class WordAnalysis(NamedTuple):
-    all: List[str]
-    unique: Set[str]
-    with_uses: List[Dict[str, Any]]
-    used_once: Set[str]
-    known_unique: int
-    known_total: int
+    total: int
+    vocabulary: Vocabulary
+    # words grouped by base form and part of speech, if lemmas were counted
+    lemmas: Optional[Vocabulary] = None
+    # the sentences each word occurs in, if sentences were indexed
+    sentences: Optional[SentenceIndex] = None
+    # the counts of the most common n-grams of each kind, if n-grams were counted
+    ngrams: Optional[Dict[str, HeavyHitters]] = None
+    # the counts of each unit that its difficulty metrics are computed
+    # from (see readability.text_stats), if JLPT levels were given
+    unit_stats: Optional[np.ndarray] = None
+
+    @property
+    def n_unique(self) -> int:
+        return len(self.vocabulary)
+
+    @property
+    def n_used_once(self) -> int:
+        return int(self.vocabulary.used_once.sum())
+
+def count_occurences(items: Iterable[str]) -> Counter:
+    """
+    Counts the occurences of every item in a single pass
+    and returns a Counter mapping each item to its number of occurences.
+    Arguments:
+    items: Iterable[str] - The items (characters or words) to count
+    """
+    return Counter(items)
 
 def analyse_chars(text: str) -> CharAnalysis:
     """
@@ -23,75 +59,92 @@ def analyse_chars(text: str) -> CharAnalysis:
     Arguments:
     text: str - The text to analyse
     """
-    chars = list(text)
-    unique_chars = set(text)
-    chars_with_uses = sorted(
-        [{
-        "character": char,
-        "occurences": chars.count(char)
-        } for char in unique_chars],
-        key=lambda e: e["occurences"], reverse=True
-        )
-
-    chars_used_once = {str(char['character']) for char in chars_with_uses if char['occurences'] == 1}
-
-    return CharAnalysis(all=chars,
-            unique=unique_chars,
-            with_uses=chars_with_uses,
-            used_once=chars_used_once
+    counts = count_occurences(text)
+    return CharAnalysis(total=len(text),
+            vocabulary=Vocabulary.from_counts(counts, key='character')
             )
 
-def analyse_words(text: str, mt, frequency_lists: List[FrequencyList]) -> WordAnalysis:
+def analyse_words(units: Sequence[str],
+                  mt,
+                  frequency_index: FrequencyIndex,
+                  workers: int = 1,
+                  progress: Optional[Callable[[str, float], None]] = None,
+                  lemmas: bool = False,
+                  checkpoints: Optional[CheckpointStore] = None,
+                  profile: Optional[Profile] = None,
+                  index: bool = False,
+                  ngrams: bool = False,
+                  levels: Optional[Dict[str, int]] = None
+                  ) -> WordAnalysis:
     """
     Analyses the given text and returns a
     WordAnalysis instance describing it.
     Arguments:
-    text: str - The text to analyse
+    units: Sequence[str] - The text to analyse, split into the units it is
+    counted (and checkpointed) in, see tokenizer.split_units
     mt - A Mecab Tagger. Create using Mecab.Tagger
-    frequency_lists: List[FrequencyList] - A list of the frequency
-    lists you want to use for analysis
+    frequency_index: FrequencyIndex - The frequency lists
+    you want to use for analysis
+    workers: int (optional, default = 1) - The number of processes to
+    tokenize the text with
+    progress: Callable[[str, float], None] (optional) - Called with the
+    current stage ('tokenizing' or 'counting') and the fraction of it done
+    lemmas: bool (optional, default = False) - Whether to also count the
+    words by base form (e.g. 食べた and 食べて as 食べる) and part of speech,
+    in the same pass over the text
+    checkpoints: CheckpointStore (optional) - Where to keep the counts of
+    each unit, so that an interrupted analysis can be resumed
+    profile: Profile (optional) - Records the 'tokenizing' and 'counting' stages
+    index: bool (optional, default = False) - Whether to also build the
+    index of the sentences each word occurs in, in the same pass
+    ngrams: bool (optional, default = False) - Whether to also count the
+    most common word and kanji n-grams, in the same pass
+    levels: Dict[str, int] (optional) - The JLPT level of each word (see
+    readability.parse_levels), to also count what the difficulty metrics of
+    each unit are computed from, as the units are merged
     """
-    words = parse_sentence(text, mt)
-    unique_words = set(words)
-
-    words_with_uses = sorted(
-        [{
-        "word": word,
-        "frequency": get_frequency(word, frequency_lists),
-        "occurences": words.count(word),
-        } for word in unique_words],
-        key=lambda e: e['occurences'], reverse=True
-        )
-
-    used_once = {word['word'] for word in words_with_uses if word['occurences'] == 1}
-
-    known = analyse_known_words(unique_words, words)
-
-    return WordAnalysis(all=words,
-            unique=unique_words,
-            with_uses=words_with_uses,
-            used_once=used_once,
-            known_unique=known['unique'],
-            known_total=known['total']
-            )
+    if profile is None:
+        profile = NullProfile()
 
-def analyse_known_words(unique_words: Set[str], words: List[str]) -> Dict[str, int]:
-    """
-    Given a set of unique words present in a text, and a list of all the words
-    that appear (including repeats), performs some simple known words analysis
-    and return the number of unique known words, as well as the total number of
-    (non-unique) words in the text that are known
-    Arguments:
-    unique_words: Set[str] - The set of unique words in the text
-    words: List[str] - The list of all (non-unique) words in the text
-    """
-    known_words = process_wordlist('word-list.txt')
-    n_known_words = len(unique_words.intersection(known_words))
-    total_known_words = sum(1 if word in known_words else 0 for word in words)
-    return {
-            "unique": n_known_words,
-            "total": total_known_words
-           }
+    stats = []
+    # what has been looked up about each word, shared between the units
+    word_features = {}
+
+    def unit_stats(i: int, counts: TokenCounts) -> None:
+        stats.append(text_stats(counts.words, counts.n_sentences, len(units[i]), levels,
+                                counts.lemmas, word_features))
+
+    def tokenizing_progress(fraction: float) -> None:
+        if progress:
+            progress('tokenizing', fraction)
+
+    with profile.stage('tokenizing'):
+        counts = count_units(units, mt, workers,
+                             progress=tokenizing_progress,
+                             lemmas=lemmas,
+                             checkpoints=checkpoints,
+                             index=index,
+                             ngrams=ngrams,
+                             on_unit=unit_stats if levels is not None else None)
+    if progress:
+        progress('counting', 0.0)
+
+    with profile.stage('counting'):
+        vocabulary = Vocabulary.from_counts(counts.words, key='word', frequency_index=frequency_index)
+        lemma_vocabulary = Vocabulary.from_lemma_counts(counts.lemmas, frequency_index) if lemmas else None
+    sentences = None
+    if index:
+        with profile.stage('sentences'):
+            sentences = SentenceIndex.build(units, counts.sentences, vocabulary)
+
+    return WordAnalysis(total=vocabulary.total,
+            vocabulary=vocabulary,
+            lemmas=lemma_vocabulary,
+            sentences=sentences,
+            ngrams=counts.ngrams,
+            unit_stats=np.array(stats, dtype=np.int64).reshape(-1, len(STAT_COLUMNS))
+            if levels is not None else None
+            )
 
 def process_wordlist(filename: str) -> Set[str]:
     """
@@ -102,7 +155,20 @@ def process_wordlist(filename: str) -> Set[str]:
     Arguments:
     filename: str - The path to the .txt file containing the words
     """
-    with open(filename, 'r') as file:
-        words = set([line.replace('\n', '') for line in file.readlines()])
+    with open(filename, 'r', encoding='utf-8') as file:
+        return parse_wordlist(file)
 
+def parse_wordlist(lines: Iterable[str]) -> Set[str]:
+    """
+    Returns the set of words in the given lines of a word-list. Each line
+    holds one word; anything after a tab is ignored, so tab separated
+    exports (e.g. Anki notes exported as plain text) can be used as is.
+    Arguments:
+    lines: Iterable[str] - The lines of the word-list
+    """
+    words = set()
+    for line in lines:
+        word = line.split('\t', 1)[0].strip()
+        if word:
+            words.add(word)
     return words
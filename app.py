@@ -1,20 +1,49 @@
 #!/usr/bin/env python3
+import hashlib
+import json
 import os
+import time
+import zlib
+from pathlib import Path
 
-from flask import Flask, flash, request, redirect, url_for, jsonify
+import simplejson
+
+from flask import Flask, flash, request, redirect, url_for, jsonify, abort, Response, g
 from flask.templating import render_template, render_template_string
-from werkzeug.utils import secure_filename
 
-from book_utils import analyse_ebook
-from utils import get_books, get_book
+from jobs import JobQueue
+from utils import get_book
+import catalog
+from corpus import get_corpus, sync_corpus
+from known_words import get_known_word_lists
+from resources import get_resources
+from storage import load_book, load_profile, load_summary, load_table, book_dir, is_book_hash, TABLES
+from plot_service import load_plot
+from sentence_index import book_concordance, CONTEXT_WIDTH
+from metrics import registry
+from uploads import UploadRequest, keep_upload
+from plotly.offline import get_plotlyjs
 
-from constants import UPLOAD_FOLDER, ALLOWED_EXTENSIONS
+from constants import UPLOAD_FOLDER, ALLOWED_EXTENSIONS, KNOWN_WORDS_FILE, ALLOW_PROFILING, MAX_UPLOAD_SIZE
+from constants import TABLE_PAGE_SIZE, MAX_TABLE_PAGE_SIZE
 
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+app.config['MAX_CONTENT_LENGTH'] = MAX_UPLOAD_SIZE
 app.config['TEMPLATES_AUTO_RELOAD'] = True
 app.config['SEND_FILE_MAX_AGE_DEFAULT'] = 0
 
+# Number of characters of json a streamed response is sent in, see stream_json
+STREAM_CHUNK_SIZE = 64 * 1024
+# Default number of concordance lines per page, and the widest context allowed
+CONCORDANCE_LINES = 20
+MAX_CONTEXT_WIDTH = 200
+
+job_queue = JobQueue()
+catalog.sync_catalog()
+sync_corpus()
+
 def allowed_file(filename):
     return '.' in filename and \
             filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
@@ -23,27 +52,413 @@ def allowed_file(filename):
 def upload_file():
     return render_template('upload_file.html')
 
+def catalog_query() -> dict:
+    """
+    Reads the paging, sorting and filtering options
+    for listing books from the query string
+    """
+    return {
+        'page': request.args.get('page', 1, type=int),
+        'per_page': min(max(request.args.get('per_page', 20, type=int), 1), 100),
+        'sort': request.args.get('sort', 'analysed_at'),
+        'order': request.args.get('order', 'desc'),
+        'query': request.args.get('q') or None,
+        'min_words': request.args.get('min_words', type=int),
+        'max_words': request.args.get('max_words', type=int),
+    }
+
 @app.route('/books', methods=['GET'])
 def show_books():
-    books = get_books()
-    return render_template('books.html', books=books)
+    options = catalog_query()
+    try:
+        books, total = catalog.list_books(**options)
+    except ValueError as e:
+        abort(400, str(e))
+    add_known_word_stats(books)
+    n_pages = max((total + options['per_page'] - 1) // options['per_page'], 1)
+    return render_template('books.html', books=books, total=total,
+                           n_pages=n_pages, options=options,
+                           sort_columns=sorted(catalog.SORT_COLUMNS))
+
+@app.route('/api/books', methods=['GET'])
+def list_books_json():
+    options = catalog_query()
+    try:
+        books, total = catalog.list_books(**options)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    add_known_word_stats(books)
+    return jsonify({
+        'books': books,
+        'total': total,
+        'page': options['page'],
+        'per_page': options['per_page'],
+    })
+
+def known_words_mask():
+    """
+    Returns the mask of the known words of the user given as ?user=<name>
+    over the corpus vocabulary, using the default known-word list if no
+    user is given. Aborts if the user has no list.
+    """
+    try:
+        return get_known_word_lists().mask(get_corpus(), request.args.get('user') or None)
+    except ValueError as e:
+        abort(400, str(e))
+    except KeyError as e:
+        abort(404, str(e))
+
+def add_known_word_stats(books: list) -> None:
+    """
+    Adds the number of unique and total known words of the user given
+    as ?user=<name> to each of the given book summaries, computed from
+    the corpus at request time
+    Arguments:
+    books: list - The summaries of the books
+    """
+    corpus = get_corpus()
+    file_hashes = [book['file_hash'] for book in books if book['file_hash'] in corpus]
+    if not file_hashes:
+        return
+    if not request.args.get('user') and not Path(KNOWN_WORDS_FILE).exists():
+        return
+    coverage = {result['file_hash']: result
+                for result in corpus.coverage(known_words_mask(), file_hashes)}
+    for book in books:
+        if book['file_hash'] in coverage:
+            result = coverage[book['file_hash']]
+            book['n_known_words_unique'] = result['n_known_words_unique']
+            book['n_known_words_total'] = result['n_known_words_total']
+
+def get_plots(book_data: dict) -> list:
+    """
+    Returns the plots of the given book for the templates. A plot is shown
+    as its rendered image if there is one, and otherwise rendered
+    client-side from its json data. Passing ?render=client renders every
+    plot client-side.
+    Arguments:
+    book_data: dict - The summary of the book
+    """
+    client_side = request.args.get('render') == 'client'
+    plots = []
+    for path in book_data.get('plots', []):
+        name = Path(path).stem
+        plots.append({
+            'name': name,
+            'image': path if not client_side and Path(path).exists() else None,
+            'data_url': url_for('plot_json', hash=book_data['file_hash'], name=name),
+        })
+    return plots
 
 @app.route('/books/<string:hash>', methods=['GET'])
 def show_book(hash: str):
     book_data = get_book(hash)
+    if book_data is None:
+        abort(404)
+    add_known_word_stats([book_data])
+    # concordance lines of ?word=<word>, or just the search form
+    concordance = None
+    if 'n_sentences' in book_data:
+        word = request.args.get('word')
+        concordance = book_concordance(hash, word, limit=CONCORDANCE_LINES,
+                                       summary=book_data) if word else {}
     # return render_template('books.html', books=[book_data])
-    return render_template('book.html', book=book_data)
+    return render_template('book.html', book=book_data, plots=get_plots(book_data),
+                           concordance=concordance)
 
 @app.route('/books/<string:hash>/plots', methods=['GET'])
 def show_plots(hash: str):
     book_data = get_book(hash)
-    return render_template('plots.html', book=book_data)
+    if book_data is None:
+        abort(404)
+    return render_template('plots.html', book=book_data, plots=get_plots(book_data))
+
+@app.route('/api/books/<string:hash>/plots/<string:name>', methods=['GET'])
+def plot_json(hash: str, name: str):
+    plot = load_plot(hash, name)
+    if plot is None:
+        return jsonify({'error': f'No plot {name} for book {hash}'}), 404
+    return jsonify(plot)
+
+@app.route('/plotly.min.js', methods=['GET'])
+def plotly_js():
+    # served from the installed plotly package for client-side plots
+    return Response(get_plotlyjs(), mimetype='application/javascript',
+                    headers={'Cache-Control': 'public, max-age=86400'})
 
 @app.route('/api/books/<string:hash>', methods=['GET'])
 def return_json(hash: str):
-   book_data = get_book(hash)
-   return jsonify(book_data)
+    book_data = load_book(hash)
+    if book_data is None:
+        abort(404)
+    add_known_word_stats([book_data])
+    # stream the (possibly very long) word and character tables
+    encoder = simplejson.JSONEncoder(for_json=True, iterable_as_array=True)
+    return Response(encoder.iterencode(book_data), mimetype='application/json')
+
+def table_query() -> dict:
+    """
+    Reads the paging, sorting and filtering options
+    for listing the rows of a table from the query string
+    """
+    used_once = request.args.get('used_once')
+    return {
+        'page': max(request.args.get('page', 1, type=int), 1),
+        'per_page': min(max(request.args.get('per_page', TABLE_PAGE_SIZE, type=int), 1),
+                        MAX_TABLE_PAGE_SIZE),
+        'sort': request.args.get('sort', 'occurences'),
+        'order': request.args.get('order', 'desc'),
+        'min_stars': request.args.get('min_stars', type=int),
+        'max_stars': request.args.get('max_stars', type=int),
+        'min_occurences': request.args.get('min_occurences', type=int),
+        'max_occurences': request.args.get('max_occurences', type=int),
+        'used_once': used_once not in ('0', 'false') if used_once is not None else None,
+        'pos': request.args.get('pos') or None,
+    }
+
+def stream_json(data: dict, etag: str) -> Response:
+    """
+    Returns a response streaming the given data as json, gzipped if the
+    client accepts it. Lazy values (Vocabulary rows, generators) are
+    encoded as they are sent.
+    Arguments:
+    data: dict - The data to send
+    etag: str - The entity tag of the data. Requests with a matching
+    If-None-Match header get an empty 304 response instead.
+    """
+    compress = 'gzip' in request.accept_encodings
+    if compress:
+        # the gzipped body is a different representation
+        etag = f'{etag}-gzip'
+    headers = {'Cache-Control': 'no-cache', 'Vary': 'Accept-Encoding'}
+    if etag in request.if_none_match:
+        response = Response(status=304, headers=headers)
+        response.set_etag(etag)
+        return response
+
+    def generate():
+        encoder = simplejson.JSONEncoder(for_json=True, iterable_as_array=True)
+        gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+        buffer = []
+        size = 0
+        # the encoder yields every key and value separately,
+        # so send them in chunks rather than one by one
+        for chunk in encoder.iterencode(data):
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= STREAM_CHUNK_SIZE:
+                encoded = ''.join(buffer).encode('utf-8')
+                yield gzip.compress(encoded) if gzip else encoded
+                buffer = []
+                size = 0
+        encoded = ''.join(buffer).encode('utf-8')
+        yield gzip.compress(encoded) + gzip.flush() if gzip else encoded
+
+    if compress:
+        headers['Content-Encoding'] = 'gzip'
+    response = Response(generate(), mimetype='application/json', headers=headers)
+    response.set_etag(etag)
+    return response
+
+@app.route('/api/books/<string:hash>/<string:table>', methods=['GET'])
+def table_json(hash: str, table: str):
+    if not is_book_hash(hash) or table not in TABLES:
+        abort(404)
+    summary = load_summary(hash)
+    if summary is None or table not in summary.get('tables', {}):
+        return jsonify({'error': f'No {table} table for book {hash}'}), 404
+    options = table_query()
+    # the rows only change when the book is analysed again
+    etag = hashlib.sha256(json.dumps([
+        hash, summary['analysis_version'], summary['analysed_at'], table, options
+    ]).encode('utf-8')).hexdigest()[:32]
+
+    vocabulary = load_table(book_dir(hash), table, summary['tables'][table])
+    page, per_page = options.pop('page'), options.pop('per_page')
+    try:
+        ids, total = vocabulary.query(offset=(page - 1) * per_page, limit=per_page, **options)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return stream_json({
+        'file_hash': hash,
+        'table': table,
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'sort': options['sort'],
+        'order': options['order'],
+        'rows': (vocabulary.row(i) for i in ids.tolist()),
+    }, etag)
+
+def concordance_query() -> dict:
+    """
+    Reads the word to look up and the paging options
+    for concordance lines from the query string
+    """
+    word = request.args.get('word', '').strip()
+    if not word:
+        abort(400, 'word is required')
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', CONCORDANCE_LINES, type=int), 1),
+                   MAX_TABLE_PAGE_SIZE)
+    return {
+        'word': word,
+        'offset': (page - 1) * per_page,
+        'limit': per_page,
+        'width': min(max(request.args.get('width', CONTEXT_WIDTH, type=int), 0), MAX_CONTEXT_WIDTH),
+    }
+
+@app.route('/api/books/<string:hash>/concordance', methods=['GET'])
+def concordance_json(hash: str):
+    if not is_book_hash(hash):
+        abort(404)
+    concordance = book_concordance(hash, **concordance_query())
+    if concordance is None:
+        return jsonify({'error': f'No sentence index for book {hash}'}), 404
+    return jsonify(concordance)
+
+@app.route('/api/sentences', methods=['GET'])
+def sentences_json():
+    # example sentences for a word from every book that uses it,
+    # the books that use it the most first
+    options = concordance_query()
+    options.pop('offset')
+    limit = options.pop('limit')
+    books = request.args.get('books')
+    try:
+        books = get_corpus().books_with(options['word'],
+                [book for book in books.split(',') if book] if books else None)
+    except KeyError as e:
+        return jsonify({'error': str(e)}), 404
+    lines = []
+    for file_hash, _ in books:
+        if len(lines) >= limit:
+            break
+        summary = load_summary(file_hash)
+        concordance = book_concordance(file_hash, limit=limit - len(lines), summary=summary, **options)
+        if concordance is None:
+            continue
+        for line in concordance['lines']:
+            line.update(file_hash=file_hash, title=summary['title'])
+        lines.extend(concordance['lines'])
+    return jsonify({'word': options['word'], 'n_books': len(books), 'lines': lines})
 
+def corpus_query() -> dict:
+    """
+    Reads the books (a comma separated list of hashes, all books if not
+    given) and the result limit from the query string of a corpus request
+    """
+    books = request.args.get('books')
+    return {
+        'file_hashes': [book for book in books.split(',') if book] if books else None,
+        'limit': request.args.get('limit', 100, type=int),
+    }
+
+@app.route('/api/corpus', methods=['GET'])
+def corpus_info():
+    corpus = get_corpus()
+    return jsonify({'n_books': len(corpus), 'n_words': len(corpus.words)})
+
+@app.route('/api/corpus/overlap', methods=['GET'])
+def corpus_overlap():
+    options = corpus_query()
+    if not options['file_hashes']:
+        abort(400, 'Give the books to compare as ?books=<hash>,<hash>')
+    try:
+        return jsonify(get_corpus().overlap(min_books=request.args.get('min_books', type=int),
+                                            **options))
+    except KeyError as e:
+        abort(404, str(e))
+
+@app.route('/api/corpus/coverage', methods=['GET'])
+def corpus_coverage():
+    known = known_words_mask()
+    try:
+        return jsonify(get_corpus().coverage(known, corpus_query()['file_hashes']))
+    except KeyError as e:
+        abort(404, str(e))
+
+@app.route('/api/corpus/next-words', methods=['GET'])
+def corpus_next_words():
+    known = known_words_mask()
+    try:
+        return jsonify(get_corpus().next_words(known, **corpus_query()))
+    except KeyError as e:
+        abort(404, str(e))
+
+@app.route('/api/users/<string:user>/known-words', methods=['GET'])
+def get_known_words(user: str):
+    try:
+        words = get_known_word_lists().words(user)
+    except ValueError as e:
+        abort(400, str(e))
+    except KeyError as e:
+        abort(404, str(e))
+    if request.args.get('format') == 'txt':
+        return Response(''.join(f'{word}\n' for word in sorted(words)), mimetype='text/plain')
+    return jsonify({'user': user, 'n_words': len(words)})
+
+@app.route('/api/users/<string:user>/known-words', methods=['PUT', 'POST'])
+def upload_known_words(user: str):
+    """
+    Replaces the user's known-word list with the uploaded one: either a
+    file in the 'file' form field or the request body, one word per line
+    """
+    if 'file' in request.files:
+        text = request.files['file'].read().decode('utf-8-sig')
+    else:
+        text = request.get_data(as_text=True)
+    try:
+        n_words = get_known_word_lists().save(user, text.splitlines())
+    except ValueError as e:
+        abort(400, str(e))
+    return jsonify({'user': user, 'n_words': n_words})
+
+@app.route('/api/users/<string:user>/known-words', methods=['DELETE'])
+def delete_known_words(user: str):
+    try:
+        deleted = get_known_word_lists().delete(user)
+    except ValueError as e:
+        abort(400, str(e))
+    if not deleted:
+        abort(404)
+    return '', 204
+
+@app.before_request
+def start_timer():
+    g.started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response: Response) -> Response:
+    # labelled by route rather than path, so that e.g. every book
+    # shares one set of buckets
+    if 'started' in g:
+        endpoint = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        registry.observe_request(endpoint, time.perf_counter() - g.started)
+    return response
+
+@app.teardown_request
+def discard_uploads(exception=None):
+    # uploads that were rejected, or failed halfway, are deleted straight away
+    if isinstance(request, UploadRequest):
+        request.discard_uploads()
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(registry.export(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/books/<string:hash>/profile', methods=['GET'])
+def book_profile(hash: str):
+    if not is_book_hash(hash):
+        abort(404)
+    profile = load_profile(hash)
+    if profile is None:
+        return jsonify({'error': f'No profile for book {hash}'}), 404
+    return jsonify(profile)
+
+@app.route('/api/resources', methods=['GET'])
+def resources_info():
+    return jsonify(get_resources().info())
 
 @app.route('/upload', methods=['POST'])
 def upload_ebook():
@@ -56,13 +471,44 @@ def upload_ebook():
                 flash('No selected file')
                 return redirect('/')
 
-    if file and allowed_file(file.filename):
-        filename = secure_filename(file.filename)
-        save_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-        file.save(save_path)
-        book_data = analyse_ebook(save_path)
-        file_hash = book_data['file_hash']
-        return redirect(f'/books/{file_hash}')
+    # the hash of an earlier version of the book, e.g. a serial that has
+    # since had chapters added, so that only the new chapters are tokenized
+    previous = request.form.get('previous') or None
+    if previous is not None and not is_book_hash(previous):
+        abort(400, 'previous must be the hash of an analysed book')
+    # profile=1 captures a cProfile/tracemalloc profile of the analysis,
+    # served by /api/books/<hash>/profile once it is done
+    capture_profile = request.form.get('profile', request.args.get('profile')) == '1'
+    if capture_profile and not ALLOW_PROFILING:
+        abort(403, 'Profiling is disabled, set ALLOW_PROFILING=1 to enable it')
+
+    if not allowed_file(file.filename):
+        abort(400, f'File type not allowed, must be one of {", ".join(sorted(ALLOWED_EXTENSIONS))}')
+
+    # the file was hashed while it was received, into a directory of its
+    # own (see uploads.UploadRequest), so it is never read back to be hashed
+    save_path, file_hash = keep_upload(file)
+    job = job_queue.submit(str(save_path), file_hash,
+                           previous=previous,
+                           capture_profile=capture_profile)
+
+    if request.accept_mimetypes.best == 'application/json':
+        return jsonify(job.to_dict()), 200 if job.status == 'done' else 202
+    return redirect(f'/jobs/{job.id}')
+
+@app.route('/jobs/<string:job_id>', methods=['GET'])
+def show_job(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        abort(404)
+    return render_template('job.html', job=job)
+
+@app.route('/api/jobs/<string:job_id>', methods=['GET'])
+def job_status(job_id: str):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': f'No job with id {job_id}'}), 404
+    return jsonify(job.to_dict())
 
 if __name__ == '__main__':
     app.run(debug=True)
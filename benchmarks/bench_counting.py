@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Regression benchmark for the word/character counting engine.
+Scales data/seiajin.txt up to roughly the size of a full novel and compares
+the single-pass Counter based counting against the old
+list.count based counting.
+Usage (from the repository root): ./benchmarks/bench_counting.py [n_chars]
+"""
+import sys
+import time
+
+from common import load_text
+from analysis import analyse_chars, count_occurences
+from resources import get_resources
+from text_normalisation import clean_token
+from tokenizer import BOS_NODE, EOS_NODE, split_sentences
+
+def tokenize(text: str, mt) -> list:
+    """
+    Returns the list of (cleaned) words in the given text, in order, as
+    utils.parse_sentence used to. The counting engine no longer builds
+    this list, so it is only kept here as the input to count.
+    """
+    words = []
+    for sentence in split_sentences(text):
+        node = mt.parseToNode(sentence)
+        while node:
+            if node.stat != BOS_NODE and node.stat != EOS_NODE:
+                word = clean_token(node.surface)
+                if word:
+                    words.append(word)
+            node = node.next
+    return words
+
+def naive_counts(items: list) -> dict:
+    """
+    The counting used before the Counter based engine,
+    kept here as a baseline.
+    """
+    return {item: items.count(item) for item in set(items)}
+
+def timed(function, *args) -> float:
+    """Returns the wall time in seconds taken to call function(*args)"""
+    start = time.perf_counter()
+    function(*args)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    n_chars = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    text = load_text(n_chars)
+    mt = get_resources().tagger
+    words = tokenize(text, mt)
+    chars = list(text)
+
+    print(f'{len(chars)} characters ({len(set(chars))} unique), '
+          f'{len(words)} words ({len(set(words))} unique)')
+
+    results = [
+        ('chars, list.count', timed(naive_counts, chars)),
+        ('chars, Counter', timed(count_occurences, chars)),
+        ('chars, analyse_chars', timed(analyse_chars, text)),
+        ('words, list.count', timed(naive_counts, words)),
+        ('words, Counter', timed(count_occurences, words)),
+    ]
+    for name, seconds in results:
+        print(f'{name:<24}{seconds:>10.4f}s')
+
+    assert naive_counts(words) == count_occurences(words), 'Word counts differ'
+    assert naive_counts(chars) == count_occurences(chars), 'Character counts differ'
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark for frequency lookups. Writes synthetic frequency lists to a
+temporary directory and compares loading the lists and looking up a
+vocabulary the old way (process_frequency_list for every list, then
+get_frequency per word) against loading the saved FrequencyIndex and
+resolving the whole vocabulary with one FrequencyIndex.lookup call.
+Usage (from the repository root):
+./benchmarks/bench_frequency_index.py [n_list_words] [n_lists] [n_vocabulary_words]
+"""
+import json
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Union
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+
+from frequency_index import FrequencyIndex, load_frequency_index
+from frequency_lists import FrequencyList, Word, process_frequency_list, stars_from_frequency
+
+def get_overall_frequency(frequencies: Dict[str, Word]) -> Union[Word, str]:
+    """
+    The overall frequency as frequency_lists computed it before the
+    FrequencyIndex: the reciprocal of the average of 1 / frequency
+    """
+    frequency_scores = [1 / freq.frequency for freq in frequencies.values()]
+    if sum(frequency_scores) == 0:
+        return 'N/A'
+    overall_frequency = round(1 / sum(frequency_scores) * len(frequency_scores))
+    return Word(overall_frequency, stars_from_frequency(overall_frequency))
+
+def get_frequency(word: str, frequency_lists: List[FrequencyList]) -> Dict[str, Union[Word, str]]:
+    """The lookup of a single word in every list, as frequency_lists did it before"""
+    frequencies = {frequency_list.name: frequency_list.words[word]
+                   for frequency_list in frequency_lists if word in frequency_list.words}
+    frequencies['Overall'] = get_overall_frequency(frequencies)
+    return frequencies
+
+if __name__ == '__main__':
+    n_list_words = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    n_lists = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    n_words = int(sys.argv[3]) if len(sys.argv) > 3 else 10_000
+    rng = np.random.default_rng(0)
+    words = [f'語{i}' for i in range(2 * n_list_words)]
+    vocabulary = [words[i] for i in rng.choice(len(words), n_words, replace=False)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        for j in range(n_lists):
+            chosen = rng.choice(len(words), n_list_words, replace=False)
+            data = [[words[i], 'freq', f'★★★ ({rank + 1})'] for rank, i in enumerate(chosen)]
+            with open(f'{directory}/list{j}.json', 'w', encoding='utf-8') as file:
+                json.dump(data, file, ensure_ascii=False)
+        index_file = f'{directory}/index.npz'
+
+        start = time.perf_counter()
+        frequency_lists = [process_frequency_list(str(path))
+                           for path in sorted(Path(directory).glob('*.json'))]
+        old_load = time.perf_counter() - start
+        start = time.perf_counter()
+        old = [get_frequency(word, frequency_lists) for word in vocabulary]
+        old_lookup = time.perf_counter() - start
+
+        start = time.perf_counter()
+        load_frequency_index(directory, index_file)
+        build = time.perf_counter() - start
+        start = time.perf_counter()
+        index = load_frequency_index(directory, index_file)
+        new_load = time.perf_counter() - start
+        start = time.perf_counter()
+        ranks, overall = index.lookup(vocabulary)
+        new_lookup = time.perf_counter() - start
+
+    print(f'{n_lists} lists of {n_list_words} words, {n_words} words looked up')
+    print(f'old: load {old_load * 1000:>9.1f} ms, lookup {old_lookup * 1000:>9.1f} ms')
+    print(f'new: load {new_load * 1000:>9.1f} ms, lookup {new_lookup * 1000:>9.1f} ms '
+          f'(first build {build * 1000:.1f} ms)')
+    for i in rng.choice(n_words, min(n_words, 1000), replace=False):
+        frequencies = old[i]
+        expected = frequencies['Overall'].frequency if frequencies['Overall'] != 'N/A' else 0
+        assert overall[i] == expected, f'Overall frequency of {vocabulary[i]} differs'
+        assert index.frequency(vocabulary[i]) == frequencies, f'Frequencies of {vocabulary[i]} differ'
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the frequency distribution histogram. Builds a synthetic
+vocabulary of the given size with random 'netflix' frequency ranks and
+times computing the per-bin word counts the old way (one
+DataFrame.append per bin and per word, as plots.get_histogram used to)
+against the vectorised plots.histogram_counts.
+Usage (from the repository root): ./benchmarks/bench_histogram.py [n_words]
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import numpy as np
+import pandas as pd
+
+from plots import histogram_counts, generate_bins
+from vocabulary import Vocabulary
+
+def old_get_bins(frequency: int, bins: list) -> int:
+    """The bin lookup plots.get_histogram used before"""
+    for i in range(len(bins)):
+        low, high = bins[i].split("-")
+        if frequency >= int(low) and frequency < int(high):
+            return i
+    return len(bins) - 1
+
+def append_row(df: pd.DataFrame, row: dict) -> pd.DataFrame:
+    """DataFrame.append, which was removed in pandas 2"""
+    return pd.concat([df, pd.DataFrame([row])], ignore_index=True)
+
+def old_histogram_counts(vocabulary: Vocabulary) -> list:
+    """
+    The old DataFrame based computation, without its padding rows
+    (one per bin, plus an extra one for the first bin)
+    """
+    ranks = vocabulary.ranks[:, 0]
+    bins = generate_bins(minimum=0, maximum=int(ranks.max()), bin_width=500)
+    df = pd.DataFrame({"Range": "0-500", "Stars": [np.nan]})
+    for i in bins:
+        df = append_row(df, {'Range': i, 'Stars': 0})
+    for rank in ranks:
+        if rank:
+            df = append_row(df, {"Range": bins[old_get_bins(rank, bins)], "Stars": 0})
+    counts = df['Range'].value_counts()
+    return [int(counts.get(i, 0)) - 1 - (i == '0-500') for i in bins]
+
+if __name__ == '__main__':
+    n_words = int(sys.argv[1]) if len(sys.argv) > 1 else 5_000
+    rng = np.random.default_rng(0)
+    ranks = rng.integers(0, 100_000, size=(n_words, 1), dtype=np.int32)
+    vocabulary = Vocabulary([str(i) for i in range(n_words)],
+                            np.ones(n_words, dtype=np.int64),
+                            list_names=['netflix'], ranks=ranks)
+
+    start = time.perf_counter()
+    new = histogram_counts(vocabulary)[1]
+    new_time = time.perf_counter() - start
+    print(f'{n_words} words')
+    print(f'histogram_counts: {new_time * 1000:>10.2f} ms')
+
+    start = time.perf_counter()
+    old = old_histogram_counts(vocabulary)
+    old_time = time.perf_counter() - start
+    print(f'DataFrame.append: {old_time * 1000:>10.2f} ms ({old_time / new_time:.0f}x slower)')
+    assert old == new.tolist(), 'Bin counts differ'
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Measures the cost of counting lemmas (base form and part of speech) on top
+of counting surface forms, both done in the same pass over MeCab's nodes.
+Also shows how many unique words are merged by counting lemmas.
+Usage (from the repository root): ./benchmarks/bench_lemmas.py [n_chars]
+"""
+import sys
+import time
+
+from common import load_text
+from resources import get_resources
+from tokenizer import count_tokens
+
+def best_of(n: int, function, *args) -> float:
+    """Returns the fastest wall time in seconds of n calls to function(*args)"""
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        function(*args)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+if __name__ == '__main__':
+    n_chars = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    text = load_text(n_chars)
+    mt = get_resources().tagger
+
+    surfaces = best_of(3, count_tokens, text, mt, False)
+    both = best_of(3, count_tokens, text, mt, True)
+    counts = count_tokens(text, mt, True)
+    assert counts.words.most_common() == count_tokens(text, mt).words.most_common(), \
+        'Word counts differ when counting lemmas'
+
+    print(f'{len(text)} characters, {sum(counts.words.values())} words')
+    print(f'{len(counts.words)} unique words, {len(counts.lemmas)} unique lemmas')
+    print(f'words only:       {surfaces:>8.3f} s')
+    print(f'words and lemmas: {both:>8.3f} s ({(both / surfaces - 1) * 100:+.1f}%)')
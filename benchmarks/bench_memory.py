@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Measures the peak memory used to build the per-book word table, comparing
+the old representation (the full token list plus a list of dicts with a
+dict of Word tuples per word) against the array-backed Vocabulary.
+Usage (from the repository root): ./benchmarks/bench_memory.py [n_chars]
+"""
+import sys
+import tracemalloc
+from collections import Counter
+from typing import Iterator
+
+from common import load_text
+from resources import get_resources
+from text_normalisation import clean_token
+from tokenizer import BOS_NODE, EOS_NODE, count_tokens, split_sentences
+from vocabulary import Vocabulary
+
+def tokenize(text: str, mt) -> Iterator[str]:
+    """
+    Lazily yields the (cleaned) words in the given text,
+    as tokenizer.tokenize did before count_tokens
+    """
+    for sentence in split_sentences(text):
+        node = mt.parseToNode(sentence)
+        while node:
+            if node.stat != BOS_NODE and node.stat != EOS_NODE:
+                word = clean_token(node.surface)
+                if word:
+                    yield word
+            node = node.next
+
+def old_word_table(text: str, mt, frequency_index) -> list:
+    """
+    The word table as analyse_words used to build it, with a dict of
+    Word tuples per word (in the format of FrequencyIndex.frequency)
+    """
+    words = list(tokenize(text, mt))
+    counts = Counter(words)
+    table = [{
+        'word': word,
+        'frequency': frequency_index.frequency(word),
+        'occurences': occurences,
+        } for word, occurences in counts.most_common()]
+    return [words, table]
+
+def new_word_table(text: str, mt, frequency_index) -> Vocabulary:
+    """The word table as analyse_words builds it now"""
+    return Vocabulary.from_counts(count_tokens(text, mt).words,
+                                  frequency_index=frequency_index)
+
+def peak_memory(function, *args) -> int:
+    """
+    Returns the peak memory (in bytes) allocated while calling function(*args),
+    including the memory still held by the result.
+    """
+    tracemalloc.start()
+    result = function(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak
+
+if __name__ == '__main__':
+    n_chars = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    text = load_text(n_chars)
+
+    resources = get_resources()
+    mt = resources.tagger
+    frequency_index = resources.frequency_index
+
+    old = peak_memory(old_word_table, text, mt, frequency_index)
+    new = peak_memory(new_word_table, text, mt, frequency_index)
+    print(f'{len(text)} characters, {len(frequency_index.list_names)} frequency lists')
+    print(f'old (token list + list of dicts): {old / 2**20:>8.1f} MiB')
+    print(f'new (Vocabulary):                 {new / 2**20:>8.1f} MiB')
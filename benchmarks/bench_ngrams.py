@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the n-gram counting done alongside tokenization (see ngrams.py).
+Compares the tokenizing time (with lemmas and the sentence index, as in
+analyse_ebook) of data/seiajin.txt, scaled up to roughly the size of a full
+novel, with and without counting n-grams, and compares the bounded-memory
+n-gram summaries at several capacities against exact counting with a
+Counter: the memory the counts take up, how many of the 50 most common
+n-grams are found and how far off their counts are.
+Usage (from the repository root): ./benchmarks/bench_ngrams.py [n_chars]
+"""
+import sys
+import time
+import tracemalloc
+from collections import Counter
+
+from common import load_text
+from ngrams import WORD_NGRAMS, merge_ngrams
+from resources import get_resources
+from text_normalisation import clean_token
+from tokenizer import BOS_NODE, EOS_NODE, count_tokens, count_units, split_sentences, split_units
+
+TOP = 50
+
+def exact_ngrams(units: list, mt) -> dict:
+    """
+    Counts every word n-gram exactly, keeping all of them in Counters,
+    as a baseline. Cleaned away tokens break n-grams, as in ngrams.py.
+    """
+    counts = {name: Counter() for name in WORD_NGRAMS}
+    for unit in units:
+        for sentence in split_sentences(unit):
+            tokens = []
+            node = mt.parseToNode(sentence)
+            while node:
+                if node.stat != BOS_NODE and node.stat != EOS_NODE:
+                    tokens.append(clean_token(node.surface) or None)
+                node = node.next
+            for name, n in WORD_NGRAMS.items():
+                for i in range(len(tokens) - n + 1):
+                    ngram = tuple(tokens[i:i + n])
+                    if all(ngram):
+                        counts[name][ngram] += 1
+    return counts
+
+def summary_ngrams(units: list, mt, capacity: int) -> dict:
+    """
+    Counts the word n-grams of every unit, shrinks the summaries of
+    each unit to the given capacity and merges them
+    """
+    summaries = {}
+    for unit in units:
+        unit_summaries = count_tokens(unit, mt, ngrams=True).ngrams
+        for name in WORD_NGRAMS:
+            unit_summaries[name].capacity = capacity
+            unit_summaries[name]._prune()
+        merge_ngrams(summaries, {name: unit_summaries[name] for name in WORD_NGRAMS})
+    return summaries
+
+def measured(function, *args):
+    """
+    Returns the result of function(*args) and the traced memory
+    still taken up (by the result) once the call returns
+    """
+    tracemalloc.start()
+    result = function(*args)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+def timed(function, *args, **kwargs) -> float:
+    """Returns the wall time in seconds taken to call function(*args, **kwargs)"""
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    n_chars = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    mt = get_resources().tagger
+    text = load_text(n_chars, process=False)
+    units = split_units([text])
+    print(f'{len(text)} characters in {len(units)} units')
+
+    without = min(timed(count_units, units, mt, 1, lemmas=True, index=True) for _ in range(3))
+    with_ngrams = min(timed(count_units, units, mt, 1, lemmas=True, index=True, ngrams=True)
+                      for _ in range(3))
+    print(f'tokenizing {without:.3f}s, with n-grams {with_ngrams:.3f}s '
+          f'(+{(with_ngrams / without - 1) * 100:.1f}%)')
+
+    # accuracy on the text as is, where the summaries are under pressure
+    units = split_units([load_text(0, process=False)], 20000)
+    exact, size = measured(exact_ngrams, units, mt)
+    print(f'\n{"exact Counter":<16} {size / 2 ** 20:>6.2f} MiB  '
+          + '  '.join(f'{name}: {len(counts)} kept' for name, counts in exact.items()))
+    for capacity in (20000, 2000, 500, 100):
+        summaries, size = measured(summary_ngrams, units, mt, capacity)
+        accuracy = []
+        for name, counts in exact.items():
+            summary = summaries[name]
+            top = summary.most_common(TOP)
+            found = len({ngram for ngram, _ in top} & {ngram for ngram, _ in counts.most_common(TOP)})
+            off = max(counts[ngram] - n for ngram, n in top)
+            accuracy.append(f'{name}: {len(summary)} kept, {found}/{TOP} found, '
+                            f'off by <= {off} (bound {summary.error})')
+        print(f'{f"capacity {capacity}":<16} {size / 2 ** 20:>6.2f} MiB  ' + '  '.join(accuracy))
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Benchmark for parallel tokenization. Scales data/seiajin.txt up to the
+given length, as a single chapter, and counts its units (see
+tokenizer.count_units) with an increasing number of worker processes,
+printing the speedup over the serial path and checking that the counts
+are identical.
+Usage (from the repository root): ./benchmarks/bench_parallel_tokenize.py [n_chars]
+"""
+import os
+import sys
+import time
+
+from common import load_text
+from resources import get_resources
+from tokenizer import count_units, get_pool, split_units
+
+if __name__ == '__main__':
+    n_chars = int(sys.argv[1]) if len(sys.argv) > 1 else 3_000_000
+    units = split_units([load_text(n_chars)])
+    mt = get_resources().tagger
+
+    start = time.perf_counter()
+    serial = count_units(units, mt, 1).words
+    serial_time = time.perf_counter() - start
+    print(f'{sum(map(len, units))} characters in {len(units)} units, {sum(serial.values())} words')
+    print(f'{"workers":>8}{"seconds":>10}{"speedup":>10}')
+    print(f'{"serial":>8}{serial_time:>10.3f}{1:>10.2f}')
+
+    workers = 1
+    while workers <= (os.cpu_count() or 1):
+        # start the pool (and load the taggers) outside of the timing
+        list(get_pool(workers).map(abs, range(workers)))
+        start = time.perf_counter()
+        parallel = count_units(units, mt, workers).words
+        seconds = time.perf_counter() - start
+        assert list(parallel.most_common()) == list(serial.most_common()), \
+            f'Counts with {workers} workers differ from the serial counts'
+        print(f'{workers:>8}{seconds:>10.3f}{serial_time / seconds:>10.2f}')
+        workers *= 2
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Measures what the difficulty metrics (see readability.py) add to the
+analysis of data/seiajin.txt, scaled up to roughly the size of a full
+novel: the time spent counting the metrics of each unit as it is merged,
+and computing the metrics of the book from those counts, against the time
+spent tokenizing (with lemmas, the sentence index and n-grams, as in
+analyse_ebook).
+Usage (from the repository root): ./benchmarks/bench_readability.py [n_chars]
+"""
+import sys
+import time
+
+import numpy as np
+
+from common import load_text
+from readability import STAT_COLUMNS, readability, text_stats
+from resources import get_resources
+from tokenizer import count_units, split_units
+from vocabulary import Vocabulary
+
+if __name__ == '__main__':
+    n_chars = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    resources = get_resources()
+    levels = resources.jlpt_levels
+    units = split_units([load_text(n_chars, process=False)])
+
+    unit_counts = []
+    start = time.perf_counter()
+    counts = count_units(units, resources.tagger, 1, lemmas=True, index=True, ngrams=True,
+                         on_unit=lambda i, counts: unit_counts.append(counts))
+    tokenizing = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cache = {}
+    stats = np.array([text_stats(counts.words, counts.n_sentences, len(unit), levels, counts.lemmas, cache)
+                      for unit, counts in zip(units, unit_counts)]).reshape(-1, len(STAT_COLUMNS))
+    per_unit = time.perf_counter() - start
+
+    vocabulary = Vocabulary.from_counts(counts.words)
+    lemmas = Vocabulary.from_lemma_counts(counts.lemmas)
+    start = time.perf_counter()
+    readability(stats, [len(units)], vocabulary, levels, lemmas)
+    per_book = time.perf_counter() - start
+
+    print(f'{sum(map(len, units))} characters in {len(units)} units')
+    print(f'tokenizing {tokenizing:.3f}s, unit metrics {per_unit * 1000:.1f}ms, '
+          f'book metrics {per_book * 1000:.1f}ms '
+          f'(+{(per_unit + per_book) / tokenizing * 100:.2f}%)')
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Compares the response time and size of fetching the 100 most common words
+of a book from the full /api/books/<hash> document against the paginated
+/api/books/<hash>/words endpoint (plain, gzipped, sorted by frequency stars
+and filtered, and revalidated with If-None-Match). Analyses data/seiajin.txt
+first if it has not been analysed yet.
+Usage (from the repository root): ./benchmarks/bench_table_api.py [n_requests]
+"""
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from app import app
+from book_utils import analyse_ebook
+
+def timed_get(client, url: str, n: int, headers: dict = None):
+    """
+    Returns the fastest wall time in seconds of n requests
+    for the given url, and the size of the response body
+    """
+    times = []
+    for _ in range(n):
+        start = time.perf_counter()
+        response = client.get(url, headers=headers)
+        body = response.get_data()
+        times.append(time.perf_counter() - start)
+        assert response.status_code in (200, 304), f'{url}: {response.status_code}'
+    return min(times), len(body)
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    file_hash = analyse_ebook('data/seiajin.txt', render_images=False)['file_hash']
+    client = app.test_client()
+    etag = client.get(f'/api/books/{file_hash}/words').headers['ETag'].strip('"')
+
+    requests = [
+        ('full document', f'/api/books/{file_hash}', None),
+        ('words, page 1', f'/api/books/{file_hash}/words', None),
+        ('words, gzip', f'/api/books/{file_hash}/words', {'Accept-Encoding': 'gzip'}),
+        ('words by stars, used once', f'/api/books/{file_hash}/words?sort=stars&used_once=1', None),
+        ('words, not modified', f'/api/books/{file_hash}/words', {'If-None-Match': f'"{etag}"'}),
+    ]
+    for name, url, headers in requests:
+        seconds, size = timed_get(client, url, n, headers)
+        print(f'{name:<28} {seconds * 1000:>8.2f} ms {size:>10} bytes')
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Microbenchmarks for the text normalisation functions. Each function is
+timed against the implementation it replaced, and checked to give the
+same output, on data/seiajin.txt scaled up to the given length.
+Usage (from the repository root): ./benchmarks/bench_text_normalisation.py [n_chars]
+"""
+import re
+import sys
+import timeit
+
+from common import load_text
+from text_normalisation import filter_japanese_text, clean_token
+
+def old_filter_japanese_text(text: str) -> str:
+    """The filter used by utils.process_japanese_text before"""
+    regex = r"[\u3000-\u303F]|[\u3040-\u309F]|[\u30A0-\u30FF]|[\uFF00-\uFFEF]|[\u4E00-\u9FAF]|[\u2605-\u2606]|[\u2190-\u2195]|\u203B"
+    return ''.join(re.findall(regex, text)).replace('\u3000', '')
+
+def old_clean_token(surface: str) -> str:
+    """The token cleaning done in utils.parse_sentence before"""
+    filter_str = r'()./,!:?\uksa0123456789\t\r\s .'
+    word = re.sub(r'\s+', '', surface)
+    for char in filter_str:
+        word = word.replace(char, '')
+    return word
+
+def bench(name: str, old, new, argument, number: int) -> None:
+    """
+    Times old and new on the same argument and prints the
+    results, after checking that they give the same output
+    """
+    assert old(argument) == new(argument), f'{name}: outputs differ'
+    old_time = timeit.timeit(lambda: old(argument), number=number) / number
+    new_time = timeit.timeit(lambda: new(argument), number=number) / number
+    print(f'{name:<28}{old_time * 1000:>12.3f}{new_time * 1000:>12.3f}{old_time / new_time:>10.1f}x')
+
+if __name__ == '__main__':
+    n_chars = int(sys.argv[1]) if len(sys.argv) > 1 else 300_000
+    raw_text = load_text(n_chars, process=False)
+    tokens = list(filter_japanese_text(raw_text)[:n_chars // 10]) + \
+        ['食べる', ' 123', '(笑)', 'a.b', '\u3000猫\t']
+
+    print(f'{"":<28}{"old (ms)":>12}{"new (ms)":>12}{"speedup":>11}')
+    bench('filter_japanese_text', old_filter_japanese_text, filter_japanese_text, raw_text, 5)
+    bench('clean_token (per token)', old_clean_token, clean_token, '食べる', 10000)
+    bench('clean_token (all tokens)',
+          lambda tokens: [old_clean_token(token) for token in tokens],
+          lambda tokens: [clean_token(token) for token in tokens],
+          tokens, 5)
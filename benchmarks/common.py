@@ -0,0 +1,27 @@
+"""
+Helpers shared by the benchmarks. Importing this module puts the
+repository root on sys.path, so the benchmarks can import the app's
+modules when run as ./benchmarks/<name>.py from the repository root.
+"""
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from utils import process_japanese_text
+
+def load_text(n_chars: int, process: bool = True) -> str:
+    """
+    Returns the text of data/seiajin.txt repeated until
+    it is at least n_chars characters long.
+    Arguments:
+    n_chars: int - The minimum length of the returned text
+    process: bool (optional, default = True) - Whether to filter out the
+    text that is not japanese first, see utils.process_japanese_text. The
+    filtered text has no newlines, so it is counted as fewer sentences.
+    """
+    with open('data/seiajin.txt', 'r', encoding='utf-8') as file:
+        text = file.read()
+    if process:
+        text = process_japanese_text(text)
+    return text * (n_chars // len(text) + 1)
@@ -1,18 +1,54 @@
-import subprocess
-import MeCab
-import epub_meta
-from utils import save_base64_image, convert_epub_to_txt, process_japanese_text, parse_sentence, remove_ruby_text_from_epub
-from frequency_lists import get_all_frequency_lists, get_frequency
+import os
+from epub_extractor import EpubReader
+from utils import process_japanese_text
+from resources import get_resources
+from storage import save_book, load_summary, load_tables, is_book_hash, save_profile, PROFILE_STATS_FILE
+import catalog
+from corpus import get_corpus
 from analysis import analyse_chars, analyse_words, WordAnalysis
-from plots import get_histogram
+from checkpoints import CheckpointStore
+from tokenizer import split_units
+from ngrams import collocations
+from readability import readability
+from plot_service import render_plots
+from metrics import Profile, registry
 
 from Book import Book
 
 from pathlib import Path
+from typing import Callable, Optional
 import hashlib
+import time
 import mmap
-import simplejson
-from constants import UPLOAD_FOLDER
+from constants import BOOKS_FOLDER, TOKENIZER_WORKERS, RENDER_PLOT_IMAGES, COUNT_LEMMAS, INDEX_SENTENCES, COUNT_NGRAMS
+
+# The stages of the analysis pipeline, with the overall
+# progress (in percent) at which each of them starts
+PIPELINE_STAGES = {
+    'extraction': 0,
+    'tokenizing': 20,
+    'counting': 80,
+    'plotting': 90,
+}
+
+Progress = Callable[[str, int], None]
+
+def report_progress(progress: Optional[Progress], stage: str, fraction: float = 0.0) -> None:
+    """
+    Reports the current pipeline stage and the overall progress in percent
+    to the given progress callback, if there is one.
+    Arguments:
+    progress: Progress - The callback, called with the stage and the percentage
+    stage: str - The current stage, one of PIPELINE_STAGES
+    fraction: float (optional, default = 0) - How much of the stage is done
+    """
+    if progress is None:
+        return
+    stages = list(PIPELINE_STAGES)
+    start = PIPELINE_STAGES[stage]
+    index = stages.index(stage)
+    end = PIPELINE_STAGES[stages[index + 1]] if index + 1 < len(stages) else 100
+    progress(stage, int(start + fraction * (end - start)))
 
 def sha256sum(filename: str) -> str:
     """
@@ -26,51 +62,81 @@ def sha256sum(filename: str) -> str:
             h.update(mm)
     return h.hexdigest()
 
-def process_file(filename: str) -> Book:
+def load_cached_analysis(file_hash: str, analysis_version: str) -> Optional[dict]:
+    """
+    Returns the stored summary of the analysis of the file with the given
+    hash, or None if the file has not been analysed yet or was analysed with
+    a different analysis version (see Resources.analysis_version).
+    Arguments:
+    file_hash: str - The sha256sum hash of the file
+    analysis_version: str - The analysis version the stored analysis must have
+    """
+    summary = load_summary(file_hash)
+    if summary is None or summary.get('analysis_version') != analysis_version:
+        return None
+    return summary
+
+def process_file(filename: str, file_hash: str = None, progress: Progress = None) -> Book:
     """
     Process the given ebook file and returns a Book
     object describing it. The Book object contains various
     fields like the author, title, cover image, etc. as well
-    as the path to a generated .txt file (regardless of input extension)
-    that has been processed to allow for easy analysis
+    as the text of the book (regardless of input extension)
     Arguments:
     filename: str - The path to the file
+    file_hash: str (optional) - The sha256sum hash of the file, computed
+    if not given
+    progress: Progress (optional) - Callback for reporting progress
     """
     allowed_extensions = ['epub', 'txt']
     extension = filename.split('.')[-1]
 
-    file_hash = sha256sum(filename)
-    book_dir = f'static/books/{file_hash}'
-    subprocess.run(f'mkdir -p {book_dir}', shell=True)
+    if not file_hash:
+        file_hash = sha256sum(filename)
+    book_dir = f'{BOOKS_FOLDER}/{file_hash}'
+    os.makedirs(book_dir, exist_ok=True)
 
     if extension == 'epub':
-        return process_epub(filename, book_dir=book_dir, file_hash=file_hash)
+        return process_epub(filename, book_dir=book_dir, file_hash=file_hash, progress=progress)
     elif extension == 'txt':
         return process_txt(filename, book_dir=book_dir, file_hash=file_hash)
     else:
         raise ValueError(f'Filename extension must be one of {",".join(allowed_extensions)}')
 
-def process_epub(filename: str, book_dir: str, file_hash: str) -> Book:
+def process_epub(filename: str, book_dir: str, file_hash: str, progress: Progress = None) -> Book:
     """
-    Takes an epub file and returns a Book object.
+    Takes an epub file and returns a Book object. The text of each chapter
+    is read straight from the epub, with ruby text (furigana) removed and
+    any non-japanese text filtered out.
     Arguments:
     filename: str - The path to the epub file
     book_dir: str - The directory the book is in
     file_hash: str - The sha256sum hash of the file
+    progress: Progress (optional) - Callback for reporting progress
     """
-    book_path = remove_ruby_text_from_epub(filename,
-                                            new_filename=f"{book_dir}/no-furigana.epub")
-    book_metadata = epub_meta.get_epub_metadata(book_path)
-    title = book_metadata['title']
-    authors = book_metadata['authors']
-    image = book_metadata['cover_image_content']
+    report_progress(progress, 'extraction')
+    with EpubReader(filename) as epub:
+        metadata = epub.metadata()
+        title = metadata.title or filename.split('/')[-1].replace('.epub', '')
+
+        image_path = ''
+        image = epub.cover_image()
+        if image:
+            image_path = f'{book_dir}/cover-image.jpg'
+            with open(image_path, 'wb') as file:
+                file.write(image)
 
-    image_path = save_base64_image(image, f'{book_dir}/cover-image.jpg')
-    txt_file = convert_epub_to_txt(book_path, process_text=True)
+        spine = epub.spine()
+        chapters = []
+        for i, item in enumerate(spine):
+            chapter = process_japanese_text(epub.chapter_text(item))
+            if chapter:
+                chapters.append(chapter)
+            report_progress(progress, 'extraction', (i + 1) / len(spine))
 
-    book = Book(path=txt_file,
+    book = Book(chapters=chapters,
             title=title,
-            authors=authors,
+            authors=metadata.authors,
             image=image_path,
             file_hash=file_hash,
             book_dir=book_dir
@@ -87,7 +153,9 @@ def process_txt(filename: str, book_dir: str, file_hash: str) -> Book:
     """
     extension = '.' + filename.split('.')[-1]
     title = filename.split('/')[-1].replace(extension, '')
-    book = Book(path=filename,
+    with open(filename, 'r', encoding='utf-8') as file:
+        text = file.read()
+    book = Book(chapters=[text],
             title=title,
             authors=[],
             image='',
@@ -96,60 +164,186 @@ def process_txt(filename: str, book_dir: str, file_hash: str) -> Book:
             )
     return book
 
-def analyse_ebook(filename: str) -> object:
+def analyse_ebook(filename: str,
+                  workers: int = TOKENIZER_WORKERS,
+                  file_hash: str = None,
+                  progress: Progress = None,
+                  render_images: bool = RENDER_PLOT_IMAGES,
+                  previous: Optional[str] = None,
+                  capture_profile: bool = False
+                  ) -> object:
     """
     Analayse a ebook containing japanese text, determining various things
     like the length of the book in words/characters, the number of unique
     words and characters used, and the number of words and characters that
     are used once only. Returns and object containing this information.
+    If the file has already been analysed with the current analysis version,
+    the stored analysis is returned without running the pipeline again.
     Arguments:
     filename: str - The path to the file to analyse
+    workers: int (optional) - The number of processes to tokenize the
+    text with. Defaults to the TOKENIZER_WORKERS environment variable, or 1
+    file_hash: str (optional) - The sha256sum hash of the file, computed
+    if not given
+    progress: Progress (optional) - Called with the current stage (see
+    PIPELINE_STAGES) and the overall progress in percent
+    render_images: bool (optional) - Whether to render plot images in the
+    background. Defaults to the RENDER_PLOT_IMAGES environment variable
+    previous: str (optional) - The hash of an earlier version of the same
+    book, e.g. a serial before new chapters were added. Chapters that are
+    unchanged since then are not tokenized again.
+    capture_profile: bool (optional, default = False) - Whether to also
+    profile the analysis with cProfile and tracemalloc, see metrics.Profile
+    The counts of every chapter (or chunk of a long chapter) are
+    checkpointed in the book's directory as soon as they are done, so if
+    the analysis is interrupted, analysing the file again resumes it.
+    The time and peak memory of every stage of the analysis are saved
+    with the book (see storage.load_profile) and added to metrics.registry.
     """
 
-    mt = MeCab.Tagger('-r /dev/null -d /usr/lib/mecab/dic/mecab-ipadic-neologd/')
-    book = process_file(filename)
+    if previous is not None and not is_book_hash(previous):
+        raise ValueError(f'{previous} is not a book hash')
+    resources = get_resources()
+    analysis_version = resources.analysis_version()
+    profile = Profile(capture=capture_profile)
+    try:
+        if not file_hash:
+            with profile.stage('hashing'):
+                file_hash = sha256sum(filename)
 
-    with open(book.path, 'r', encoding='utf-8') as file:
-        text = file.read()
+        cached = load_cached_analysis(file_hash, analysis_version)
+        if cached is not None:
+            print(f'using stored analysis for {file_hash}')
+            catalog.add_book(cached)
+            if file_hash not in get_corpus():
+                get_corpus().add_book(file_hash, load_tables(file_hash, cached)['words'])
+            registry.count_analysis('cached')
+            return cached
+
+        book_data = run_pipeline(filename, file_hash,
+                analysis_version=analysis_version,
+                workers=workers,
+                progress=progress,
+                render_images=render_images,
+                previous=previous,
+                profile=profile
+                )
+    except Exception:
+        registry.count_analysis('failed')
+        raise
+    finally:
+        profile.stop()
 
-    frequency_lists = get_all_frequency_lists()
-    chars = analyse_chars(text)
-    words = analyse_words(text, mt, frequency_lists)
+    save_profile(file_hash, profile.to_dict())
+    if profile.captured:
+        profile.dump_stats(f'{BOOKS_FOLDER}/{file_hash}/{PROFILE_STATS_FILE}')
+    registry.count_analysis('done')
+    return book_data
+
+def run_pipeline(filename: str,
+                 file_hash: str,
+                 analysis_version: str,
+                 workers: int,
+                 progress: Optional[Progress],
+                 render_images: bool,
+                 previous: Optional[str],
+                 profile: Profile
+                 ) -> dict:
+    """
+    Runs every stage of the analysis of the given ebook and saves the
+    result, see analyse_ebook. Returns the analysis.
+    Arguments:
+    filename: str - The path to the file to analyse
+    file_hash: str - The sha256sum hash of the file
+    analysis_version: str - The current analysis version
+    workers: int - The number of processes to tokenize the text with
+    progress: Progress - Callback for reporting progress, or None
+    render_images: bool - Whether to render plot images in the background
+    previous: str - The hash of an earlier version of the book, or None
+    profile: Profile - Records the time and memory of each stage
+    """
+    resources = get_resources()
+    with profile.stage('extraction'):
+        book = process_file(filename, file_hash=file_hash, progress=progress)
+        text = ''.join(book.chapters)
+        chapter_units = [split_units([chapter]) for chapter in book.chapters]
+        units = [unit for chunks in chapter_units for unit in chunks]
+    checkpoints = CheckpointStore(book.book_dir,
+            resources.tokenizer_version(),
+            fallbacks=[f'{BOOKS_FOLDER}/{previous}'] if previous else []
+            )
 
-    histogram_path = get_histogram(
-            words,
-            title=f'Frequency distribution for {book.title}',
-            save_path=f'{book.book_dir}/histogram.png'
+    with profile.stage('chars'):
+        chars = analyse_chars(text)
+    words = analyse_words(units,
+            resources.tagger,
+            resources.frequency_index,
+            workers=workers,
+            progress=lambda stage, fraction: report_progress(progress, stage, fraction),
+            lemmas=COUNT_LEMMAS,
+            checkpoints=checkpoints,
+            profile=profile,
+            index=INDEX_SENTENCES,
+            ngrams=COUNT_NGRAMS,
+            levels=resources.jlpt_levels
             )
+    checkpoints.prune(units)
+
+    report_progress(progress, 'plotting')
 
-    plots = [histogram_path]
+    with profile.stage('plotting'):
+        plots = render_plots(book.file_hash,
+                words.vocabulary,
+                book_title=book.title,
+                analysis_version=analysis_version,
+                images=render_images
+                )
 
     book_data = {
     'title': book.title,
     'authors': book.authors,
     'image': book.image,
     'plots': plots,
-    'n_words': len(words.all),
-    'n_words_unique': len(words.unique),
-    'n_words_used_once': len(words.used_once),
-    'n_known_words_unique': words.known_unique,
-    'n_known_words_total': words.known_total,
-    'n_chars': len(chars.all),
-    'n_chars_unique': len(chars.unique),
-    'n_chars_used_once': len(chars.used_once),
-    'words': words.with_uses,
-    'chars': chars.with_uses,
-    'file_hash': book.file_hash
+    'n_words': words.total,
+    'n_words_unique': words.n_unique,
+    'n_words_used_once': words.n_used_once,
+    'n_chars': chars.total,
+    'n_chars_unique': chars.n_unique,
+    'n_chars_used_once': chars.n_used_once,
+    'words': words.vocabulary,
+    'chars': chars.vocabulary,
+    'file_hash': book.file_hash,
+    'analysis_version': analysis_version,
+    'analysed_at': time.time()
 }
+    if words.lemmas is not None:
+        book_data['n_lemmas_unique'] = len(words.lemmas)
+        book_data['n_lemmas_used_once'] = int(words.lemmas.used_once.sum())
+        book_data['lemmas'] = words.lemmas
+    if words.sentences is not None:
+        book_data['n_sentences'] = len(words.sentences)
+    with profile.stage('readability'):
+        book_data['readability'] = readability(words.unit_stats,
+                [len(chunks) for chunks in chapter_units],
+                words.vocabulary,
+                resources.jlpt_levels,
+                lemmas=words.lemmas,
+                estimated=resources.jlpt_levels_estimated)
+    if words.ngrams is not None:
+        with profile.stage('collocations'):
+            book_data['collocations'] = collocations(words.ngrams,
+                    {'words': words.vocabulary, 'kanji': chars.vocabulary})
 
-    json_filename = f'{book.book_dir}/book_data.json'
-    with open(json_filename, 'w', encoding='utf-8') as file:
-            simplejson.dump(book_data, file)
-            #json.dump(book_data, file)
-    print(f'wrote data to {json_filename}')
+    with profile.stage('saving'):
+        if words.sentences is not None:
+            words.sentences.save(book.book_dir)
+        summary_path = save_book(book_data)
+    print(f'wrote data to {summary_path}')
+    with profile.stage('indexing'):
+        catalog.add_book(load_summary(book.file_hash))
+        get_corpus().add_book(book.file_hash, words.vocabulary)
 
-    clean_dir(book.book_dir, keep_extensions=['.json', '.jpg', '.png', '.html'])
-    clean_dir(UPLOAD_FOLDER)
+    clean_dir(book.book_dir, keep_extensions=['.json', '.npy', '.bin', '.jpg', '.png', '.html', '.pstats'])
 
 
     return book_data
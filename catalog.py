@@ -0,0 +1,155 @@
+import json
+import sqlite3
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from constants import CATALOG_FILE, BOOKS_FOLDER
+from storage import load_summary
+from utils import get_all_subdirs
+
+# Summary fields stored in the catalog, besides the hash, title and authors
+STAT_COLUMNS = [
+    'n_words',
+    'n_words_unique',
+    'n_words_used_once',
+    'n_chars',
+    'n_chars_unique',
+    'n_chars_used_once',
+]
+
+# Columns books can be sorted by
+SORT_COLUMNS = {'title', 'analysed_at', *STAT_COLUMNS}
+
+SCHEMA = f'''
+CREATE TABLE IF NOT EXISTS books (
+    file_hash TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    authors TEXT NOT NULL,
+    image TEXT NOT NULL,
+    {', '.join(f'{column} INTEGER' for column in STAT_COLUMNS)},
+    analysed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS books_title ON books (title);
+CREATE INDEX IF NOT EXISTS books_analysed_at ON books (analysed_at);
+CREATE INDEX IF NOT EXISTS books_n_words ON books (n_words);
+'''
+
+_local = threading.local()
+
+def connect(path: str = CATALOG_FILE) -> sqlite3.Connection:
+    """
+    Returns this thread's connection to the catalog database,
+    creating the database and its tables if needed.
+    Arguments:
+    path: str (optional) - The path to the database file
+    """
+    connections = getattr(_local, 'connections', None)
+    if connections is None:
+        connections = _local.connections = {}
+    if path not in connections:
+        connection = sqlite3.connect(path, timeout=30)
+        connection.row_factory = sqlite3.Row
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.executescript(SCHEMA)
+        connections[path] = connection
+    return connections[path]
+
+def add_book(summary: dict, path: str = CATALOG_FILE) -> None:
+    """
+    Adds the book with the given summary to the catalog,
+    replacing any previous entry for the same hash.
+    Arguments:
+    summary: dict - The summary of the book, see storage.load_summary
+    path: str (optional) - The path to the database file
+    """
+    columns = ['file_hash', 'title', 'authors', 'image', *STAT_COLUMNS, 'analysed_at']
+    values = [
+        summary['file_hash'],
+        summary.get('title') or '',
+        json.dumps(summary.get('authors') or [], ensure_ascii=False),
+        summary.get('image') or '',
+        *(summary.get(column) for column in STAT_COLUMNS),
+        summary.get('analysed_at') or time.time(),
+    ]
+    connection = connect(path)
+    with connection:
+        connection.execute(
+            f'INSERT OR REPLACE INTO books ({", ".join(columns)}) '
+            f'VALUES ({", ".join("?" * len(columns))})',
+            values)
+
+def _row_to_book(row: sqlite3.Row) -> dict:
+    book = dict(row)
+    book['authors'] = json.loads(book['authors'])
+    return book
+
+def list_books(page: int = 1,
+               per_page: int = 20,
+               sort: str = 'analysed_at',
+               order: str = 'desc',
+               query: Optional[str] = None,
+               min_words: Optional[int] = None,
+               max_words: Optional[int] = None,
+               path: str = CATALOG_FILE
+               ) -> Tuple[List[dict], int]:
+    """
+    Returns one page of books from the catalog together with the total
+    number of books matching the filters.
+    Arguments:
+    page: int (optional, default = 1) - The page to return, starting at 1
+    per_page: int (optional, default = 20) - The number of books per page
+    sort: str (optional, default = 'analysed_at') - The column to sort by,
+    one of SORT_COLUMNS
+    order: str (optional, default = 'desc') - 'asc' or 'desc'
+    query: str (optional) - Only return books with this in their title or authors
+    min_words: int (optional) - Only return books with at least this many words
+    max_words: int (optional) - Only return books with at most this many words
+    path: str (optional) - The path to the database file
+    """
+    if sort not in SORT_COLUMNS:
+        raise ValueError(f'Cannot sort by {sort}, must be one of {", ".join(sorted(SORT_COLUMNS))}')
+    if order not in ('asc', 'desc'):
+        raise ValueError(f"Order must be 'asc' or 'desc', not {order}")
+
+    conditions = []
+    parameters = []
+    if query:
+        conditions.append("(title LIKE ? ESCAPE '\\' OR authors LIKE ? ESCAPE '\\')")
+        pattern = '%' + query.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        parameters += [pattern, pattern]
+    if min_words is not None:
+        conditions.append('n_words >= ?')
+        parameters.append(min_words)
+    if max_words is not None:
+        conditions.append('n_words <= ?')
+        parameters.append(max_words)
+    where = f'WHERE {" AND ".join(conditions)}' if conditions else ''
+
+    connection = connect(path)
+    total = connection.execute(f'SELECT COUNT(*) FROM books {where}', parameters).fetchone()[0]
+    rows = connection.execute(
+        f'SELECT * FROM books {where} ORDER BY {sort} {order}, file_hash LIMIT ? OFFSET ?',
+        [*parameters, per_page, (max(page, 1) - 1) * per_page]
+    ).fetchall()
+    return [_row_to_book(row) for row in rows], total
+
+def sync_catalog(path: str = CATALOG_FILE) -> int:
+    """
+    Adds every analysed book that is not in the catalog yet, e.g. books
+    analysed before the catalog existed. Only the summaries of the
+    missing books are read. Returns the number of books added.
+    Arguments:
+    path: str (optional) - The path to the database file
+    """
+    known = {row[0] for row in connect(path).execute('SELECT file_hash FROM books')}
+    added = 0
+    for book_dir in get_all_subdirs(BOOKS_FOLDER):
+        if book_dir.name in known:
+            continue
+        summary = load_summary(book_dir.name)
+        if summary is not None:
+            summary.setdefault('analysed_at', book_dir.stat().st_mtime)
+            add_book(summary, path)
+            added += 1
+    return added
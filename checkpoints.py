@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import threading
+from collections import Counter
+from pathlib import Path
+from typing import Optional, Sequence
+
+from ngrams import HeavyHitters
+from tokenizer import TokenCounts
+
+# Checkpoints are stored in this subdirectory of the book's directory,
+# one json file per counted unit of text, named after the tokenizer
+# version and the sha256 hash of the unit
+CHECKPOINT_DIR = 'checkpoints'
+
+class CheckpointStore:
+    """
+    The word counts of every unit (chapter or chunk, see
+    tokenizer.split_units) of a book that has been counted so far, keyed by
+    the hash of the unit's text. Checkpoints made by a different version of
+    the tokenizer are ignored. Checkpoints are also looked up in the stores
+    of the given earlier books, e.g. the previous edition of a serial, so
+    that only the chapters that are new have to be tokenized; checkpoints
+    found there are copied into this store.
+    """
+    def __init__(self, directory: Path, version: str, fallbacks: Sequence[Path] = ()):
+        self.directory = Path(directory) / CHECKPOINT_DIR
+        self.version = version
+        self.fallbacks = [Path(fallback) / CHECKPOINT_DIR for fallback in fallbacks]
+
+    def _name(self, unit: str) -> str:
+        return f'{self.version}-{hashlib.sha256(unit.encode("utf-8")).hexdigest()}.json'
+
+    def _find(self, unit: str) -> Optional[Path]:
+        name = self._name(unit)
+        for directory in [self.directory, *self.fallbacks]:
+            path = directory / name
+            if path.exists():
+                return path
+        return None
+
+    def __contains__(self, unit: str) -> bool:
+        return self._find(unit) is not None
+
+    def load(self, unit: str) -> Optional[TokenCounts]:
+        """
+        Returns the counts of the given unit, or None if it has
+        no (readable) checkpoint
+        Arguments:
+        unit: str - The text of the unit
+        """
+        path = self._find(unit)
+        if path is None:
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            counts = TokenCounts(
+                Counter(dict(data['words'])),
+                Counter({(base_form, pos): n for base_form, pos, n in data['lemmas']})
+                if data['lemmas'] is not None else None,
+                dict(data['sentences']) if data.get('sentences') is not None else None,
+                {name: HeavyHitters.from_json(summary) for name, summary in data['ngrams'].items()}
+                if data.get('ngrams') is not None else None,
+                data.get('n_sentences'))
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if path.parent != self.directory:
+            self.save(unit, counts)
+        return counts
+
+    def save(self, unit: str, counts: TokenCounts) -> None:
+        """
+        Checkpoints the counts of the given unit, replacing the file atomically
+        Arguments:
+        unit: str - The text of the unit
+        counts: TokenCounts - The counts of the unit
+        """
+        self.directory.mkdir(parents=True, exist_ok=True)
+        data = {
+            # lists rather than objects, to keep the order words were first seen in
+            'words': list(counts.words.items()),
+            'lemmas': [[base_form, pos, n] for (base_form, pos), n in counts.lemmas.items()]
+            if counts.lemmas is not None else None,
+            'sentences': list(counts.sentences.items()) if counts.sentences is not None else None,
+            'ngrams': {name: summary.to_json() for name, summary in counts.ngrams.items()}
+            if counts.ngrams is not None else None,
+            'n_sentences': counts.n_sentences,
+        }
+        path = self.directory / self._name(unit)
+        tmp_path = path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def prune(self, units: Sequence[str]) -> int:
+        """
+        Deletes the checkpoints that do not belong to any of the given units
+        (e.g. from an older tokenizer version). Returns the number deleted.
+        Arguments:
+        units: Sequence[str] - The units of the book
+        """
+        keep = {self._name(unit) for unit in units}
+        deleted = 0
+        for path in self.directory.glob('*.json'):
+            if path.name not in keep:
+                path.unlink()
+                deleted += 1
+        return deleted
@@ -1,2 +1,55 @@
+import os
+
 UPLOAD_FOLDER = 'uploads'
+BOOKS_FOLDER = 'static/books'
+CATALOG_FILE = 'catalog.sqlite3'
+CORPUS_FOLDER = 'corpus'
 ALLOWED_EXTENSIONS = {'txt', 'epub'}
+# Largest upload accepted, in bytes. Set MAX_UPLOAD_SIZE to override it
+MAX_UPLOAD_SIZE = int(os.environ.get('MAX_UPLOAD_SIZE', 256 * 1024 * 1024))
+MECAB_ARGS = '-r /dev/null -d /usr/lib/mecab/dic/mecab-ipadic-neologd/'
+# Index of the base form in MeCab's comma separated features: 6 for ipadic
+# (and neologd). Set MECAB_BASE_FORM_FIELD when using another dictionary,
+# e.g. 7 for unidic
+MECAB_BASE_FORM_FIELD = int(os.environ.get('MECAB_BASE_FORM_FIELD', 6))
+FREQUENCY_LIST_DIR = 'frequency-lists'
+# All the frequency lists merged into one precompiled table, rebuilt
+# whenever a list changes
+FREQUENCY_INDEX_FILE = 'frequency-index.npz'
+KNOWN_WORDS_FILE = 'word-list.txt'
+# Word list the JLPT level distribution of a book is computed from, ordered
+# from the easiest (N5) words to the hardest (N1), see readability.py
+JLPT_WORD_LIST_FILE = 'data/jlpt-word-list.txt'
+# Directory of the known-word lists uploaded by each user
+KNOWN_WORDS_FOLDER = 'known-words'
+# Number of processes used to tokenize a book. Set TOKENIZER_WORKERS
+# in the environment to override it
+TOKENIZER_WORKERS = int(os.environ.get('TOKENIZER_WORKERS', 1))
+# Bump this whenever a change to the pipeline changes the analysis results,
+# so that analyses stored by older versions are recomputed
+PIPELINE_VERSION = 5
+# Set COUNT_LEMMAS=0 to skip counting words by base form (the lemmas table)
+COUNT_LEMMAS = os.environ.get('COUNT_LEMMAS', '1') != '0'
+# Set INDEX_SENTENCES=0 to skip building the sentence index of each book
+# (see sentence_index.py), which is used for looking words up in context
+INDEX_SENTENCES = os.environ.get('INDEX_SENTENCES', '1') != '0'
+# Set COUNT_NGRAMS=0 to skip counting word and kanji n-grams (the
+# collocations of each book, see ngrams.py)
+COUNT_NGRAMS = os.environ.get('COUNT_NGRAMS', '1') != '0'
+# Most number of n-grams of each kind counted per unit of text and per book.
+# Rarer n-grams are dropped, with their counts bounded by the summary's error
+NGRAM_CAPACITY = int(os.environ.get('NGRAM_CAPACITY', 20000))
+# Number of books analysed at the same time by the app's job queue
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))
+# Seconds a finished job is kept around for status polling
+JOB_RETENTION = 60 * 60
+# Default and largest number of rows per page of the word and character table endpoints
+TABLE_PAGE_SIZE = 100
+MAX_TABLE_PAGE_SIZE = 1000
+# Number of processes rendering plot images in the background
+PLOT_WORKERS = int(os.environ.get('PLOT_WORKERS', 1))
+# Set ALLOW_PROFILING=1 to let uploads ask for a cProfile/tracemalloc
+# capture of their analysis (profile=1), which slows the analysis down a lot
+ALLOW_PROFILING = os.environ.get('ALLOW_PROFILING', '0') != '0'
+# Set RENDER_PLOT_IMAGES=0 to only store plot data for client-side rendering
+RENDER_PLOT_IMAGES = os.environ.get('RENDER_PLOT_IMAGES', '1') != '0'
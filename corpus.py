@@ -0,0 +1,388 @@
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+import numpy as np
+
+from constants import BOOKS_FOLDER, CORPUS_FOLDER
+from storage import load_summary, load_tables
+from utils import get_all_subdirs
+from vocabulary import Vocabulary
+
+# The corpus is a sparse (books x words) matrix of occurence counts, stored
+# append-only so that adding a book only writes that book's data:
+#   vocabulary.txt  one word per line, the line number is the word id
+#   indices.bin     int32 word ids, book after book
+#   counts.bin      int32 occurences, one per entry in indices.bin
+#   books.jsonl     one line per added book: its hash and the range
+#                   [start, end) of its entries in indices.bin/counts.bin
+# Adding a book again appends a new range and the latest line wins.
+VOCABULARY_FILE = 'vocabulary.txt'
+INDICES_FILE = 'indices.bin'
+COUNTS_FILE = 'counts.bin'
+BOOKS_FILE = 'books.jsonl'
+LOCK_FILE = '.lock'
+
+DTYPE = np.int32
+# Selections of up to this many books are summed book by book,
+# larger ones in one pass over the whole corpus
+SMALL_SELECTION = 32
+
+class Corpus:
+    """
+    Word-by-book occurence counts for every analysed book, for answering
+    questions across the whole library (shared vocabulary, known-word
+    coverage, which words to learn next) without opening the books.
+    Changes made by other processes are picked up automatically.
+    """
+    def __init__(self, directory: str = CORPUS_FOLDER):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.words: List[str] = []
+        self.word_ids: Dict[str, int] = {}
+        self.books: Dict[str, tuple] = {}
+        self.indices = np.zeros(0, dtype=DTYPE)
+        self.counts = np.zeros(0, dtype=DTYPE)
+        self._vocabulary_offset = 0
+        self._books_offset = 0
+        self._end = 0
+        self._totals: Optional[tuple] = None
+        self._running_totals: Optional[np.ndarray] = None
+        self._lock = threading.RLock()
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.directory / LOCK_FILE, 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _read_vocabulary(self) -> None:
+        path = self.directory / VOCABULARY_FILE
+        if not path.exists():
+            return
+        with open(path, 'rb') as file:
+            file.seek(self._vocabulary_offset)
+            for line in file:
+                if not line.endswith(b'\n'):
+                    # a word still being written by another process
+                    break
+                word = line[:-1].decode('utf-8')
+                self.word_ids[word] = len(self.words)
+                self.words.append(word)
+                self._vocabulary_offset += len(line)
+
+    def _load_array(self, name: str, length: int) -> np.ndarray:
+        path = self.directory / name
+        if not length:
+            return np.zeros(0, dtype=DTYPE)
+        return np.memmap(path, dtype=DTYPE, mode='r', shape=(length,))
+
+    def refresh(self) -> None:
+        """
+        Loads any books added since the corpus was last loaded,
+        by this or any other process
+        """
+        with self._lock:
+            path = self.directory / BOOKS_FILE
+            size = path.stat().st_size if path.exists() else 0
+            if size == self._books_offset:
+                return
+
+            self._read_vocabulary()
+            with open(path, 'rb') as file:
+                file.seek(self._books_offset)
+                for line in file:
+                    if not line.endswith(b'\n'):
+                        break
+                    self._books_offset += len(line)
+                    entry = json.loads(line)
+                    self.books[entry['file_hash']] = (entry['start'], entry['end'])
+                    self._end = max(self._end, entry['end'])
+
+            self.indices = self._load_array(INDICES_FILE, self._end)
+            self.counts = self._load_array(COUNTS_FILE, self._end)
+            self._totals = None
+            self._running_totals = None
+
+    def __contains__(self, file_hash: str) -> bool:
+        self.refresh()
+        return file_hash in self.books
+
+    def __len__(self) -> int:
+        self.refresh()
+        return len(self.books)
+
+    def add_book(self, file_hash: str, vocabulary: Vocabulary) -> None:
+        """
+        Adds (or replaces) the word counts of the book with the given hash.
+        Safe to call from several processes at once.
+        Arguments:
+        file_hash: str - The sha256sum hash of the book
+        vocabulary: Vocabulary - The words used in the book
+        """
+        with self._lock, self._file_lock():
+            # other processes may have added words since we last looked
+            self._read_vocabulary()
+            new_words = []
+            ids = np.empty(len(vocabulary), dtype=DTYPE)
+            for i, word in enumerate(vocabulary.items):
+                word_id = self.word_ids.get(word)
+                if word_id is None:
+                    word_id = len(self.words)
+                    self.word_ids[word] = word_id
+                    self.words.append(word)
+                    new_words.append(word)
+                ids[i] = word_id
+
+            if new_words:
+                data = ''.join(f'{word}\n' for word in new_words).encode('utf-8')
+                with open(self.directory / VOCABULARY_FILE, 'ab') as file:
+                    file.write(data)
+                self._vocabulary_offset += len(data)
+
+            indices_path = self.directory / INDICES_FILE
+            start = indices_path.stat().st_size // DTYPE().itemsize if indices_path.exists() else 0
+            order = np.argsort(ids)
+            for name, array in ((INDICES_FILE, ids[order]),
+                                (COUNTS_FILE, np.asarray(vocabulary.counts, dtype=DTYPE)[order])):
+                with open(self.directory / name, 'ab') as file:
+                    # both files always have the same length, but truncate
+                    # whatever a crashed writer may have left behind
+                    file.truncate(start * DTYPE().itemsize)
+                    file.write(array.tobytes())
+                    file.flush()
+                    os.fsync(file.fileno())
+
+            entry = {'file_hash': file_hash, 'start': start, 'end': start + len(ids)}
+            with open(self.directory / BOOKS_FILE, 'a', encoding='utf-8') as file:
+                file.write(json.dumps(entry) + '\n')
+
+        self.refresh()
+
+    def _select(self, file_hashes: Optional[Iterable[str]]) -> List[str]:
+        self.refresh()
+        if file_hashes is None:
+            return list(self.books)
+        file_hashes = list(file_hashes)
+        missing = [file_hash for file_hash in file_hashes if file_hash not in self.books]
+        if missing:
+            raise KeyError(f'Books not in the corpus: {", ".join(missing)}')
+        return file_hashes
+
+    def _ranges(self, file_hashes: List[str]) -> tuple:
+        ranges = np.array([self.books[file_hash] for file_hash in file_hashes],
+                          dtype=np.int64).reshape(-1, 2)
+        return ranges[:, 0], ranges[:, 1]
+
+    def _entries(self, file_hashes: List[str]) -> tuple:
+        if len(file_hashes) == len(self.books) and \
+                sum(end - start for start, end in self.books.values()) == self._end:
+            # every book, and no replaced books left in the arrays
+            return self.indices, self.counts
+        if not file_hashes:
+            return np.zeros(0, dtype=DTYPE), np.zeros(0, dtype=DTYPE)
+        ranges = [self.books[file_hash] for file_hash in file_hashes]
+        indices = np.concatenate([self.indices[start:end] for start, end in ranges])
+        counts = np.concatenate([self.counts[start:end] for start, end in ranges])
+        return indices, counts
+
+    def totals(self, file_hashes: Optional[Iterable[str]] = None) -> tuple:
+        """
+        Returns two arrays indexed by word id: the total number of
+        occurences of each word in the given books, and the number of
+        those books each word appears in.
+        Arguments:
+        file_hashes: Iterable[str] (optional) - The books, all books if not given
+        """
+        with self._lock:
+            everything = file_hashes is None
+            file_hashes = self._select(file_hashes)
+            if everything and self._totals is not None:
+                return self._totals
+            indices, counts = self._entries(file_hashes)
+            n_words = len(self.words)
+            totals = (np.bincount(indices, weights=counts, minlength=n_words).astype(np.int64),
+                      np.bincount(indices, minlength=n_words))
+            if everything:
+                self._totals = totals
+            return totals
+
+    def known_mask(self, known_words: Set[str]) -> np.ndarray:
+        """
+        Returns a boolean mask over the corpus vocabulary of the known words
+        Arguments:
+        known_words: Set[str] - The set of known words
+        """
+        with self._lock:
+            self.refresh()
+            mask = np.zeros(len(self.words), dtype=bool)
+            ids = [self.word_ids[word] for word in known_words if word in self.word_ids]
+            mask[ids] = True
+            return mask
+
+    def coverage(self, known: np.ndarray, file_hashes: Optional[Iterable[str]] = None) -> List[dict]:
+        """
+        Computes how much of each of the given books is made up of known
+        words, both as unique words and as total (non-unique) words.
+        Returns one entry per book, best covered first.
+        Arguments:
+        known: np.ndarray - Boolean mask of the known words, see known_mask
+        file_hashes: Iterable[str] (optional) - The books, all books if not given
+        """
+        with self._lock:
+            file_hashes = self._select(file_hashes)
+            # words added after the mask was built are not known
+            known = np.pad(known, (0, max(len(self.words) - len(known), 0)))
+            starts, ends = self._ranges(file_hashes)
+            if len(file_hashes) <= SMALL_SELECTION:
+                totals, known_totals, known_unique = np.zeros((3, len(file_hashes)), dtype=np.int64)
+                for i, (start, end) in enumerate(zip(starts, ends)):
+                    counts = self.counts[start:end]
+                    is_known = known[self.indices[start:end]]
+                    totals[i] = counts.sum()
+                    known_totals[i] = counts[is_known].sum()
+                    known_unique[i] = is_known.sum()
+            else:
+                # per-book sums as differences of running totals
+                is_known = known[self.indices]
+                if self._running_totals is None:
+                    self._running_totals = np.concatenate(([0], np.cumsum(self.counts, dtype=np.int64)))
+                tokens = self._running_totals
+                known_tokens = np.concatenate(([0], np.cumsum(self.counts * is_known, dtype=np.int64)))
+                known_types = np.concatenate(([0], np.cumsum(is_known, dtype=np.int64)))
+                totals = tokens[ends] - tokens[starts]
+                known_totals = known_tokens[ends] - known_tokens[starts]
+                known_unique = known_types[ends] - known_types[starts]
+            results = [{
+                'file_hash': file_hash,
+                'n_words': int(totals[i]),
+                'n_words_unique': int(ends[i] - starts[i]),
+                'n_known_words_total': int(known_totals[i]),
+                'n_known_words_unique': int(known_unique[i]),
+                'coverage': int(known_totals[i]) / int(totals[i]) if totals[i] else 0.0,
+            } for i, file_hash in enumerate(file_hashes)]
+            results.sort(key=lambda result: result['coverage'], reverse=True)
+            return results
+
+    def overlap(self,
+                file_hashes: Iterable[str],
+                min_books: Optional[int] = None,
+                limit: int = 100
+                ) -> dict:
+        """
+        Finds the words shared by the given books. Returns the number of
+        shared words and the (at most limit) most common of them.
+        Arguments:
+        file_hashes: Iterable[str] - The books to compare
+        min_books: int (optional) - Count words that appear in at least this
+        many of the books as shared. Defaults to all of them
+        limit: int (optional, default = 100) - The number of words to return
+        """
+        with self._lock:
+            file_hashes = self._select(file_hashes)
+            totals, n_books = self.totals(file_hashes)
+            if min_books is None:
+                min_books = len(file_hashes)
+            shared = np.flatnonzero(n_books >= max(min_books, 1))
+            top = shared[np.argsort(-totals[shared], kind='stable')[:limit]]
+            return {
+                'n_books': len(file_hashes),
+                'min_books': min_books,
+                'n_shared': len(shared),
+                'words': [self._word_entry(i, totals, n_books) for i in top],
+            }
+
+    def next_words(self,
+                   known: np.ndarray,
+                   file_hashes: Optional[Iterable[str]] = None,
+                   limit: int = 100
+                   ) -> List[dict]:
+        """
+        Returns the unknown words that would add the most to the known-word
+        coverage of the given books, i.e. the unknown words with the most
+        occurences across them, most useful first.
+        Arguments:
+        known: np.ndarray - Boolean mask of the known words, see known_mask
+        file_hashes: Iterable[str] (optional) - The books, all books if not given
+        limit: int (optional, default = 100) - The number of words to return
+        """
+        with self._lock:
+            totals, n_books = self.totals(file_hashes)
+            known = np.pad(known, (0, max(len(totals) - len(known), 0)))[:len(totals)]
+            candidates = np.flatnonzero(~known & (totals > 0))
+            top = candidates[np.argsort(-totals[candidates], kind='stable')[:limit]]
+            all_tokens = int(totals.sum())
+            return [dict(self._word_entry(i, totals, n_books),
+                         coverage_gain=int(totals[i]) / all_tokens)
+                    for i in top]
+
+    def books_with(self, word: str, file_hashes: Optional[Iterable[str]] = None) -> List[tuple]:
+        """
+        Returns the books the given word occurs in, as (file hash,
+        occurences) pairs with the books that use the word the most first.
+        Arguments:
+        word: str - The word to look for
+        file_hashes: Iterable[str] (optional) - The books to look in, all books if not given
+        """
+        with self._lock:
+            file_hashes = self._select(file_hashes)
+            word_id = self.word_ids.get(word)
+            if word_id is None:
+                return []
+            books = []
+            for file_hash in file_hashes:
+                start, end = self.books[file_hash]
+                # the entries of each book are sorted by word id
+                i = start + int(np.searchsorted(self.indices[start:end], word_id))
+                if i < end and self.indices[i] == word_id:
+                    books.append((file_hash, int(self.counts[i])))
+            books.sort(key=lambda book: book[1], reverse=True)
+            return books
+
+    def _word_entry(self, i: int, totals: np.ndarray, n_books: np.ndarray) -> dict:
+        return {
+            'word': self.words[i],
+            'occurences': int(totals[i]),
+            'n_books': int(n_books[i]),
+        }
+
+_corpus: Optional[Corpus] = None
+_corpus_lock = threading.Lock()
+
+def get_corpus() -> Corpus:
+    """
+    Returns the process-wide Corpus instance,
+    creating it on first use.
+    """
+    global _corpus
+    with _corpus_lock:
+        if _corpus is None:
+            _corpus = Corpus()
+        return _corpus
+
+def sync_corpus(corpus: Corpus = None) -> int:
+    """
+    Adds every analysed book that is not in the corpus yet, e.g. books
+    analysed before the corpus existed. Returns the number of books added.
+    Arguments:
+    corpus: Corpus (optional) - The corpus, the process-wide one if not given
+    """
+    if corpus is None:
+        corpus = get_corpus()
+    added = 0
+    for book_dir in get_all_subdirs(BOOKS_FOLDER):
+        if book_dir.name in corpus:
+            continue
+        summary = load_summary(book_dir.name)
+        if summary is None or 'words' not in summary.get('tables', {}):
+            continue
+        corpus.add_book(book_dir.name, load_tables(book_dir.name, summary)['words'])
+        added += 1
+    return added
@@ -0,0 +1,182 @@
+import posixpath
+import zipfile
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+from urllib.parse import unquote
+
+from lxml import etree
+
+CONTAINER_PATH = 'META-INF/container.xml'
+
+NAMESPACES = {
+    'container': 'urn:oasis:names:tc:opendocument:xmlns:container',
+    'opf': 'http://www.idpf.org/2007/opf',
+    'dc': 'http://purl.org/dc/elements/1.1/',
+}
+
+# Elements whose text is never part of the book text.
+# rt and rp hold the ruby (furigana) readings
+SKIPPED_TAGS = {'rt', 'rp', 'head', 'script', 'style'}
+
+# Elements that end a line of text
+BLOCK_TAGS = {'p', 'div', 'br', 'li', 'tr', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6',
+              'section', 'article', 'blockquote', 'title'}
+
+# Size of the pieces chapter files are fed to the parser in
+READ_SIZE = 64 * 1024
+
+class ManifestItem(NamedTuple):
+    href: str
+    media_type: str
+    properties: str
+
+class EpubMetadata(NamedTuple):
+    title: str
+    authors: List[str]
+
+class TextExtractor:
+    """
+    lxml parser target that collects the text of an (x)html document in
+    document order as it is parsed, skipping ruby readings and other
+    text that is not part of the book.
+    """
+    def __init__(self):
+        self.parts: List[str] = []
+        self.skip_depth = 0
+
+    def start(self, tag, attrib) -> None:
+        if etree.QName(tag).localname in SKIPPED_TAGS:
+            self.skip_depth += 1
+
+    def end(self, tag) -> None:
+        name = etree.QName(tag).localname
+        if name in SKIPPED_TAGS:
+            self.skip_depth -= 1
+        elif name in BLOCK_TAGS and not self.skip_depth:
+            self.parts.append('\n')
+
+    def data(self, data: str) -> None:
+        if not self.skip_depth:
+            self.parts.append(data)
+
+    def close(self) -> str:
+        text = ''.join(self.parts)
+        self.parts = []
+        return text
+
+class EpubReader:
+    """
+    Reads the metadata, cover image and chapter text of an .epub file
+    straight from the zip archive, without extracting it to disk.
+    Use as a context manager:
+        with EpubReader(filename) as epub:
+            for chapter in epub.chapters():
+                ...
+    """
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.zip = zipfile.ZipFile(filename)
+        # container.xml and the package document come from the uploaded
+        # file, so entities (and anything on the network) are never loaded
+        self.parser = etree.XMLParser(resolve_entities=False, no_network=True)
+        self.opf_path = self._find_opf()
+        self.opf_dir = posixpath.dirname(self.opf_path)
+        self.opf = etree.fromstring(self.zip.read(self.opf_path), self.parser)
+        self.manifest = self._read_manifest()
+
+    def __enter__(self) -> 'EpubReader':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.zip.close()
+
+    def _find_opf(self) -> str:
+        container = etree.fromstring(self.zip.read(CONTAINER_PATH), self.parser)
+        rootfile = container.find('.//container:rootfile', NAMESPACES)
+        if rootfile is None:
+            raise ValueError(f'{self.filename} has no rootfile in {CONTAINER_PATH}')
+        return rootfile.get('full-path')
+
+    def _read_manifest(self) -> Dict[str, ManifestItem]:
+        manifest = {}
+        for item in self.opf.iterfind('opf:manifest/opf:item', NAMESPACES):
+            href = posixpath.normpath(posixpath.join(self.opf_dir, unquote(item.get('href'))))
+            manifest[item.get('id')] = ManifestItem(href,
+                                                    item.get('media-type', ''),
+                                                    item.get('properties', '')
+                                                    )
+        return manifest
+
+    def metadata(self) -> EpubMetadata:
+        """
+        Returns the title and authors of the book
+        """
+        title = self.opf.findtext('opf:metadata/dc:title', default='', namespaces=NAMESPACES)
+        authors = [creator.text.strip()
+                   for creator in self.opf.iterfind('opf:metadata/dc:creator', NAMESPACES)
+                   if creator.text]
+        return EpubMetadata(title.strip(), authors)
+
+    def _cover_item(self) -> Optional[ManifestItem]:
+        # epub 3 marks the cover with a property on the manifest item
+        for item in self.manifest.values():
+            if 'cover-image' in item.properties.split():
+                return item
+        # epub 2 uses <meta name="cover" content="item id">
+        meta = self.opf.find('opf:metadata/opf:meta[@name="cover"]', NAMESPACES)
+        if meta is not None and meta.get('content') in self.manifest:
+            return self.manifest[meta.get('content')]
+        for item_id, item in self.manifest.items():
+            if 'cover' in item_id.lower() and item.media_type.startswith('image/'):
+                return item
+        return None
+
+    def cover_image(self) -> Optional[bytes]:
+        """
+        Returns the contents of the cover image,
+        or None if the book does not have one
+        """
+        item = self._cover_item()
+        if item is None:
+            return None
+        try:
+            return self.zip.read(item.href)
+        except KeyError:
+            return None
+
+    def spine(self) -> List[ManifestItem]:
+        """
+        Returns the manifest items of the documents
+        in the book, in reading order
+        """
+        return [self.manifest[itemref.get('idref')]
+                for itemref in self.opf.iterfind('opf:spine/opf:itemref', NAMESPACES)
+                if itemref.get('idref') in self.manifest]
+
+    def chapter_text(self, item: ManifestItem) -> str:
+        """
+        Returns the text of a single document in the book, with
+        all ruby readings removed. The document is parsed in a streaming
+        fashion as it is decompressed.
+        Arguments:
+        item: ManifestItem - The manifest item of the document
+        """
+        parser = etree.XMLParser(target=TextExtractor(), recover=True,
+                                 resolve_entities=False, no_network=True)
+        with self.zip.open(item.href) as file:
+            while True:
+                data = file.read(READ_SIZE)
+                if not data:
+                    break
+                parser.feed(data)
+        return parser.close()
+
+    def chapters(self) -> Iterator[str]:
+        """
+        Lazily yields the text of every document in the spine,
+        in reading order
+        """
+        for item in self.spine():
+            yield self.chapter_text(item)
@@ -0,0 +1,193 @@
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from constants import FREQUENCY_LIST_DIR, FREQUENCY_INDEX_FILE
+from frequency_lists import Word
+from vocabulary import stars_from_frequencies, overall_frequencies
+
+# format used in word, 'freq', *stars* (freq),
+# e.g. 'の', 'freq', '★★★★★ (1)'
+FREQUENCY_REGEX = re.compile(r'[0-9]+')
+
+def frequency_list_signature(frequency_list_dir: str = FREQUENCY_LIST_DIR) -> Tuple:
+    """
+    Returns a tuple describing the current state of the frequency list
+    files (name, modification time and size of each file). An index is
+    rebuilt whenever this changes.
+    Arguments:
+    frequency_list_dir: str (optional) - The directory of the frequency lists
+    """
+    paths = sorted(Path(frequency_list_dir).glob('*.json'))
+    return tuple((path.name, path.stat().st_mtime_ns, path.stat().st_size)
+                 for path in paths)
+
+class FrequencyIndex:
+    """
+    All the frequency lists merged into one table, indexed by word:
+    words - every word in any of the lists, sorted
+    ranks - (words x frequency lists) frequency ranks, 0 if not in the list
+    overall - the overall frequency rank of each word
+    stars - the number of stars of the overall frequency
+    The index is built once from the frequency list files and saved as a
+    single .npz file, which is loaded as is until the lists change.
+    Single words are looked up in O(1) through a dict built on first use,
+    and whole vocabularies at once with a vectorised binary search.
+    """
+    def __init__(self,
+                 list_names: Sequence[str],
+                 words: np.ndarray,
+                 ranks: np.ndarray,
+                 signature: Tuple = ()
+                 ):
+        self.list_names = list(list_names)
+        self.words = words
+        self.ranks = ranks
+        self.overall = overall_frequencies(ranks).astype(np.int32)
+        self.stars = stars_from_frequencies(self.overall).astype(np.int8)
+        self.signature = signature
+        self._ids: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def build(cls, frequency_list_dir: str = FREQUENCY_LIST_DIR) -> 'FrequencyIndex':
+        """
+        Builds the index from the frequency list json files
+        in the given directory
+        Arguments:
+        frequency_list_dir: str (optional) - The directory of the frequency lists
+        """
+        signature = frequency_list_signature(frequency_list_dir)
+        list_names = [name[:-len('.json')] for name, _, _ in signature]
+        lists = []
+        for name, _, _ in signature:
+            filename = f'{frequency_list_dir}/{name}'
+            with open(filename, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            ranks = {}
+            for word, _, freq_string in data:
+                match = FREQUENCY_REGEX.search(freq_string)
+                assert match is not None, f'Could not find a frequency for {word} in {filename}'
+                ranks[word] = int(match[0])
+            lists.append(ranks)
+
+        words = sorted(set().union(*lists))
+        ranks = np.zeros((len(words), len(lists)), dtype=np.int32)
+        for j, frequency_list in enumerate(lists):
+            ranks[:, j] = np.fromiter((frequency_list.get(word, 0) for word in words),
+                                      dtype=np.int32, count=len(words))
+        return cls(list_names, np.array(words, dtype=str), ranks, signature)
+
+    def save(self, path: str = FREQUENCY_INDEX_FILE) -> None:
+        """
+        Saves the index, replacing the file atomically
+        Arguments:
+        path: str (optional) - The path of the .npz file
+        """
+        tmp_path = f'{path}.{os.getpid()}.tmp.npz'
+        np.savez(tmp_path,
+                 list_names=np.array(self.list_names, dtype=str),
+                 words=self.words,
+                 ranks=self.ranks,
+                 signature=np.array(json.dumps(self.signature)))
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = FREQUENCY_INDEX_FILE) -> 'FrequencyIndex':
+        """
+        Loads an index saved with save
+        Arguments:
+        path: str (optional) - The path of the .npz file
+        """
+        with np.load(path) as data:
+            signature = tuple(tuple(entry) for entry in json.loads(str(data['signature'])))
+            return cls(data['list_names'].tolist(), data['words'], data['ranks'], signature)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def __repr__(self) -> str:
+        return f'FrequencyIndex({len(self)} words, lists: {", ".join(self.list_names)})'
+
+    def id(self, word: str) -> Optional[int]:
+        """
+        Returns the id of the given word, or None if it is not in any list
+        Arguments:
+        word: str - The word to look up
+        """
+        if self._ids is None:
+            self._ids = {word: i for i, word in enumerate(self.words.tolist())}
+        return self._ids.get(word)
+
+    def ids(self, words: Sequence[str]) -> np.ndarray:
+        """
+        Returns the ids of all the given words at once,
+        -1 for words that are not in any list
+        Arguments:
+        words: Sequence[str] - The words to look up
+        """
+        if not len(words) or not len(self.words):
+            return np.full(len(words), -1, dtype=np.int64)
+        words = np.asarray(words, dtype=str)
+        ids = np.searchsorted(self.words, words)
+        ids[ids == len(self.words)] = 0
+        return np.where(self.words[ids] == words, ids, -1)
+
+    def lookup(self, words: Sequence[str]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the (words x frequency lists) ranks and the overall
+        frequency of all the given words, 0 where a word has no frequency
+        Arguments:
+        words: Sequence[str] - The words to look up
+        """
+        ids = self.ids(words)
+        found = ids >= 0
+        ranks = np.zeros((len(ids), len(self.list_names)), dtype=np.int32)
+        overall = np.zeros(len(ids), dtype=np.int32)
+        ranks[found] = self.ranks[ids[found]]
+        overall[found] = self.overall[ids[found]]
+        return ranks, overall
+
+    def frequency(self, word: str) -> Dict[str, Union[Word, str]]:
+        """
+        Returns the frequencies of the given word by frequency list
+        name, with its overall frequency as 'Overall' ('N/A' if it has none)
+        Arguments:
+        word: str - The word to look up
+        """
+        i = self.id(word)
+        frequencies = {}
+        if i is None:
+            frequencies['Overall'] = 'N/A'
+            return frequencies
+        for j, name in enumerate(self.list_names):
+            rank = int(self.ranks[i, j])
+            if rank:
+                frequencies[name] = Word(rank, int(stars_from_frequencies(rank)))
+        frequencies['Overall'] = Word(int(self.overall[i]), int(self.stars[i]))
+        return frequencies
+
+def load_frequency_index(frequency_list_dir: str = FREQUENCY_LIST_DIR,
+                         path: str = FREQUENCY_INDEX_FILE
+                         ) -> FrequencyIndex:
+    """
+    Returns the frequency index of the lists in the given directory,
+    loading the saved index if it is up to date with the lists and
+    building (and saving) it otherwise
+    Arguments:
+    frequency_list_dir: str (optional) - The directory of the frequency lists
+    path: str (optional) - The path of the saved index
+    """
+    signature = frequency_list_signature(frequency_list_dir)
+    try:
+        index = FrequencyIndex.load(path)
+        if index.signature == signature:
+            return index
+    except (FileNotFoundError, OSError, ValueError, KeyError):
+        pass
+    index = FrequencyIndex.build(frequency_list_dir)
+    index.save(path)
+    return index
@@ -1,6 +1,5 @@
 from dataclasses import dataclass
-from typing import List, Dict, Union, NamedTuple
-from pathlib import Path
+from typing import Dict, NamedTuple
 
 import re
 import json
@@ -45,56 +44,6 @@ def stars_from_frequency(freq: int) -> int:
         a positive integer as the frequency.
         ''')
 
-def get_all_frequency_lists() -> List[FrequencyList]:
-    """
-    Gets a list of FrequencyList objects for each of the
-    frequency list json files in the frequency list directory
-    """
-    p = Path('frequency-lists').glob('*.json')
-    frequency_lists = []
-    for path in p:
-        frequency_list = process_frequency_list(str(path))
-        frequency_lists.append(frequency_list)
-
-    return frequency_lists
-
-def get_overall_frequency(frequencies: Dict[str, Word]) -> Union[Word, str]:
-    """
-    Given the frequency of a word from several different frequency lists,
-    compute an 'overall frequency'. We do this by computing
-    the average of 1 / frequency, and then taking the reciprocal of that.
-    Arguments:
-    frequencies: Dict[str, Word] - A dictionary with the frequencies from
-    each frequency list
-    """
-    frequency_scores = [1 / freq.frequency for freq in frequencies.values()]
-    total_score = sum(frequency_scores)
-    if total_score == 0:
-        return 'N/A'
-    overall_frequency = round(1 / sum(frequency_scores) * len(frequency_scores))
-    return Word(overall_frequency, stars_from_frequency(overall_frequency))
-
-
-def get_frequency(word: str, frequency_lists: List[FrequencyList]) -> Dict[str, Word]:
-    """
-    Returns the frequency of the word for each frequency list
-    specified.
-    Arguments:
-    word: str - The word to get the frequency of
-    frequency: List[FrequencyList] - The list of frequency lists to use
-    """
-    frequencies = {}
-    for frequency_list in frequency_lists:
-        try:
-            frequency = frequency_list.words[word]
-            frequencies[frequency_list.name] = frequency
-        except KeyError:
-            continue
-
-    frequencies['Overall'] = get_overall_frequency(frequencies)
-
-    return frequencies
-
 def process_frequency_list(filename: str) -> FrequencyList:
     """
     Processes a frequency list json file and returns
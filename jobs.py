@@ -0,0 +1,160 @@
+import shutil
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+from typing import Dict, Optional
+
+from book_utils import analyse_ebook, load_cached_analysis
+from resources import get_resources
+from constants import UPLOAD_FOLDER, JOB_WORKERS, JOB_RETENTION
+
+@dataclass
+class Job:
+    id: str
+    file_hash: str
+    filename: str
+    # one of 'queued', 'running', 'done' or 'failed'
+    status: str = 'queued'
+    # the pipeline stage currently running, see book_utils.PIPELINE_STAGES
+    stage: str = 'queued'
+    progress: int = 0
+    error: Optional[str] = None
+    created: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+    # hash of an earlier version of the book, see book_utils.analyse_ebook
+    previous: Optional[str] = None
+    # whether to capture a cProfile/tracemalloc profile of the analysis
+    capture_profile: bool = False
+    # the analysis version when the job was submitted, see Resources.analysis_version
+    analysis_version: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        del data['filename']
+        return data
+
+class JobQueue:
+    """
+    Runs ebook analyses in a bounded pool of background threads.
+    Jobs are de-duplicated by file hash: submitting a file that is already
+    queued or running, or done with the current analysis version, returns
+    the existing job instead of analysing the file again, and a file that
+    has already been analysed (with the current analysis version) gets a
+    job that is done straight away.
+    Note that the jobs only live in the memory of the process that
+    created them, so the app should be served by a single process
+    (with as many threads as needed).
+    """
+    def __init__(self, max_workers: int = JOB_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='analysis')
+        self._lock = threading.Lock()
+        self._jobs: Dict[str, Job] = {}
+        self._jobs_by_hash: Dict[str, Job] = {}
+
+    def submit(self,
+               filename: str,
+               file_hash: str,
+               previous: Optional[str] = None,
+               capture_profile: bool = False
+               ) -> Job:
+        """
+        Queues the analysis of the given uploaded file and returns the job.
+        The file (and the directory it is in) is deleted once the job
+        finishes, or straight away if the file hash already has a job or
+        the file has already been analysed.
+        Arguments:
+        filename: str - The path to the uploaded file
+        file_hash: str - The sha256sum hash of the file
+        previous: str (optional) - The hash of an earlier version of the book
+        capture_profile: bool (optional, default = False) - Whether to
+        capture a profile of the analysis, see metrics.Profile
+        """
+        analysis_version = get_resources().analysis_version()
+        with self._lock:
+            self._prune()
+            existing = self._jobs_by_hash.get(file_hash)
+            # a job that is done is stale once the word lists, dictionary
+            # or pipeline change, but a queued or running one is still
+            # reused, since two analyses of a book write the same directory
+            if (existing is not None and existing.status != 'failed'
+                    and (existing.status != 'done' or existing.analysis_version == analysis_version)):
+                remove_upload(filename)
+                return existing
+
+            job = Job(id=uuid.uuid4().hex, file_hash=file_hash, filename=filename,
+                      previous=previous, capture_profile=capture_profile,
+                      analysis_version=analysis_version)
+            cached = load_cached_analysis(file_hash, analysis_version) is not None
+            if cached:
+                job.status = job.stage = 'done'
+                job.progress = 100
+                job.finished = time.time()
+            self._jobs[job.id] = job
+            self._jobs_by_hash[file_hash] = job
+
+        if cached:
+            remove_upload(filename)
+        else:
+            self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        """
+        Returns the job with the given id, or None if there is no such job
+        Arguments:
+        job_id: str - The id of the job
+        """
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job: Job) -> None:
+        def progress(stage: str, percent: int) -> None:
+            job.stage = stage
+            job.progress = percent
+
+        job.status = 'running'
+        try:
+            analyse_ebook(job.filename,
+                          file_hash=job.file_hash,
+                          progress=progress,
+                          previous=job.previous,
+                          capture_profile=job.capture_profile)
+            job.status = 'done'
+            job.stage = 'done'
+            job.progress = 100
+        except Exception as e:
+            traceback.print_exc()
+            job.status = 'failed'
+            job.error = str(e)
+        finally:
+            job.finished = time.time()
+            remove_upload(job.filename)
+
+    def _prune(self) -> None:
+        """
+        Forgets about jobs that finished more than JOB_RETENTION seconds ago
+        """
+        cutoff = time.time() - JOB_RETENTION
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and job.finished < cutoff:
+                del self._jobs[job_id]
+                if self._jobs_by_hash.get(job.file_hash) is job:
+                    del self._jobs_by_hash[job.file_hash]
+
+def remove_upload(filename: str) -> None:
+    """
+    Deletes an uploaded file together with the
+    per-upload directory it was saved in.
+    Arguments:
+    filename: str - The path to the uploaded file
+    """
+    directory = Path(filename).parent
+    if directory.resolve() == Path(UPLOAD_FOLDER).resolve():
+        Path(filename).unlink(missing_ok=True)
+    else:
+        shutil.rmtree(directory, ignore_errors=True)
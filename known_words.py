@@ -0,0 +1,139 @@
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+import numpy as np
+
+from analysis import parse_wordlist
+from constants import KNOWN_WORDS_FOLDER
+from corpus import Corpus
+from resources import get_resources
+
+USER_REGEX = re.compile(r'^[A-Za-z0-9_-][A-Za-z0-9_.-]{0,63}$')
+
+class KnownWordLists:
+    """
+    The known-word lists uploaded by each user, one file per user in
+    KNOWN_WORDS_FOLDER. Lists are loaded on first use and reloaded when
+    their file changes. Without a user, the default known-word list
+    (KNOWN_WORDS_FILE) is used.
+    Known words are matched against the corpus with a boolean mask over
+    the corpus vocabulary, kept per list and extended as the corpus grows,
+    so coverage queries never have to look at the words themselves.
+    """
+    def __init__(self, directory: str = KNOWN_WORDS_FOLDER):
+        self.directory = Path(directory)
+        self._lock = threading.RLock()
+        # user -> (signature, words)
+        self._words: Dict[Optional[str], Tuple[Tuple, Set[str]]] = {}
+        # user -> (words, corpus, mask)
+        self._masks: Dict[Optional[str], Tuple[Set[str], Corpus, np.ndarray]] = {}
+
+    def path(self, user: str) -> Path:
+        """
+        Returns the path of the given user's list
+        Arguments:
+        user: str - The name of the user
+        """
+        if not USER_REGEX.match(user):
+            raise ValueError(f'Invalid user name {user!r}')
+        return self.directory / f'{user}.txt'
+
+    def _signature(self, path: Path) -> Tuple:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            raise KeyError(f'No known-word list for {path.stem}') from None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def words(self, user: Optional[str] = None) -> Set[str]:
+        """
+        Returns the set of words the given user knows. Raises KeyError
+        if the user has not uploaded a list.
+        Arguments:
+        user: str (optional) - The name of the user, the default list if not given
+        """
+        if user is None:
+            try:
+                return get_resources().known_words
+            except FileNotFoundError:
+                raise KeyError('No default known-word list') from None
+        with self._lock:
+            path = self.path(user)
+            signature = self._signature(path)
+            cached = self._words.get(user)
+            if cached is None or cached[0] != signature:
+                with open(path, 'r', encoding='utf-8') as file:
+                    cached = self._words[user] = (signature, parse_wordlist(file))
+            return cached[1]
+
+    def save(self, user: str, words: Iterable[str]) -> int:
+        """
+        Replaces the given user's list with the given words.
+        Returns the number of words in the list.
+        Arguments:
+        user: str - The name of the user
+        words: Iterable[str] - The lines of the list, one word per line
+        """
+        path = self.path(user)
+        words = parse_wordlist(words)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f'.{os.getpid()}.{threading.get_ident()}.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            file.write(''.join(f'{word}\n' for word in sorted(words)))
+        os.replace(tmp_path, path)
+        return len(words)
+
+    def delete(self, user: str) -> bool:
+        """
+        Deletes the given user's list. Returns whether there was one.
+        Arguments:
+        user: str - The name of the user
+        """
+        with self._lock:
+            self._words.pop(user, None)
+            self._masks.pop(user, None)
+            try:
+                self.path(user).unlink()
+            except FileNotFoundError:
+                return False
+            return True
+
+    def mask(self, corpus: Corpus, user: Optional[str] = None) -> np.ndarray:
+        """
+        Returns a boolean mask over the corpus vocabulary
+        of the words the given user knows
+        Arguments:
+        corpus: Corpus - The corpus
+        user: str (optional) - The name of the user, the default list if not given
+        """
+        with self._lock:
+            words = self.words(user)
+            corpus.refresh()
+            cached = self._masks.get(user)
+            if cached is None or cached[0] is not words or cached[1] is not corpus:
+                mask = corpus.known_mask(words)
+            else:
+                # only look up the words added to the corpus since
+                mask = cached[2]
+                new_words = corpus.words[len(mask):]
+                if new_words:
+                    mask = np.concatenate((mask, [word in words for word in new_words]))
+            self._masks[user] = (words, corpus, mask)
+            return mask
+
+_lists: Optional[KnownWordLists] = None
+_lists_lock = threading.Lock()
+
+def get_known_word_lists() -> KnownWordLists:
+    """
+    Returns the process-wide KnownWordLists instance,
+    creating it on first use.
+    """
+    global _lists
+    with _lists_lock:
+        if _lists is None:
+            _lists = KnownWordLists()
+        return _lists
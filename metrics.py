@@ -0,0 +1,276 @@
+import cProfile
+import io
+import pstats
+import resource
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence
+
+# Upper bounds (in seconds) of the buckets of the stage duration histogram
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, float('inf'))
+# Upper bounds (in seconds) of the buckets of the request duration histogram
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+# Number of functions and allocation sites kept from a capture
+CAPTURE_TOP = 25
+
+def peak_rss() -> int:
+    """
+    Returns the peak resident memory of this process in bytes since it
+    started, or since the peak was last reset with reset_peak_rss
+    """
+    try:
+        with open('/proc/self/status', 'r') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux (and bytes on macOS,
+    # which has no /proc and never gets here with a reset peak)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def reset_peak_rss() -> None:
+    """
+    Resets the peak resident memory of this process to the current
+    resident memory, where the OS allows it (Linux only)
+    """
+    try:
+        with open('/proc/self/clear_refs', 'w') as file:
+            file.write('5')
+    except OSError:
+        pass
+
+class Histogram:
+    """A Prometheus style histogram, with one set of buckets per label value"""
+    def __init__(self, name: str, help: str, label: str, buckets: Sequence[float]):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self.counts: Dict[str, List[int]] = defaultdict(lambda: [0] * len(self.buckets))
+        self.sums: Dict[str, float] = defaultdict(float)
+
+    def observe(self, label_value: str, value: float) -> None:
+        counts = self.counts[label_value]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self.sums[label_value] += value
+
+    def lines(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        for label_value, counts in sorted(self.counts.items()):
+            labels = f'{self.label}="{label_value}"'
+            for bound, count in zip(self.buckets, counts):
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                yield f'{self.name}_bucket{{{labels},le="{le}"}} {count}'
+            yield f'{self.name}_sum{{{labels}}} {self.sums[label_value]}'
+            yield f'{self.name}_count{{{labels}}} {counts[-1]}'
+
+class Metric:
+    """A Prometheus style counter or gauge, with one value per label value"""
+    def __init__(self, name: str, help: str, label: str, kind: str = 'counter'):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.kind = kind
+        self.values: Dict[str, float] = defaultdict(float)
+
+    def lines(self) -> Iterator[str]:
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.kind}'
+        for label_value, value in sorted(self.values.items()):
+            yield f'{self.name}{{{self.label}="{label_value}"}} {value}'
+
+class Registry:
+    """
+    The metrics of this process, exported in the Prometheus text format
+    by the app's /metrics endpoint. Only analyses run by this process are
+    counted, so the batch command line tool records into its own registry.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_seconds = Histogram('ebook_analysis_stage_seconds',
+                'Wall time spent in each stage of the analysis pipeline', 'stage', STAGE_BUCKETS)
+        self.stage_peak_rss = Metric('ebook_analysis_stage_peak_rss_bytes',
+                'Peak resident memory of the process during the last run of each stage',
+                'stage', kind='gauge')
+        self.analyses = Metric('ebook_analyses_total',
+                'Number of analyses by outcome', 'status')
+        self.request_seconds = Histogram('http_request_duration_seconds',
+                'Time spent handling requests, by endpoint', 'endpoint', REQUEST_BUCKETS)
+
+    def observe_stage(self, stage: str, seconds: float, peak: int) -> None:
+        with self._lock:
+            self.stage_seconds.observe(stage, seconds)
+            self.stage_peak_rss.values[stage] = peak
+
+    def count_analysis(self, status: str) -> None:
+        with self._lock:
+            self.analyses.values[status] += 1
+
+    def observe_request(self, endpoint: str, seconds: float) -> None:
+        with self._lock:
+            self.request_seconds.observe(endpoint, seconds)
+
+    def export(self) -> str:
+        """Returns all the metrics in the Prometheus text exposition format"""
+        with self._lock:
+            lines = []
+            for metric in (self.stage_seconds, self.stage_peak_rss,
+                           self.analyses, self.request_seconds):
+                lines.extend(metric.lines())
+            return '\n'.join(lines) + '\n'
+
+registry = Registry()
+# tracemalloc and (since Python 3.12) cProfile are process-wide,
+# so only one analysis at a time can be captured
+_capture_lock = threading.Lock()
+
+class Profile:
+    """
+    Records the wall time, CPU time and peak memory of each stage of an
+    analysis, and reports every stage to the process-wide registry.
+    Memory is that of the whole process (not of the tokenizer's worker
+    processes), so stages of analyses running at the same time overlap.
+    With capture=True, the thread running the analysis is also profiled
+    with cProfile and Python allocations are traced with tracemalloc,
+    which is precise but makes the analysis several times slower. If
+    another analysis is being captured already, this one is only timed.
+    Call stop once the analysis is done (or has failed).
+    Arguments:
+    capture: bool (optional, default = False) - Whether to capture a
+    cProfile profile and tracemalloc statistics
+    """
+    def __init__(self, capture: bool = False):
+        self.stages: Dict[str, dict] = {}
+        self.started = time.time()
+        self._start = time.perf_counter()
+        # total wall time, set by stop
+        self.seconds: Optional[float] = None
+        self._profiler: Optional[cProfile.Profile] = None
+        self._snapshot: Optional[tracemalloc.Snapshot] = None
+        self.capture = capture and _capture_lock.acquire(blocking=False)
+        if self.capture:
+            self._profiler = cProfile.Profile()
+            # leave tracing on if it was started elsewhere, e.g. by PYTHONTRACEMALLOC
+            self._stop_tracing = not tracemalloc.is_tracing()
+            tracemalloc.start()
+            self._profiler.enable()
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Context manager timing the stage with the given name
+        Arguments:
+        name: str - The name of the stage
+        """
+        reset_peak_rss()
+        if self.capture:
+            tracemalloc.reset_peak()
+        wall = time.perf_counter()
+        cpu = time.thread_time()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - wall
+            stage = {
+                'seconds': round(seconds, 6),
+                'cpu_seconds': round(time.thread_time() - cpu, 6),
+                'peak_rss': peak_rss(),
+            }
+            if self.capture:
+                stage['peak_traced'] = tracemalloc.get_traced_memory()[1]
+            # a stage that runs more than once (e.g. per chapter) adds up
+            previous = self.stages.get(name)
+            if previous is not None:
+                stage['seconds'] = round(stage['seconds'] + previous['seconds'], 6)
+                stage['cpu_seconds'] = round(stage['cpu_seconds'] + previous['cpu_seconds'], 6)
+                stage['peak_rss'] = max(stage['peak_rss'], previous['peak_rss'])
+                if self.capture:
+                    stage['peak_traced'] = max(stage['peak_traced'], previous['peak_traced'])
+            self.stages[name] = stage
+            registry.observe_stage(name, seconds, stage['peak_rss'])
+
+    @property
+    def captured(self) -> bool:
+        """Whether this analysis was (or is being) captured"""
+        return self._profiler is not None
+
+    def stop(self) -> None:
+        """Stops the clock, and capturing if the analysis is being captured"""
+        if self.seconds is None:
+            self.seconds = round(time.perf_counter() - self._start, 6)
+        if self._profiler is not None and self.capture:
+            self._profiler.disable()
+            self._snapshot = tracemalloc.take_snapshot()
+            if self._stop_tracing:
+                tracemalloc.stop()
+            self.capture = False
+            _capture_lock.release()
+
+    def to_dict(self) -> dict:
+        """Returns the profile, with the captured statistics if there are any"""
+        data = {
+            'started': self.started,
+            'seconds': self.seconds,
+            'peak_rss': max((stage['peak_rss'] for stage in self.stages.values()), default=0),
+            'captured': self.captured,
+            'stages': self.stages,
+        }
+        if self.captured:
+            data['functions'] = self.top_functions()
+            data['allocations'] = self.top_allocations()
+        return data
+
+    def top_functions(self, n: int = CAPTURE_TOP) -> List[dict]:
+        """
+        Returns the n functions with the highest cumulative time in the capture
+        Arguments:
+        n: int (optional, default = CAPTURE_TOP) - The number of functions
+        """
+        stats = pstats.Stats(self._profiler, stream=io.StringIO())
+        functions = []
+        for (filename, line, function), (_, calls, own, cumulative, _) in stats.stats.items():
+            functions.append({
+                'function': f'{filename}:{line}({function})',
+                'calls': calls,
+                'seconds': round(own, 6),
+                'cumulative_seconds': round(cumulative, 6),
+            })
+        functions.sort(key=lambda function: function['cumulative_seconds'], reverse=True)
+        return functions[:n]
+
+    def top_allocations(self, n: int = CAPTURE_TOP) -> List[dict]:
+        """
+        Returns the n lines that held the most memory at the end of the capture
+        Arguments:
+        n: int (optional, default = CAPTURE_TOP) - The number of lines
+        """
+        if self._snapshot is None:
+            return []
+        return [{'line': str(stat.traceback), 'size': stat.size, 'count': stat.count}
+                for stat in self._snapshot.statistics('lineno')[:n]]
+
+    def dump_stats(self, path: str) -> None:
+        """
+        Writes the captured cProfile statistics to the given
+        file, for use with pstats or e.g. snakeviz
+        Arguments:
+        path: str - The path to write the statistics to
+        """
+        if self.captured:
+            self._profiler.dump_stats(path)
+
+class NullProfile(Profile):
+    """A Profile that records nothing, for when no profile is wanted"""
+    def __init__(self):
+        super().__init__(capture=False)
+
+    @contextmanager
+    def stage(self, name: str):
+        yield
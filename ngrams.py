@@ -0,0 +1,242 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, Hashable, Iterable, List, Mapping, Optional
+
+import numpy as np
+
+from constants import NGRAM_CAPACITY
+from text_normalisation import KANJI_CHARACTERS
+from vocabulary import Vocabulary
+
+# The kinds of n-grams counted: sequences of 2 and 3 words within a
+# sentence, and of 2 and 3 kanji within a run of kanji (compounds)
+WORD_NGRAMS = {'words2': 2, 'words3': 3}
+KANJI_NGRAMS = {'kanji2': 2, 'kanji3': 3}
+KANJI_RUN_REGEX = re.compile(f'[{KANJI_CHARACTERS}]{{2,}}')
+# N-grams used fewer times than this are not reported as collocations,
+# since pointwise mutual information favours rare n-grams
+MIN_COLLOCATION_COUNT = 3
+# Number of n-grams of each kind reported per book
+COLLOCATION_LIMIT = 50
+
+class HeavyHitters:
+    """
+    Approximate counts of the most common keys in a stream, in bounded
+    memory: a Misra-Gries summary that keeps at most capacity counters.
+    Counts are lower bounds, at most error below the true counts, and any
+    key used more than total / (capacity + 1) times is always kept.
+    Summaries of different parts of a stream (e.g. the units of a book,
+    counted in different processes) can be merged with the same guarantees.
+    Arguments:
+    capacity: int (optional, default = NGRAM_CAPACITY) - The most number of keys kept
+    """
+    def __init__(self, capacity: int = NGRAM_CAPACITY):
+        self.capacity = capacity
+        self.counts: Dict[Hashable, int] = {}
+        # the number of keys counted, and the most any count is too low by
+        self.total = 0
+        self.error = 0
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def update(self, counts: Mapping[Hashable, int]) -> None:
+        """
+        Adds the exact counts of a batch of keys
+        Arguments:
+        counts: Mapping[Hashable, int] - The number of times each key occurs
+        """
+        for key, n in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + n
+            self.total += n
+        self._prune()
+
+    def merge(self, other: 'HeavyHitters') -> None:
+        """
+        Adds another summary to this one
+        Arguments:
+        other: HeavyHitters - The summary to add
+        """
+        for key, n in other.counts.items():
+            self.counts[key] = self.counts.get(key, 0) + n
+        self.total += other.total
+        self.error += other.error
+        self._prune()
+
+    def _prune(self) -> None:
+        if len(self.counts) <= self.capacity:
+            return
+        values = np.fromiter(self.counts.values(), dtype=np.int64, count=len(self.counts))
+        # subtract the (capacity + 1)th largest count from every count,
+        # which leaves at most capacity counts above 0
+        cut = int(np.partition(values, len(values) - self.capacity - 1)[len(values) - self.capacity - 1])
+        self.counts = {key: n - cut for key, n in self.counts.items() if n > cut}
+        self.error += cut
+
+    def most_common(self, n: Optional[int] = None) -> List[tuple]:
+        """
+        Returns the n keys with the highest counts and their
+        counts, highest first, like Counter.most_common
+        Arguments:
+        n: int (optional) - The number of keys, all if None
+        """
+        return Counter(self.counts).most_common(n)
+
+    def to_json(self) -> dict:
+        """Returns the summary as json, see from_json"""
+        return {
+            'capacity': self.capacity,
+            'total': self.total,
+            'error': self.error,
+            'counts': [[list(key) if isinstance(key, tuple) else key, n]
+                       for key, n in self.counts.items()],
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> 'HeavyHitters':
+        """
+        Reads a summary written by to_json
+        Arguments:
+        data: dict - The summary as json
+        """
+        summary = cls(data['capacity'])
+        summary.total = data['total']
+        summary.error = data['error']
+        summary.counts = {tuple(key) if isinstance(key, list) else key: n
+                          for key, n in data['counts']}
+        return summary
+
+def count_word_ngrams(ids: np.ndarray,
+                      words: np.ndarray,
+                      capacity: int = NGRAM_CAPACITY
+                      ) -> Dict[str, HeavyHitters]:
+    """
+    Counts the word n-grams (see WORD_NGRAMS) in a sequence of word ids.
+    The ids are counted as integer keys with NumPy, and only the (at most
+    capacity) most common n-grams of each kind are turned into words.
+    Arguments:
+    ids: np.ndarray - The id of each token in words, in the order of the
+    text, with -1 for tokens that are not words (e.g. punctuation) and
+    between sentences, so no n-gram spans them
+    words: np.ndarray - The words, by id, as an array of objects
+    capacity: int (optional, default = NGRAM_CAPACITY) - The size of the summaries
+    """
+    summaries = {}
+    base = max(len(words), 1)
+    for name, n in WORD_NGRAMS.items():
+        summary = summaries[name] = HeavyHitters(capacity)
+        if len(ids) < n:
+            continue
+        columns = [ids[i:len(ids) - n + 1 + i] for i in range(n)]
+        valid = np.logical_and.reduce([column >= 0 for column in columns])
+        # len(words) ** n has to fit in an int64, which it does for anything
+        # up to the length of a unit of text (see tokenizer.split_units)
+        keys = np.zeros(int(valid.sum()), dtype=np.int64)
+        for column in columns:
+            keys = keys * base + column[valid]
+        unique, counts = np.unique(keys, return_counts=True)
+        cut = 0
+        if len(unique) > capacity:
+            # only keep the most common n-grams, the rest (each used at
+            # most cut times) is only counted in the total and the error
+            top = np.argpartition(-counts, capacity)
+            cut = int(counts[top[capacity]])
+            unique, counts = unique[top[:capacity]], counts[top[:capacity]]
+        parts = [words[unique // base ** (n - 1 - i) % base] for i in range(n)]
+        summary.update(dict(zip(zip(*parts), counts.tolist())))
+        summary.total = len(keys)
+        summary.error += cut
+    return summaries
+
+def count_kanji_ngrams(text: str, capacity: int = NGRAM_CAPACITY) -> Dict[str, HeavyHitters]:
+    """
+    Counts the kanji n-grams (see KANJI_NGRAMS) within each run of kanji
+    in the given text
+    Arguments:
+    text: str - The text to count in
+    capacity: int (optional, default = NGRAM_CAPACITY) - The size of the summaries
+    """
+    runs = KANJI_RUN_REGEX.findall(text)
+    summaries = {}
+    for name, n in KANJI_NGRAMS.items():
+        summary = summaries[name] = HeavyHitters(capacity)
+        summary.update(Counter(run[i:i + n] for run in runs for i in range(len(run) - n + 1)))
+    return summaries
+
+def merge_ngrams(summaries: Dict[str, HeavyHitters], other: Dict[str, HeavyHitters]) -> None:
+    """
+    Adds the n-gram summaries in other to those in summaries
+    Arguments:
+    summaries: Dict[str, HeavyHitters] - The summaries to add to
+    other: Dict[str, HeavyHitters] - The summaries to add
+    """
+    for name, summary in other.items():
+        if name in summaries:
+            summaries[name].merge(summary)
+        else:
+            summaries[name] = summary
+
+def pmi(count: int, total: int, part_counts: Iterable[int], n_parts: int) -> float:
+    """
+    Returns the pointwise mutual information (in bits) of an n-gram: how
+    much more often its parts occur together than they would by chance.
+    Arguments:
+    count: int - The number of occurences of the n-gram
+    total: int - The number of n-grams of the same kind
+    part_counts: Iterable[int] - The number of occurences of each part
+    n_parts: int - The number of occurences of all parts, e.g. the number of words
+    """
+    log_parts = sum(math.log2(part / n_parts) for part in part_counts)
+    return math.log2(count / total) - log_parts
+
+def collocations(summaries: Dict[str, HeavyHitters],
+                 vocabularies: Dict[str, Vocabulary],
+                 limit: int = COLLOCATION_LIMIT,
+                 min_count: int = MIN_COLLOCATION_COUNT
+                 ) -> dict:
+    """
+    Returns, for each kind of n-gram, the most common n-grams and the
+    strongest collocations (the n-grams with the highest pointwise mutual
+    information among those used at least min_count times), each with
+    its number of occurences and PMI, e.g.
+    {'words2': {'total': ..., 'error': ..., 'frequent': [...], 'collocations': [...]}}
+    Arguments:
+    summaries: Dict[str, HeavyHitters] - The n-gram counts of the book
+    vocabularies: Dict[str, Vocabulary] - The words table ('words') and
+    the characters table ('kanji') of the book, for the parts' occurences
+    limit: int (optional, default = COLLOCATION_LIMIT) - The number of
+    n-grams of each kind to return
+    min_count: int (optional, default = MIN_COLLOCATION_COUNT) - The least
+    number of occurences of a collocation
+    """
+    result = {}
+    for name, summary in summaries.items():
+        vocabulary = vocabularies[name.rstrip('0123456789')]
+        n_parts = vocabulary.total
+        counts = vocabulary.counts.tolist()
+        entries = []
+        for ngram, count in summary.most_common():
+            # the rest is neither frequent nor common enough to be a collocation
+            if count < min_count and len(entries) >= limit:
+                break
+            parts = list(ngram)
+            ids = [vocabulary.id(part) for part in parts]
+            if None in ids:
+                continue
+            part_counts = [counts[i] for i in ids]
+            entries.append({
+                'text': ''.join(parts),
+                'parts': parts,
+                'occurences': count,
+                'pmi': round(pmi(count, summary.total, part_counts, n_parts), 3),
+            })
+        result[name] = {
+            'total': summary.total,
+            'error': summary.error,
+            'frequent': entries[:limit],
+            'collocations': sorted((entry for entry in entries if entry['occurences'] >= min_count),
+                                   key=lambda entry: (entry['pmi'], entry['occurences']),
+                                   reverse=True)[:limit],
+        }
+    return result
@@ -0,0 +1,130 @@
+import json
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor, wait
+from pathlib import Path
+from typing import List, Optional
+
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from constants import PLOT_WORKERS
+from plots import PLOT_TYPES, plot_data, plot_figure
+from storage import book_dir
+from vocabulary import Vocabulary
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+# images submitted to the pool that have not been rendered yet
+_pending: List[Future] = []
+
+def _warm_up() -> None:
+    # the first image a process renders starts the kaleido renderer,
+    # which takes seconds, so do it before any real work arrives
+    pio.to_image(go.Figure(), format='png')
+
+def get_pool() -> ProcessPoolExecutor:
+    """
+    Returns the pool of processes that render plot images, creating it on
+    first use. Each process starts its renderer as soon as it starts and
+    keeps it running.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=PLOT_WORKERS, initializer=_warm_up)
+        return _pool
+
+def _render_image(figure_json: str, image_path: str) -> str:
+    figure = pio.from_json(figure_json)
+    tmp_path = f'{image_path}.{os.getpid()}.tmp.png'
+    figure.write_image(tmp_path)
+    os.replace(tmp_path, image_path)
+    return image_path
+
+def plot_paths(file_hash: str, name: str) -> tuple:
+    """
+    Returns the paths of the json data and the image
+    of the given plot of the given book
+    Arguments:
+    file_hash: str - The sha256sum hash of the book
+    name: str - The type of plot, one of plots.PLOT_TYPES
+    """
+    directory = book_dir(file_hash)
+    return directory / f'{name}.json', directory / f'{name}.png'
+
+def load_plot(file_hash: str, name: str) -> Optional[dict]:
+    """
+    Returns the stored data and figure of the given plot of the given book,
+    or None if it has not been generated
+    Arguments:
+    file_hash: str - The sha256sum hash of the book
+    name: str - The type of plot, one of plots.PLOT_TYPES
+    """
+    if name not in PLOT_TYPES:
+        return None
+    json_path, _ = plot_paths(file_hash, name)
+    try:
+        with open(json_path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def render_plots(file_hash: str,
+                 vocabulary: Vocabulary,
+                 book_title: str,
+                 analysis_version: str,
+                 images: bool = True
+                 ) -> List[str]:
+    """
+    Generates every plot in plots.PLOT_TYPES for the given book. The
+    pre-aggregated data and the figure of each plot are stored as json
+    straight away, and the images are rendered in the background by the
+    plot rendering pool. Plots already generated for this book and
+    analysis version are reused. Returns the paths the images are (or
+    will be) saved to.
+    Arguments:
+    file_hash: str - The sha256sum hash of the book
+    vocabulary: Vocabulary - The words used in the book
+    book_title: str - The title of the book
+    analysis_version: str - The analysis version, see Resources.analysis_version
+    images: bool (optional, default = True) - Whether to render images at all.
+    Without them, the plots can only be rendered client-side from the json
+    """
+    image_paths = []
+    for name in PLOT_TYPES:
+        json_path, image_path = plot_paths(file_hash, name)
+        plot = load_plot(file_hash, name)
+        if plot is None or plot.get('analysis_version') != analysis_version:
+            data = plot_data(name, vocabulary)
+            figure = plot_figure(name, data, book_title)
+            plot = {
+                'name': name,
+                'analysis_version': analysis_version,
+                'data': data,
+                'figure': json.loads(figure.to_json()),
+            }
+            image_path.unlink(missing_ok=True)
+            # load_plot never sees a partly written file
+            tmp_path = json_path.with_name(f'{json_path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(plot, file)
+            os.replace(tmp_path, json_path)
+
+        if images and not image_path.exists():
+            future = get_pool().submit(_render_image, json.dumps(plot['figure']), str(image_path))
+            with _pool_lock:
+                _pending[:] = [pending for pending in _pending if not pending.done()]
+                _pending.append(future)
+        image_paths.append(str(image_path))
+    return image_paths
+
+def wait_for_images() -> None:
+    """
+    Blocks until every plot image submitted so far has been rendered.
+    Needed before exiting a process that is not the main process,
+    since those do not wait for the rendering pool on exit.
+    """
+    with _pool_lock:
+        pending = list(_pending)
+    wait(pending)
@@ -1,82 +1,76 @@
-from analysis import WordAnalysis
+from vocabulary import Vocabulary, stars_from_frequencies
 import numpy as np
-import pandas as pd
-import matplotlib.pyplot as plt
 import plotly.express as px
-import plotly.io as pio
-from typing import List
+import plotly.graph_objects as go
+from typing import Callable, Dict, List, NamedTuple, Tuple
 
-def get_histogram(words: WordAnalysis, title: str, save_path: str) -> str:
+# The frequency list used for the frequency distribution histogram
+HISTOGRAM_FREQUENCY_LIST = 'netflix'
+
+# Lower bounds of the bins for the occurence distribution plot
+OCCURENCE_BINS = [1, 2, 3, 5, 10, 20, 50, 100]
+
+class PlotType(NamedTuple):
+    title: str
+    x_title: str
+    y_title: str
+    # computes the bar labels and heights from the words of a book
+    counts: Callable[[Vocabulary], Tuple[List[str], np.ndarray]]
+
+def bar_figure(labels: List[str], counts: np.ndarray, title: str, x_title: str, y_title: str) -> go.Figure:
     """
-    Creates a histogram showing the unweighted frequency distribution
-    of the (unique) words used in the book. Returns the path to the
-    saved histogram.
+    Builds a bar chart with one differently coloured bar per label
+    from already aggregated counts.
     Arguments:
-    words: WordAnalysis - A WordAnalysis object describing the words used
-    in the book
-    title: str - The title of the histogram plot
-    save_path: str - The path to save the histogram to
+    labels: List[str] - The label of each bar
+    counts: np.ndarray - The height of each bar
+    title: str - The title of the plot
+    x_title: str - The x axis label
+    y_title: str - The y axis label
     """
-    bins =  generate_bins(minimum=0, maximum=get_maximum_frequency(words), bin_width=500)
-    dic = {"Range": "0-500" ,"Stars": [np.nan]} #Creating the columns of the data framw
-    df = pd.DataFrame(dic)
-
-    for i in bins:
-        df = df.append({'Range':i,'Stars':0},ignore_index=True)
-
-    for word in words.with_uses:
-        key = 'netflix'
-        if key in word['frequency'].keys():
-            df = df.append({"Range":bins[get_bins(word['frequency']['netflix'].frequency,bins)],"Stars":word['frequency']['netflix'].stars},ignore_index=True)
-
-    fig = px.histogram(
-            df,
-            'Range',
-            color='Range',
+    fig = px.bar(
+            x=labels,
+            y=counts,
+            color=labels,
             )
 
     # changing axis labels
-    fig.layout.xaxis.title.text = 'Frequency'
-    fig.layout.yaxis.title.text = 'Number of unique words'
+    fig.layout.xaxis.title.text = x_title
+    fig.layout.yaxis.title.text = y_title
 
     fig.update_layout(title_text=title,
                       title_x=0.5,
                       showlegend=False,
                       )
+    return fig
 
-    #TODO: make plot look nicer
-    fig.write_image(save_path)
-
-    # not doing html plots at the moment because
-    # it is kind of a pain to apply css to them
-    # pio.write_html(fig, file=save_path)
-
-    return save_path
-
-def get_bins(frequency: int, bins: List[str]) -> int:
+def histogram_counts(vocabulary: Vocabulary,
+                     list_name: str = HISTOGRAM_FREQUENCY_LIST,
+                     bin_width: int = 500
+                     ) -> Tuple[List[str], np.ndarray]:
     """
-    Determines which bin a word walls into
-    based on its frequency and the bins themselves
-    For example, with bins of width 500, a word with frequency
-    1301 will fall into the bin 1001-1500.
-    Returns the index in bins for the correct bin, i.e. with bin width
-    500 and frequency 1301, the function will return 2, as 1001-1500
-    is the 3rd bin in the elist.
+    Computes the frequency distribution of the (unique) words in the given
+    vocabulary, i.e. how many words have a frequency rank in each bin of
+    the given frequency list. Words with a frequency above the last bin
+    are counted in the last bin, and words that are not in the list are
+    left out. Returns the bin labels (see generate_bins) and the number of
+    words in each bin.
     Arguments:
-    frequency: int - The frequency of the word
-    bins: List[str] - A list of the bins in the format 'low-high', for example
-    ['0-500', '501-1000', '1001-1500', ...]
+    vocabulary: Vocabulary - The words used in the book
+    list_name: str (optional, default = 'netflix') - The frequency list to use
+    bin_width: int (optional, default = 500) - The width of the bins
     """
+    if list_name not in vocabulary.list_names:
+        return [], np.zeros(0, dtype=np.int64)
 
-    for i in range(len(bins)):
-        bin = bins[i].split("-")
-        assert len(bin) == 2, "Bin must have length 2"
-
-        low, high = bin
-        if frequency >= int(low) and frequency < int(high):
-            return i
+    ranks = np.asarray(vocabulary.ranks[:, vocabulary.list_names.index(list_name)])
+    ranks = ranks[ranks > 0]
+    maximum = int(ranks.max()) if len(ranks) else 0
+    bins = generate_bins(minimum=0, maximum=max(maximum, bin_width), bin_width=bin_width)
 
-    return (len(bins)-1)
+    indices = np.minimum(ranks // bin_width, len(bins) - 1)
+    counts = np.bincount(indices, minlength=len(bins))
+    return bins, counts
 
 def generate_bins(minimum: int, maximum: int, bin_width: int=500) -> List[str]:
     """
@@ -100,18 +94,73 @@ def generate_bins(minimum: int, maximum: int, bin_width: int=500) -> List[str]:
 
     return bins
 
-def get_maximum_frequency(words: WordAnalysis) -> int:
+def stars_counts(vocabulary: Vocabulary) -> Tuple[List[str], np.ndarray]:
     """
-    This functions gets the highest frequency present in all the
-    words.
+    Counts the unique words in the given vocabulary by their overall number
+    of frequency stars. Returns the labels ('N/A', '0 stars', ... '5 stars')
+    and the number of words with each.
     Arguments:
-    words: WordAnalysis - A WordAnalysis object describing the words
-    used in the book
+    vocabulary: Vocabulary - The words used in the book
     """
-    maximum_frequency = 0
-    for word in words.with_uses:
-        key = 'netflix'
-        if key in word['frequency'].keys():
-            maximum_frequency = max(maximum_frequency,word['frequency']['netflix'].frequency)
-    return maximum_frequency
+    labels = ['N/A'] + [f'{stars} stars' for stars in range(6)]
+    if vocabulary.overall is None:
+        return labels, np.array([len(vocabulary)] + [0] * 6)
+    overall = np.asarray(vocabulary.overall)
+    # N/A goes in bin 0, n stars in bin n + 1
+    indices = np.where(overall > 0, stars_from_frequencies(overall) + 1, 0)
+    return labels, np.bincount(indices, minlength=len(labels))
+
+def occurences_counts(vocabulary: Vocabulary) -> Tuple[List[str], np.ndarray]:
+    """
+    Counts the unique words in the given vocabulary by how many times they
+    occur in the book, using the bins in OCCURENCE_BINS. Returns the bin
+    labels (e.g. '1', '3-4', '100+') and the number of words in each bin.
+    Arguments:
+    vocabulary: Vocabulary - The words used in the book
+    """
+    labels = []
+    for low, high in zip(OCCURENCE_BINS, OCCURENCE_BINS[1:] + [None]):
+        if high is None:
+            labels.append(f'{low}+')
+        elif high - low == 1:
+            labels.append(str(low))
+        else:
+            labels.append(f'{low}-{high - 1}')
+    indices = np.digitize(np.asarray(vocabulary.counts), OCCURENCE_BINS) - 1
+    return labels, np.bincount(indices, minlength=len(labels))
+
+# The plots generated for every book
+PLOT_TYPES: Dict[str, PlotType] = {
+    'histogram': PlotType('Frequency distribution', 'Frequency',
+                          'Number of unique words', histogram_counts),
+    'stars': PlotType('Frequency stars', 'Overall frequency stars',
+                      'Number of unique words', stars_counts),
+    'occurences': PlotType('Occurence distribution', 'Number of occurences in the book',
+                           'Number of unique words', occurences_counts),
+}
+
+def plot_data(name: str, vocabulary: Vocabulary) -> dict:
+    """
+    Computes the pre-aggregated data for the plot of the given type,
+    in a form that can be stored as json
+    Arguments:
+    name: str - The type of plot, one of PLOT_TYPES
+    vocabulary: Vocabulary - The words used in the book
+    """
+    labels, counts = PLOT_TYPES[name].counts(vocabulary)
+    return {'labels': list(labels), 'counts': [int(count) for count in counts]}
 
+def plot_figure(name: str, data: dict, book_title: str) -> go.Figure:
+    """
+    Builds the figure for the plot of the given type from its data
+    Arguments:
+    name: str - The type of plot, one of PLOT_TYPES
+    data: dict - The data returned by plot_data
+    book_title: str - The title of the book
+    """
+    plot_type = PLOT_TYPES[name]
+    return bar_figure(data['labels'], data['counts'],
+                      title=f'{plot_type.title} for {book_title}',
+                      x_title=plot_type.x_title,
+                      y_title=plot_type.y_title
+                      )
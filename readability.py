@@ -0,0 +1,208 @@
+from typing import Dict, Hashable, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from text_normalisation import KANJI_REGEX
+from vocabulary import Vocabulary
+
+# The JLPT levels, from the easiest to the hardest
+JLPT_LEVELS = ('N5', 'N4', 'N3', 'N2', 'N1')
+# Level of the words that are not in the word list
+UNLISTED = len(JLPT_LEVELS)
+# Parts of speech (in ipadic and unidic) left out of the JLPT levels of a
+# text when lemmas are counted: particles, auxiliary verbs and symbols,
+# which are not in the word list but make up a large part of any text
+GRAMMAR_POS = {'助詞', '助動詞', '記号', '補助記号', '空白'}
+# Numbers of the most common words learned at which the coverage curve is given
+COVERAGE_POINTS = (100, 250, 500, 1000, 2000, 3000, 5000, 10000)
+# Percentages of the text for which the number of words needed is given
+COVERAGE_TARGETS = (80, 90, 95, 98)
+
+# The counts of a piece of text that the metrics are computed from, see
+# text_stats. Every column adds up, so the counts of a chapter (or of the
+# whole book) are the sums of the counts of its units.
+STAT_COLUMNS = ('words', 'sentences', 'chars', 'kanji') + JLPT_LEVELS + ('unlisted',)
+
+def parse_levels(lines: Iterable[str]) -> Tuple[Dict[str, int], bool]:
+    """
+    Returns the JLPT level (an index into JLPT_LEVELS) of every word in the
+    given lines of a word list, and whether any of the levels is estimated.
+    Each line holds a word, optionally followed by a tab and its level (e.g.
+    食べる<tab>N5). Words without a level are given an estimated one by their
+    position: the list is taken to be ordered from the easiest words to the
+    hardest and split into one equal band per level, which is only a rough
+    stand-in for the real levels (which are far from equal in size).
+    A word listed more than once keeps its first level.
+    Arguments:
+    lines: Iterable[str] - The lines of the word list
+    """
+    words = []
+    for line in lines:
+        fields = line.rstrip('\n').split('\t')
+        word = fields[0].strip()
+        if word:
+            level = fields[1].strip().upper() if len(fields) > 1 else ''
+            words.append((word, JLPT_LEVELS.index(level) if level in JLPT_LEVELS else None))
+    levels = {}
+    estimated = False
+    for i, (word, level) in enumerate(words):
+        if word not in levels:
+            levels[word] = level if level is not None else i * len(JLPT_LEVELS) // len(words)
+            estimated = estimated or level is None
+    return levels, estimated
+
+def load_levels(filename: str) -> Tuple[Dict[str, int], bool]:
+    """
+    Reads the JLPT word list in the given .txt file, see parse_levels
+    Arguments:
+    filename: str - The path to the word list
+    """
+    with open(filename, 'r', encoding='utf-8') as file:
+        return parse_levels(file)
+
+def text_stats(words: Mapping[str, int],
+               n_sentences: int,
+               n_chars: int,
+               levels: Dict[str, int],
+               lemmas: Optional[Mapping[Tuple[str, str], int]] = None,
+               cache: Optional[Dict[Hashable, tuple]] = None
+               ) -> np.ndarray:
+    """
+    Returns the counts (see STAT_COLUMNS) of a piece of text, from its word
+    counts, without going over the text itself again. Words are given a
+    JLPT level by their base form if the lemmas are given (e.g. 食べた as
+    食べる, leaving out GRAMMAR_POS), and as they are written otherwise.
+    Arguments:
+    words: Mapping[str, int] - The number of occurences of each word
+    n_sentences: int - The number of sentences
+    n_chars: int - The number of characters
+    levels: Dict[str, int] - The JLPT level of each word, see parse_levels
+    lemmas: Mapping[Tuple[str, str], int] (optional) - The number of
+    occurences of each (base form, part of speech), see tokenizer.TokenCounts
+    cache: Dict[Hashable, tuple] (optional) - What has been looked up about
+    each word and lemma so far, to share between the pieces of a text so
+    that every distinct word is only looked at once
+    """
+    if cache is None:
+        cache = {}
+    by_level = [0] * (UNLISTED + 1)
+    n_words = 0
+    n_kanji = 0
+    for word, n in words.items():
+        # (level, number of kanji)
+        features = cache.get(word)
+        if features is None:
+            features = cache[word] = (levels.get(word, UNLISTED), len(KANJI_REGEX.findall(word)))
+        if lemmas is None:
+            by_level[features[0]] += n
+        n_kanji += n * features[1]
+        n_words += n
+    for lemma, n in (lemmas or {}).items():
+        # (level,), or () for the parts of speech left out
+        features = cache.get(lemma)
+        if features is None:
+            base_form, pos = lemma
+            features = cache[lemma] = () if pos in GRAMMAR_POS else (levels.get(base_form, UNLISTED),)
+        if features:
+            by_level[features[0]] += n
+    return np.array([n_words, n_sentences, n_chars, n_kanji, *by_level], dtype=np.int64)
+
+def level_percentages(by_level: np.ndarray) -> Dict[str, float]:
+    """
+    Returns the given counts per level as percentages of their total, by
+    level name ('unlisted' for the words that are not in the word list)
+    Arguments:
+    by_level: np.ndarray - The count of each level, and of unlisted words last
+    """
+    total = by_level.sum()
+    names = JLPT_LEVELS + ('unlisted',)
+    return {name: round(float(n / total * 100), 2) if total else 0.0
+            for name, n in zip(names, by_level)}
+
+def describe(stats: np.ndarray) -> dict:
+    """
+    Returns the metrics of a piece of text given its counts, see text_stats:
+    its mean sentence length in words, its kanji density (the percentage of
+    its characters that are kanji) and the percentage of its words at each
+    JLPT level
+    Arguments:
+    stats: np.ndarray - The counts of the text
+    """
+    n_words, n_sentences, n_chars, n_kanji = stats[:4].tolist()
+    return {
+        'n_words': n_words,
+        'n_sentences': n_sentences,
+        'mean_sentence_length': round(n_words / n_sentences, 2) if n_sentences else 0.0,
+        'kanji_density': round(n_kanji / n_chars * 100, 2) if n_chars else 0.0,
+        'jlpt': level_percentages(stats[4:]),
+    }
+
+def coverage_curve(counts: np.ndarray,
+                   points: Sequence[int] = COVERAGE_POINTS,
+                   targets: Sequence[int] = COVERAGE_TARGETS
+                   ) -> dict:
+    """
+    Returns how much of a text is understood (the percentage of its words)
+    when knowing its n most common words, for every n in points and for
+    every word in the text, and how many of its most common words have to
+    be known to understand each of the percentages in targets
+    Arguments:
+    counts: np.ndarray - The number of occurences of each word of the text
+    points: Sequence[int] (optional, default = COVERAGE_POINTS) - The
+    numbers of words to give the coverage for
+    targets: Sequence[int] (optional, default = COVERAGE_TARGETS) - The
+    percentages to give the number of words needed for
+    """
+    covered = np.cumsum(np.sort(counts)[::-1])
+    total = int(covered[-1]) if len(covered) else 0
+    if not total:
+        return {'points': [], 'targets': {}}
+    curve = [{'words': n, 'coverage': round(float(covered[n - 1] / total * 100), 2)}
+             for n in points if n < len(covered)]
+    curve.append({'words': len(covered), 'coverage': 100.0})
+    return {
+        'points': curve,
+        'targets': {str(target): int(np.searchsorted(covered, total * target / 100)) + 1
+                    for target in targets},
+    }
+
+def readability(unit_stats: np.ndarray,
+                units_per_chapter: Sequence[int],
+                vocabulary: Vocabulary,
+                levels: Dict[str, int],
+                lemmas: Optional[Vocabulary] = None,
+                estimated: bool = False
+                ) -> dict:
+    """
+    Returns the difficulty metrics of a book (see describe), with the
+    coverage curve of its words table and the JLPT levels of its unique
+    words (or lemmas), and the metrics of each of its chapters:
+    {'book': {...}, 'chapters': [{'chapter': 1, ...}, ...], 'jlpt_estimated': False}
+    Arguments:
+    unit_stats: np.ndarray - The counts of each unit of the book (one row
+    per unit, see text_stats), in order
+    units_per_chapter: Sequence[int] - The number of units in each chapter
+    vocabulary: Vocabulary - The words table of the book
+    levels: Dict[str, int] - The JLPT level of each word, see parse_levels
+    lemmas: Vocabulary (optional) - The lemmas table of the book, if the
+    unit counts were computed from lemmas
+    estimated: bool (optional, default = False) - Whether the levels are
+    estimated from the position of the words in the word list, see parse_levels
+    """
+    book = describe(unit_stats.sum(axis=0))
+    if lemmas is not None:
+        grammar = np.isin(lemmas.pos, [i for i, pos in enumerate(lemmas.pos_names) if pos in GRAMMAR_POS])
+        items = (item for item, skip in zip(lemmas.items, grammar.tolist()) if not skip)
+        n_items = len(lemmas) - int(grammar.sum())
+    else:
+        items, n_items = vocabulary.items, len(vocabulary)
+    item_levels = np.fromiter((levels.get(item, UNLISTED) for item in items), dtype=np.int64, count=n_items)
+    book['jlpt_unique'] = level_percentages(np.bincount(item_levels, minlength=UNLISTED + 1))
+    book['coverage'] = coverage_curve(vocabulary.counts)
+
+    chapters: List[dict] = []
+    start = 0
+    for i, n_units in enumerate(units_per_chapter):
+        chapters.append({'chapter': i + 1, **describe(unit_stats[start:start + n_units].sum(axis=0))})
+        start += n_units
+    return {'book': book, 'chapters': chapters, 'jlpt_estimated': estimated}
@@ -0,0 +1,206 @@
+import hashlib
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Set, Tuple, Optional
+
+import MeCab
+
+from analysis import process_wordlist
+from frequency_index import FrequencyIndex, frequency_list_signature, load_frequency_index
+from constants import MECAB_ARGS, MECAB_BASE_FORM_FIELD, FREQUENCY_LIST_DIR, FREQUENCY_INDEX_FILE, KNOWN_WORDS_FILE, PIPELINE_VERSION, COUNT_LEMMAS
+from constants import INDEX_SENTENCES, COUNT_NGRAMS, NGRAM_CAPACITY, JLPT_WORD_LIST_FILE
+from readability import load_levels
+
+class Resources:
+    """
+    Registry for the expensive, read-only resources used by the analysis
+    pipeline: the MeCab tagger (one per thread), the frequency lists, the
+    known-word list and the JLPT word list. Each resource is loaded lazily on first use and then
+    kept for the lifetime of the process. The frequency lists and the word
+    lists are reloaded when the files they were loaded from change on disk.
+    """
+    def __init__(self,
+                 mecab_args: str = MECAB_ARGS,
+                 frequency_list_dir: str = FREQUENCY_LIST_DIR,
+                 known_words_file: str = KNOWN_WORDS_FILE,
+                 frequency_index_file: str = FREQUENCY_INDEX_FILE,
+                 jlpt_word_list_file: str = JLPT_WORD_LIST_FILE
+                 ):
+        self.mecab_args = mecab_args
+        self.frequency_list_dir = frequency_list_dir
+        self.frequency_index_file = frequency_index_file
+        self.known_words_file = known_words_file
+        self.jlpt_word_list_file = jlpt_word_list_file
+        # name of resource -> seconds the last load took
+        self.timings: Dict[str, float] = {}
+        # name of resource -> number of times it has been loaded
+        self.loads: Dict[str, int] = {}
+
+        self._lock = threading.RLock()
+        # MeCab taggers are not thread-safe, so every thread gets its own
+        self._local = threading.local()
+        self._frequency_index: Optional[FrequencyIndex] = None
+        self._frequency_lists_signature: Tuple = ()
+        self._known_words: Optional[Set[str]] = None
+        self._known_words_signature: Tuple = ()
+        self._jlpt_levels: Optional[Dict[str, int]] = None
+        self._jlpt_levels_estimated = False
+        self._jlpt_levels_signature: Tuple = ()
+
+    def _record(self, name: str, start: float) -> None:
+        self.timings[name] = time.perf_counter() - start
+        self.loads[name] = self.loads.get(name, 0) + 1
+
+    @property
+    def tagger(self):
+        """
+        The MeCab tagger of the calling thread, created on first use in each
+        thread, since analyses running in different threads (see
+        jobs.JobQueue) must not parse with the same tagger
+        """
+        tagger = getattr(self._local, 'tagger', None)
+        if tagger is None:
+            start = time.perf_counter()
+            tagger = self._local.tagger = MeCab.Tagger(self.mecab_args)
+            with self._lock:
+                self._record('tagger', start)
+        return tagger
+
+    def frequency_list_signature(self) -> Tuple:
+        """
+        Returns a tuple describing the current state of the frequency list
+        files (name, modification time and size of each file). The frequency
+        lists are reloaded whenever this changes.
+        """
+        return frequency_list_signature(self.frequency_list_dir)
+
+    @property
+    def frequency_index(self) -> FrequencyIndex:
+        """All the frequency lists in the frequency list directory, merged into one index"""
+        with self._lock:
+            signature = self.frequency_list_signature()
+            if self._frequency_index is None or signature != self._frequency_lists_signature:
+                start = time.perf_counter()
+                self._frequency_index = load_frequency_index(self.frequency_list_dir,
+                                                             self.frequency_index_file)
+                self._frequency_lists_signature = self._frequency_index.signature
+                self._record('frequency_index', start)
+            return self._frequency_index
+
+    @property
+    def known_words(self) -> Set[str]:
+        """The set of words in the known-word list"""
+        with self._lock:
+            stat = Path(self.known_words_file).stat()
+            signature = (stat.st_mtime_ns, stat.st_size)
+            if self._known_words is None or signature != self._known_words_signature:
+                start = time.perf_counter()
+                self._known_words = process_wordlist(self.known_words_file)
+                self._known_words_signature = signature
+                self._record('known_words', start)
+            return self._known_words
+
+    def jlpt_word_list_signature(self) -> Tuple:
+        """
+        Returns a tuple describing the current state of the JLPT word list
+        file (modification time and size). It is reloaded whenever this changes.
+        """
+        stat = Path(self.jlpt_word_list_file).stat()
+        return (stat.st_mtime_ns, stat.st_size)
+
+    @property
+    def jlpt_levels(self) -> Dict[str, int]:
+        """The JLPT level of every word in the JLPT word list, see readability.parse_levels"""
+        with self._lock:
+            signature = self.jlpt_word_list_signature()
+            if self._jlpt_levels is None or signature != self._jlpt_levels_signature:
+                start = time.perf_counter()
+                self._jlpt_levels, self._jlpt_levels_estimated = load_levels(self.jlpt_word_list_file)
+                self._jlpt_levels_signature = signature
+                self._record('jlpt_levels', start)
+            return self._jlpt_levels
+
+    @property
+    def jlpt_levels_estimated(self) -> bool:
+        """Whether any of the JLPT levels is estimated, see readability.parse_levels"""
+        with self._lock:
+            self.jlpt_levels
+            return self._jlpt_levels_estimated
+
+    def dictionary_signature(self) -> Tuple:
+        """
+        Returns a tuple describing the dictionaries loaded by
+        the MeCab tagger (filename, version and size of each)
+        """
+        dictionaries = []
+        dictionary = self.tagger.dictionary_info()
+        while dictionary:
+            dictionaries.append((dictionary.filename, dictionary.version, dictionary.size))
+            dictionary = dictionary.next
+        return tuple(dictionaries)
+
+    def tokenizer_version(self) -> str:
+        """
+        Returns a key identifying everything that affects how a text is
+        tokenized and counted: the pipeline version, the MeCab dictionary,
+        whether (and how) lemmas are counted, whether sentences are
+        indexed and how n-grams are counted. Checkpointed counts with a different key are out of date.
+        """
+        with self._lock:
+            state = [
+                PIPELINE_VERSION,
+                self.dictionary_signature(),
+                [COUNT_LEMMAS, MECAB_BASE_FORM_FIELD],
+                INDEX_SENTENCES,
+                [COUNT_NGRAMS, NGRAM_CAPACITY],
+            ]
+        return hashlib.sha256(json.dumps(state).encode('utf-8')).hexdigest()[:16]
+
+    def analysis_version(self) -> str:
+        """
+        Returns a key identifying everything that affects the result of an
+        analysis: the tokenizer version, the frequency lists and the JLPT
+        word list. Stored analyses with a different key are out of date.
+        Known words are not part of the analysis, see known_words.py.
+        """
+        with self._lock:
+            state = [
+                self.tokenizer_version(),
+                self.frequency_list_signature(),
+                self.jlpt_word_list_signature(),
+            ]
+        return hashlib.sha256(json.dumps(state).encode('utf-8')).hexdigest()[:16]
+
+    def preload(self) -> None:
+        """Loads the resources used by the analysis pipeline up front instead of on first use"""
+        self.tagger
+        self.frequency_index
+
+    def info(self) -> dict:
+        """
+        Returns a dictionary describing the loaded resources and
+        how long they took to load
+        """
+        return {
+            'timings': dict(self.timings),
+            'loads': dict(self.loads),
+            'frequency_lists': [name for name, _, _ in self._frequency_lists_signature],
+            'n_known_words': len(self._known_words) if self._known_words is not None else None,
+            'tagger_loaded': 'tagger' in self.loads,
+        }
+
+_resources: Optional[Resources] = None
+_resources_lock = threading.Lock()
+
+def get_resources() -> Resources:
+    """
+    Returns the process-wide Resources instance,
+    creating it on first use.
+    """
+    global _resources
+    with _resources_lock:
+        if _resources is None:
+            _resources = Resources()
+        return _resources
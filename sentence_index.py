@@ -0,0 +1,177 @@
+from itertools import chain
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+from storage import book_dir, load_items, load_summary, load_table, save_items, _load_array, _save_array
+from tokenizer import split_sentences
+from vocabulary import Vocabulary
+
+# Per book, the sentences are stored like the items of a table (see
+# storage.save_items), and the index from word ids (in the words table) to the
+# sentences each word occurs in as a compressed sparse row matrix:
+#   sentences.items.bin    the utf-8 encoded sentences, back to back
+#   sentences.offsets.npy  int64 start offset of each sentence (plus the end)
+#   postings.offsets.npy   int64 start of each word's sentence ids in
+#                          postings.ids.npy (plus the end), by word id
+#   postings.ids.npy       int32 sentence ids, in order for each word
+SENTENCES_NAME = 'sentences'
+POSTINGS_NAME = 'postings'
+# Number of characters of context shown on either side of a word
+CONTEXT_WIDTH = 30
+
+class SentenceIndex:
+    """
+    The sentences of a book, and for every word in its words table the
+    sentences the word occurs in, so that a word can be shown in context
+    (see concordance) without tokenizing the text again.
+    Arguments:
+    sentences: Sequence[str] - The sentences of the book, in order
+    offsets: np.ndarray - Start of each word's sentence ids in ids (plus the end)
+    ids: np.ndarray - The sentence ids of every word, word after word
+    """
+    def __init__(self, sentences: Sequence[str], offsets: np.ndarray, ids: np.ndarray):
+        self.sentences = sentences
+        self.offsets = offsets
+        self.ids = ids
+
+    @classmethod
+    def build(cls,
+              units: Sequence[str],
+              postings: Dict[str, List[int]],
+              vocabulary: Vocabulary
+              ) -> 'SentenceIndex':
+        """
+        Builds the index of a book from the sentences each word occurs in
+        Arguments:
+        units: Sequence[str] - The text of the book, see tokenizer.split_units
+        postings: Dict[str, List[int]] - The sentences each word occurs in,
+        see tokenizer.count_units
+        vocabulary: Vocabulary - The words table of the book
+        """
+        sentences = [sentence.rstrip('\n') for unit in units for sentence in split_sentences(unit)]
+        lists = [postings.get(word, ()) for word in vocabulary.items]
+        offsets = np.zeros(len(lists) + 1, dtype=np.int64)
+        np.cumsum([len(ids) for ids in lists], out=offsets[1:])
+        ids = np.fromiter(chain.from_iterable(lists), dtype=np.int32, count=int(offsets[-1]))
+        return cls(sentences, offsets, ids)
+
+    def save(self, directory: Path) -> None:
+        """
+        Writes the index to the given book directory
+        Arguments:
+        directory: Path - The directory of the book
+        """
+        directory = Path(directory)
+        save_items(directory, SENTENCES_NAME, self.sentences)
+        _save_array(directory / f'{POSTINGS_NAME}.offsets.npy', self.offsets)
+        _save_array(directory / f'{POSTINGS_NAME}.ids.npy', self.ids)
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional['SentenceIndex']:
+        """
+        Loads the index saved in the given book directory, memory-mapping
+        it, or returns None if the book has no index
+        Arguments:
+        directory: Path - The directory of the book
+        """
+        directory = Path(directory)
+        try:
+            return cls(load_items(directory, SENTENCES_NAME),
+                       _load_array(directory / f'{POSTINGS_NAME}.offsets.npy'),
+                       _load_array(directory / f'{POSTINGS_NAME}.ids.npy'))
+        except FileNotFoundError:
+            return None
+
+    def __len__(self) -> int:
+        return len(self.sentences)
+
+    def sentence_ids(self, word_id: int) -> np.ndarray:
+        """
+        Returns the ids of the sentences the word with the given id occurs in
+        Arguments:
+        word_id: int - The id of the word in the words table
+        """
+        return self.ids[self.offsets[word_id]:self.offsets[word_id + 1]]
+
+    def concordance(self,
+                    word: str,
+                    word_id: int,
+                    offset: int = 0,
+                    limit: Optional[int] = None,
+                    width: int = CONTEXT_WIDTH
+                    ) -> List[dict]:
+        """
+        Returns the sentences the given word occurs in as keyword in context
+        lines: {'sentence': id, 'left': ..., 'word': ..., 'right': ...}, with
+        at most width characters of context on either side. The sentence is
+        split at the first occurence of the word in it, which may be inside
+        another word if the word also occurs on its own later on.
+        Arguments:
+        word: str - The word
+        word_id: int - The id of the word in the words table
+        offset: int (optional, default = 0) - The number of sentences to skip
+        limit: int (optional) - The most number of lines to return, all if None
+        width: int (optional, default = CONTEXT_WIDTH) - The number of
+        characters of context
+        """
+        ids = self.sentence_ids(word_id)
+        end = None if limit is None else offset + limit
+        lines = []
+        for i in ids[offset:end].tolist():
+            sentence = self.sentences[i]
+            start = sentence.find(word)
+            if start == -1:
+                # the token was cleaned (see clean_token), show the sentence as is
+                lines.append({'sentence': i, 'left': '', 'word': '', 'right': sentence[:2 * width]})
+                continue
+            lines.append({
+                'sentence': i,
+                'left': sentence[max(start - width, 0):start],
+                'word': sentence[start:start + len(word)],
+                'right': sentence[start + len(word):start + len(word) + width],
+            })
+        return lines
+
+def book_concordance(file_hash: str,
+                     word: str,
+                     offset: int = 0,
+                     limit: Optional[int] = None,
+                     width: int = CONTEXT_WIDTH,
+                     summary: Optional[dict] = None
+                     ) -> Optional[dict]:
+    """
+    Returns the number of occurences of the given word in the book with
+    the given hash, the number of sentences it occurs in and (a page of)
+    those sentences as keyword in context lines, see
+    SentenceIndex.concordance. Returns None if the book has no sentence index.
+    Arguments:
+    file_hash: str - The sha256sum hash of the book
+    word: str - The word to look up
+    offset: int (optional, default = 0) - The number of sentences to skip
+    limit: int (optional) - The most number of lines to return, all if None
+    width: int (optional, default = CONTEXT_WIDTH) - The number of
+    characters of context
+    summary: dict (optional) - The summary of the book, loaded if not given
+    """
+    if summary is None:
+        summary = load_summary(file_hash)
+    # books analysed without INDEX_SENTENCES may have an index left over
+    # from an earlier analysis, which no longer matches the words table
+    if summary is None or 'n_sentences' not in summary:
+        return None
+    directory = book_dir(file_hash)
+    index = SentenceIndex.load(directory)
+    if index is None:
+        return None
+    words = load_table(directory, 'words', summary['tables']['words'])
+    word_id = words.id(word)
+    if word_id is None:
+        return {'word': word, 'occurences': 0, 'n_sentences': 0, 'lines': []}
+    return {
+        'word': word,
+        'occurences': int(words.counts[word_id]),
+        'n_sentences': len(index.sentence_ids(word_id)),
+        'lines': index.concordance(word, word_id, offset=offset, limit=limit, width=width),
+    }
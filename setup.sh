@@ -3,7 +3,6 @@ sudo apt update
 sudo apt install mecab mecab-ipadic libmecab-dev
 sudo apt install mecab-ipadic-utf8
 sudo apt install make
-sudo apt install pandoc
 
 sudo apt install git curl
 git clone https://github.com/neologd/mecab-ipadic-neologd.git
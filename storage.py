@@ -0,0 +1,312 @@
+import json
+import mmap
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Iterator, Optional, Sequence
+
+import numpy as np
+import simplejson
+
+from constants import BOOKS_FOLDER
+from vocabulary import Vocabulary, SORT_ORDERS
+
+# Per book, the small summary (title, authors, counts, ...) is stored as
+# json in SUMMARY_FILE, and each large table ('words', 'chars') is stored
+# column by column next to it:
+#   <table>.items.bin    the utf-8 encoded items, back to back
+#   <table>.offsets.npy  int64 start offset of each item in items.bin (plus the end)
+#   <table>.counts.npy   int64 number of occurences of each item
+#   <table>.ranks.npy    int32 (items x frequency lists) frequency ranks
+#   <table>.overall.npy  int64 overall frequency rank
+#   <table>.pos.npy      int16 part of speech id of each item (lemma table only)
+#   <table>.order.<by>.npy  int32 item ids sorted by frequency or stars, see Vocabulary.order
+# The columns are memory-mapped when loaded, so only the parts
+# that are actually used are ever read from disk.
+SUMMARY_FILE = 'summary.json'
+# Timings and peak memory of each stage of the analysis (see metrics.Profile),
+# kept apart from the summary since they are only known once it is saved.
+# PROFILE_STATS_FILE holds the cProfile statistics of captured analyses.
+PROFILE_FILE = 'profile.json'
+PROFILE_STATS_FILE = 'profile.pstats'
+LEGACY_FILE = 'book_data.json'
+TABLES = ('words', 'chars', 'lemmas')
+HASH_REGEX = re.compile(r'^[0-9a-f]{64}$')
+
+class StoredItems(Sequence):
+    """
+    Read-only sequence of strings backed by a memory-mapped utf-8 blob
+    and an array of offsets into it. Items are decoded on access.
+    """
+    def __init__(self, blob, offsets: np.ndarray):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].decode('utf-8')
+
+    def find(self, item: str) -> Optional[int]:
+        """
+        Returns the index of the given item, or None if it is not in the
+        sequence, by searching the blob directly instead of decoding
+        every item
+        Arguments:
+        item: str - The item to look for
+        """
+        encoded = item.encode('utf-8')
+        if not encoded:
+            return None
+        start = self.blob.find(encoded)
+        while start != -1:
+            # the match may start or end in the middle of other items
+            i = int(np.searchsorted(self.offsets, start, side='right')) - 1
+            if self.offsets[i] == start and self.offsets[i + 1] == start + len(encoded):
+                return i
+            start = self.blob.find(encoded, start + 1)
+        return None
+
+    def __iter__(self) -> Iterator[str]:
+        blob = self.blob
+        offsets = self.offsets.tolist()
+        for start, end in zip(offsets, offsets[1:]):
+            yield blob[start:end].decode('utf-8')
+
+def book_dir(file_hash: str) -> Path:
+    """
+    Returns the directory the data for the book with the given hash is stored in
+    Arguments:
+    file_hash: str - The sha256sum hash of the book
+    """
+    return Path(BOOKS_FOLDER) / file_hash
+
+def is_book_hash(value: str) -> bool:
+    """
+    Returns whether the given string is a valid book hash (a sha256 hex
+    digest), and so safe to use as the name of a book directory
+    Arguments:
+    value: str - The string to check
+    """
+    return bool(HASH_REGEX.match(value))
+
+def _tmp_path(path: Path) -> Path:
+    # unique per process and thread, so writers of the same file (e.g. two
+    # analyses of the same book) never write to each other's temporary file
+    return path.with_name(f'{path.name}.{os.getpid()}.{threading.get_ident()}.tmp')
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, 'wb') as file:
+        file.write(data)
+    os.replace(tmp_path, path)
+
+def _save_array(path: Path, array: np.ndarray) -> None:
+    tmp_path = _tmp_path(path)
+    with open(tmp_path, 'wb') as file:
+        np.save(file, array)
+    os.replace(tmp_path, path)
+
+def _load_array(path: Path) -> np.ndarray:
+    return np.load(path, mmap_mode='r')
+
+def save_items(directory: Path, name: str, items: Sequence[str]) -> None:
+    """
+    Writes the given strings to <name>.items.bin and <name>.offsets.npy
+    in the given directory, see StoredItems
+    Arguments:
+    directory: Path - The directory to write to
+    name: str - The name of the files, e.g. 'words'
+    items: Sequence[str] - The strings to write
+    """
+    encoded = [item.encode('utf-8') for item in items]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(item) for item in encoded], out=offsets[1:])
+    _write_atomic(directory / f'{name}.items.bin', b''.join(encoded))
+    _save_array(directory / f'{name}.offsets.npy', offsets)
+
+def load_items(directory: Path, name: str) -> StoredItems:
+    """
+    Memory-maps the strings written by save_items
+    Arguments:
+    directory: Path - The directory the strings were written to
+    name: str - The name of the files, e.g. 'words'
+    """
+    with open(directory / f'{name}.items.bin', 'rb') as file:
+        if os.fstat(file.fileno()).st_size:
+            blob = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            blob = b''
+    return StoredItems(blob, _load_array(directory / f'{name}.offsets.npy'))
+
+def save_table(directory: Path, name: str, vocabulary: Vocabulary) -> dict:
+    """
+    Writes the columns of the given vocabulary to the given directory,
+    and returns the metadata needed to load it again
+    Arguments:
+    directory: Path - The directory of the book
+    name: str - The name of the table, e.g. 'words'
+    vocabulary: Vocabulary - The table to save
+    """
+    save_items(directory, name, vocabulary.items)
+    _save_array(directory / f'{name}.counts.npy', np.asarray(vocabulary.counts, dtype=np.int64))
+    _save_array(directory / f'{name}.ranks.npy', np.asarray(vocabulary.ranks, dtype=np.int32))
+    if vocabulary.overall is not None:
+        _save_array(directory / f'{name}.overall.npy', np.asarray(vocabulary.overall, dtype=np.int64))
+
+    metadata = {
+        'key': vocabulary.key,
+        'list_names': vocabulary.list_names,
+        'length': len(vocabulary),
+    }
+    if vocabulary.pos is not None:
+        _save_array(directory / f'{name}.pos.npy', np.asarray(vocabulary.pos, dtype=np.int16))
+        metadata['pos_names'] = vocabulary.pos_names
+    # the ids are already sorted by occurences
+    for by in SORT_ORDERS[1:]:
+        _save_array(directory / f'{name}.order.{by}.npy', vocabulary.order(by))
+    return metadata
+
+def load_table(directory: Path, name: str, metadata: dict) -> Vocabulary:
+    """
+    Loads a table saved with save_table, memory-mapping its columns
+    Arguments:
+    directory: Path - The directory of the book
+    name: str - The name of the table, e.g. 'words'
+    metadata: dict - The metadata returned by save_table
+    """
+    overall_path = directory / f'{name}.overall.npy'
+    # tables stored before the orders were saved compute them when needed
+    orders = {by: _load_array(directory / f'{name}.order.{by}.npy') for by in SORT_ORDERS[1:]
+              if (directory / f'{name}.order.{by}.npy').exists()}
+    return Vocabulary(load_items(directory, name),
+                      _load_array(directory / f'{name}.counts.npy'),
+                      key=metadata['key'],
+                      list_names=metadata['list_names'],
+                      ranks=_load_array(directory / f'{name}.ranks.npy'),
+                      overall=_load_array(overall_path) if overall_path.exists() else None,
+                      pos=_load_array(directory / f'{name}.pos.npy') if 'pos_names' in metadata else None,
+                      pos_names=metadata.get('pos_names', ()),
+                      orders=orders
+                      )
+
+def save_book(book_data: dict) -> Path:
+    """
+    Saves the analysis of a book. The Vocabulary tables in book_data
+    ('words' and 'chars') are stored as columns, and everything else as
+    the summary. The summary is written last, so a book only counts as
+    stored once all of its tables are complete. Returns the path of the
+    summary file.
+    Arguments:
+    book_data: dict - The analysis, as built by book_utils.analyse_ebook
+    """
+    directory = book_dir(book_data['file_hash'])
+    directory.mkdir(parents=True, exist_ok=True)
+
+    summary = {key: value for key, value in book_data.items() if key not in TABLES}
+    summary['tables'] = {name: save_table(directory, name, book_data[name])
+                         for name in TABLES if name in book_data}
+
+    summary_path = directory / SUMMARY_FILE
+    _write_atomic(summary_path, simplejson.dumps(summary).encode('utf-8'))
+    return summary_path
+
+def load_summary(file_hash: str) -> Optional[dict]:
+    """
+    Returns the summary of the book with the given hash (everything but the
+    word and character tables), or None if the book has not been analysed.
+    Books stored as a single book_data.json by older versions are
+    still supported.
+    Arguments:
+    file_hash: str - The sha256sum hash of the book
+    """
+    directory = book_dir(file_hash)
+    try:
+        with open(directory / SUMMARY_FILE, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        pass
+    except json.JSONDecodeError:
+        return None
+
+    try:
+        with open(directory / LEGACY_FILE, 'r', encoding='utf-8') as file:
+            book_data = json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+    for name in TABLES:
+        book_data.pop(name, None)
+    book_data['legacy'] = True
+    return book_data
+
+def save_profile(file_hash: str, profile: dict) -> Path:
+    """
+    Saves the profile of the analysis of the book with the
+    given hash, see metrics.Profile. Returns the path of the file.
+    Arguments:
+    file_hash: str - The sha256sum hash of the book
+    profile: dict - The profile, see metrics.Profile.to_dict
+    """
+    path = book_dir(file_hash) / PROFILE_FILE
+    _write_atomic(path, json.dumps(profile).encode('utf-8'))
+    return path
+
+def load_profile(file_hash: str) -> Optional[dict]:
+    """
+    Returns the profile of the analysis of the book with the given hash,
+    or None if it has none (e.g. it was analysed by an older version)
+    Arguments:
+    file_hash: str - The sha256sum hash of the book
+    """
+    try:
+        with open(book_dir(file_hash) / PROFILE_FILE, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+def load_tables(file_hash: str, summary: dict = None) -> Dict[str, Vocabulary]:
+    """
+    Returns the memory-mapped word and character tables
+    of the book with the given hash
+    Arguments:
+    file_hash: str - The sha256sum hash of the book
+    summary: dict (optional) - The summary of the book, loaded if not given
+    """
+    if summary is None:
+        summary = load_summary(file_hash)
+    if summary is None:
+        raise FileNotFoundError(f'No analysed book with hash {file_hash}')
+    directory = book_dir(file_hash)
+    return {name: load_table(directory, name, metadata)
+            for name, metadata in summary.get('tables', {}).items()}
+
+def load_book(file_hash: str) -> Optional[dict]:
+    """
+    Returns the full analysis of the book with the given hash, or None if
+    the book has not been analysed. The word and character tables are
+    memory-mapped Vocabulary objects, which simplejson serializes (with
+    for_json=True and iterable_as_array=True) to the lists of dictionaries
+    that used to be stored in book_data.json.
+    Arguments:
+    file_hash: str - The sha256sum hash of the book
+    """
+    summary = load_summary(file_hash)
+    if summary is None:
+        return None
+    if summary.pop('legacy', False):
+        with open(book_dir(file_hash) / LEGACY_FILE, 'r', encoding='utf-8') as file:
+            return json.load(file)
+
+    book_data = dict(summary)
+    del book_data['tables']
+    for name, table in load_tables(file_hash, summary).items():
+        book_data[name] = table
+    return book_data
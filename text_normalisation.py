@@ -0,0 +1,59 @@
+import re
+
+# The ranges of characters kept when filtering japanese text:
+# CJK symbols and punctuation (without the ideographic space U+3000),
+# hiragana, katakana, half/full-width forms, CJK unified ideographs,
+# black/white stars, arrows and the reference mark ※
+JAPANESE_CHARACTERS = (
+    '\u3001-\u303F'
+    '\u3040-\u309F'
+    '\u30A0-\u30FF'
+    '\uFF00-\uFFEF'
+    '\u4E00-\u9FAF'
+    '\u2605-\u2606'
+    '\u2190-\u2195'
+    '\u203B'
+)
+
+NON_JAPANESE_REGEX = re.compile(f'[^{JAPANESE_CHARACTERS}]+')
+
+# The ranges of characters counted as kanji: CJK unified ideographs (and
+# extension A), CJK compatibility ideographs and the repetition mark 々
+KANJI_CHARACTERS = (
+    '\u3400-\u4DBF'
+    '\u4E00-\u9FFF'
+    '\uF900-\uFAFF'
+    '\u3005'
+)
+
+KANJI_REGEX = re.compile(f'[{KANJI_CHARACTERS}]')
+
+# Characters removed from every token. Note that this is a raw string,
+# so the \u, \t, \r and \s in it are a backslash followed by a letter,
+# not escape sequences; all of these are removed from tokens.
+TOKEN_FILTER_CHARS = r'()./,!:?\uksa0123456789\t\r\s .'
+
+# Every whitespace character lies below U+3001,
+# so there is no need to check the rest of unicode
+WHITESPACE_CHARS = ''.join(chr(c) for c in range(0x3001) if chr(c).isspace())
+
+TOKEN_FILTER_TABLE = str.maketrans('', '', TOKEN_FILTER_CHARS + WHITESPACE_CHARS)
+
+def filter_japanese_text(text: str) -> str:
+    """
+    Removes every character that is not japanese text (see
+    JAPANESE_CHARACTERS) from the given text in a single pass,
+    and returns the filtered text.
+    Arguments:
+    text: str - The text to filter
+    """
+    return NON_JAPANESE_REGEX.sub('', text)
+
+def clean_token(surface: str) -> str:
+    """
+    Removes whitespace, punctuation and digits from the surface form
+    of a token. Returns an empty string if nothing is left.
+    Arguments:
+    surface: str - The surface form of the token
+    """
+    return surface.translate(TOKEN_FILTER_TABLE)
@@ -0,0 +1,425 @@
+import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+import MeCab
+import numpy as np
+
+from constants import MECAB_ARGS, MECAB_BASE_FORM_FIELD
+from ngrams import HeavyHitters, count_kanji_ngrams, count_word_ngrams, merge_ngrams
+from text_normalisation import clean_token
+
+# A sentence runs up to and including its closing punctuation or newline.
+# Anything left over at the end of the text without closing punctuation is
+# also treated as a sentence.
+SENTENCE_REGEX = re.compile(r'[^。！？\n]*[。！？\n]+|[^。！？\n]+$')
+SENTENCE_END_REGEX = re.compile(r'[。！？\n]+')
+
+# Sentences longer than this are parsed in several pieces so that
+# a text without any punctuation is never handed to MeCab in one go
+MAX_CHUNK_LENGTH = 10000
+
+# MeCab node stat values for the beginning and end of sentence nodes
+BOS_NODE = 2
+EOS_NODE = 3
+
+def split_sentences(text: str) -> Iterator[str]:
+    """
+    Lazily splits the given text into sentences at sentence-final
+    punctuation (。！？) and newlines.
+    Arguments:
+    text: str - The text to split
+    """
+    for match in SENTENCE_REGEX.finditer(text):
+        sentence = match.group()
+        for i in range(0, len(sentence), MAX_CHUNK_LENGTH):
+            yield sentence[i:i + MAX_CHUNK_LENGTH]
+
+class TokenCounts(NamedTuple):
+    # word -> occurences
+    words: Counter
+    # (base form, part of speech) -> occurences, if lemmas were counted
+    lemmas: Optional[Counter] = None
+    # word -> the numbers of the sentences it occurs in (in order, counting
+    # the sentences given by split_sentences from 0), if sentences were indexed
+    sentences: Optional[Dict[str, List[int]]] = None
+    # kind of n-gram (see ngrams.py) -> the counts of the most common
+    # n-grams of that kind, if n-grams were counted
+    ngrams: Optional[Dict[str, HeavyHitters]] = None
+    # the number of sentences, as given by split_sentences
+    n_sentences: Optional[int] = None
+
+# MeCab feature string -> (base form, part of speech). Nodes with the same
+# features share the same string, so each distinct one is only split once.
+# A base form of None means the word is not in the dictionary and the
+# (cleaned) surface form is used instead.
+_features: Dict[str, Tuple[Optional[str], str]] = {}
+# (surface, left and right context ids, word cost) -> (base form, part of
+# speech). These identify the dictionary entry a node came from and are
+# cheap to read, unlike the feature string, so the features are only read
+# for entries not seen before.
+_lemmas: Dict[Tuple[str, int, int, int], Tuple[Optional[str], str]] = {}
+MAX_CACHED_FEATURES = 1_000_000
+
+def parse_feature(feature: str) -> Tuple[Optional[str], str]:
+    """
+    Returns the base form and the (top-level) part of speech in the given
+    MeCab feature string, parsing each distinct string only once.
+    Arguments:
+    feature: str - The feature string of a node
+    """
+    parsed = _features.get(feature)
+    if parsed is None:
+        if len(_features) >= MAX_CACHED_FEATURES:
+            _features.clear()
+        fields = feature.split(',')
+        base_form = fields[MECAB_BASE_FORM_FIELD] if len(fields) > MECAB_BASE_FORM_FIELD else '*'
+        parsed = _features[feature] = (None if base_form in ('*', '') else base_form, fields[0])
+    return parsed
+
+def count_sentence(sentence: str, mt, words: Counter) -> None:
+    """
+    Parses a single sentence with mecab and adds
+    the (cleaned) words in it to the words Counter.
+    Arguments:
+    sentence: str - The sentence to parse
+    mt - A mecab tagger. Create using MeCab.Tagger
+    words: Counter - The word counts to add to
+    """
+    node = mt.parseToNode(sentence)
+    while node:
+        if node.stat != BOS_NODE and node.stat != EOS_NODE:
+            word = clean_token(node.surface)
+            if word:
+                words[word] += 1
+        node = node.next
+
+def count_entries(sentence: str,
+                  mt,
+                  entries: Dict[tuple, int],
+                  lemmas: Dict[tuple, Tuple[str, str]],
+                  postings: Optional[Dict[tuple, List[int]]] = None,
+                  sentence_id: int = 0,
+                  sequence: Optional[List[int]] = None
+                  ) -> None:
+    """
+    Parses a single sentence with mecab and counts the dictionary entries
+    (surface, left and right context ids, word cost) of its nodes. The
+    lemma of every entry not seen before is added to lemmas. Counting
+    entries instead of words means a token is only cleaned, and its
+    features only read, once per distinct entry instead of once per token.
+    Arguments:
+    sentence: str - The sentence to parse
+    mt - A mecab tagger. Create using MeCab.Tagger
+    entries: Dict[tuple, int] - The entry counts to add to, or with a
+    sequence, the number of each entry in the order they were first seen
+    lemmas: Dict[tuple, Tuple[str, str]] - The lemma of each counted entry
+    postings: Dict[tuple, List[int]] (optional) - The numbers of the
+    sentences each entry occurs in, to add sentence_id to
+    sentence_id: int (optional, default = 0) - The number of the sentence
+    sequence: List[int] (optional) - The numbers (see entries) of the
+    entries of the text in order, to append those of the sentence to. The
+    entries are then counted by counting their numbers in the sequence.
+    """
+    node = mt.parseToNode(sentence)
+    while node:
+        if node.stat != BOS_NODE and node.stat != EOS_NODE:
+            entry = (node.surface, node.lcAttr, node.rcAttr, node.wcost)
+            n = entries.get(entry)
+            if n is None:
+                # the count so far of a new entry, or its number
+                n = 0 if sequence is None else len(entries)
+                lemma = _lemmas.get(entry)
+                if lemma is None:
+                    if len(_lemmas) >= MAX_CACHED_FEATURES:
+                        _lemmas.clear()
+                    base_form, pos = parse_feature(node.feature)
+                    lemma = _lemmas[entry] = (base_form, pos)
+                lemmas[entry] = lemma
+                if sequence is not None:
+                    entries[entry] = n
+            if sequence is None:
+                entries[entry] = n + 1
+            else:
+                sequence.append(n)
+            if postings is not None:
+                ids = postings.get(entry)
+                if ids is None:
+                    postings[entry] = [sentence_id]
+                elif ids[-1] != sentence_id:
+                    ids.append(sentence_id)
+        node = node.next
+
+def count_tokens(text: str,
+                 mt,
+                 lemmas: bool = False,
+                 index: bool = False,
+                 ngrams: bool = False
+                 ) -> TokenCounts:
+    """
+    Tokenizes the given text and returns the number of occurences of
+    each word and, if lemmas is True, of each lemma.
+    Arguments:
+    text: str - The text to tokenize
+    mt - A mecab tagger. Create using MeCab.Tagger
+    lemmas: bool (optional, default = False) - Whether to count lemmas too
+    index: bool (optional, default = False) - Whether to also record the
+    sentences each word occurs in, see TokenCounts.sentences
+    ngrams: bool (optional, default = False) - Whether to also count the
+    most common word and kanji n-grams, see TokenCounts.ngrams
+    """
+    counts = TokenCounts(Counter(), Counter() if lemmas else None, {} if index else None)
+    n_sentences = 0
+    if not lemmas and not index and not ngrams:
+        for sentence in split_sentences(text):
+            count_sentence(sentence, mt, counts.words)
+            n_sentences += 1
+        return counts._replace(n_sentences=n_sentences)
+
+    entries = {}
+    entry_lemmas = {}
+    postings = {} if index else None
+    # for n-grams, the numbers of the entries of the text in order (see
+    # count_entries), with -1 at the start of every sentence so that no
+    # n-gram spans two sentences
+    sequence = [] if ngrams else None
+    for sentence_id, sentence in enumerate(split_sentences(text)):
+        if ngrams:
+            sequence.append(-1)
+        count_entries(sentence, mt, entries, entry_lemmas, postings, sentence_id, sequence)
+        n_sentences += 1
+    counts = counts._replace(n_sentences=n_sentences)
+    if ngrams:
+        sequence = np.array(sequence, dtype=np.int64)
+        entries = dict(zip(entries, np.bincount(sequence[sequence >= 0],
+                                                minlength=len(entries)).tolist()))
+    # entries are in the order they were first seen, so words are
+    # inserted into counts.words in the same order as by count_sentence
+    merged = set()
+    # the id of the word of each entry, by number (ids are given in the
+    # order words were first seen), or -1 for entries cleaned away
+    word_ids = {}
+    entry_word_ids = []
+    for entry, n in entries.items():
+        word = clean_token(entry[0])
+        if ngrams:
+            entry_word_ids.append(word_ids.setdefault(word, len(word_ids)) if word else -1)
+        if word:
+            counts.words[word] += n
+            if lemmas:
+                base_form, pos = entry_lemmas[entry]
+                counts.lemmas[base_form or word, pos] += n
+            if index:
+                ids = counts.sentences.get(word)
+                if ids is None:
+                    counts.sentences[word] = postings[entry]
+                else:
+                    # the same word from several dictionary entries
+                    ids.extend(postings[entry])
+                    merged.add(word)
+    for word in merged:
+        counts.sentences[word] = sorted(set(counts.sentences[word]))
+    if ngrams:
+        # the -1 at the start of each sentence picks the -1 added at the
+        # end, so sentences and tokens cleaned away (e.g. punctuation) both
+        # break n-grams
+        ids = np.array(entry_word_ids + [-1], dtype=np.int64)[sequence]
+        summaries = count_word_ngrams(ids, np.array(list(word_ids), dtype=object))
+        merge_ngrams(summaries, count_kanji_ngrams(text))
+        counts = counts._replace(ngrams=summaries)
+    return counts
+
+def split_chunks(text: str, size: int) -> List[str]:
+    """
+    Splits the given text into pieces of at least size characters (except
+    for the last one), each ending at the first sentence boundary after
+    that. Where the text is split only depends on the text before the
+    split, so appending to a text keeps all but its last piece the same.
+    Arguments:
+    text: str - The text to split
+    size: int - The minimum length of a piece
+    """
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + size
+        if end < len(text):
+            match = SENTENCE_END_REGEX.search(text, end)
+            end = match.end() if match else len(text)
+        chunks.append(text[start:end])
+        start = end
+    return chunks
+
+# Texts shorter than this are always tokenized serially, since
+# handing them to the process pool costs more than it saves
+MIN_PARALLEL_LENGTH = 50000
+
+# Each worker gets this many shards on average, so that
+# a slow shard does not leave the other workers idle
+SHARDS_PER_WORKER = 4
+
+# Chapters longer than this are counted (and checkpointed) in
+# sentence-aligned chunks of about this length, see split_units
+UNIT_LENGTH = 100000
+
+_pools: Dict[int, ProcessPoolExecutor] = {}
+_worker_tagger = None
+
+def _init_worker(mecab_args: str) -> None:
+    global _worker_tagger
+    _worker_tagger = MeCab.Tagger(mecab_args)
+
+def _count_shard(shard: str, lemmas: bool, index: bool = False, ngrams: bool = False) -> TokenCounts:
+    return count_tokens(shard, _worker_tagger, lemmas, index, ngrams)
+
+def get_pool(workers: int) -> ProcessPoolExecutor:
+    """
+    Returns the process pool with the given number of workers, creating it
+    on first use. Each worker process holds its own mecab tagger.
+    Arguments:
+    workers: int - The number of worker processes
+    """
+    if workers not in _pools:
+        _pools[workers] = ProcessPoolExecutor(max_workers=workers,
+                                              initializer=_init_worker,
+                                              initargs=(MECAB_ARGS,)
+                                              )
+    return _pools[workers]
+
+def merge_counts(parts: Sequence[TokenCounts],
+                 lemmas: bool = False,
+                 index: bool = False,
+                 ngrams: bool = False
+                 ) -> TokenCounts:
+    """
+    Merges the counts of consecutive sentence-aligned shards of a text into
+    the counts of the whole text: words are inserted in the order they were
+    first seen, and the sentences of each shard are numbered after those of
+    the shards before it. N-grams do not span shards, just as they do not
+    span sentences, so only the n-gram summaries can differ from counting
+    the text in one go, and only when they are full (see ngrams.HeavyHitters).
+    Arguments:
+    parts: Sequence[TokenCounts] - The counts of each shard, in order
+    lemmas: bool (optional, default = False) - Whether lemmas were counted
+    index: bool (optional, default = False) - Whether sentences were indexed
+    ngrams: bool (optional, default = False) - Whether n-grams were counted
+    """
+    counts = TokenCounts(Counter(), Counter() if lemmas else None, {} if index else None,
+                         {} if ngrams else None)
+    n_sentences = 0
+    for part in parts:
+        counts.words.update(part.words)
+        if lemmas:
+            counts.lemmas.update(part.lemmas)
+        if index:
+            for word, ids in part.sentences.items():
+                sentences = counts.sentences.setdefault(word, [])
+                sentences.extend(ids if not n_sentences else [i + n_sentences for i in ids])
+        if ngrams:
+            merge_ngrams(counts.ngrams, part.ngrams)
+        n_sentences += part.n_sentences
+    return counts._replace(n_sentences=n_sentences)
+
+def split_units(chapters: Sequence[str], size: int = UNIT_LENGTH) -> List[str]:
+    """
+    Splits the chapters of a book into the units it is counted in: each
+    chapter, with long chapters split into chunks (see split_chunks).
+    Arguments:
+    chapters: Sequence[str] - The text of each chapter
+    size: int (optional, default = UNIT_LENGTH) - The length of a chunk
+    """
+    return [chunk for chapter in chapters for chunk in split_chunks(chapter, size)]
+
+def count_units(units: Sequence[str],
+                mt,
+                workers: int,
+                progress: Optional[Callable[[float], None]] = None,
+                lemmas: bool = False,
+                checkpoints=None,
+                index: bool = False,
+                ngrams: bool = False,
+                on_unit: Optional[Callable[[int, TokenCounts], None]] = None
+                ) -> TokenCounts:
+    """
+    Counts the words in each of the given units of text separately, in a
+    pool of worker processes if there is more than one worker, and merges
+    the counts in unit order.
+    With a checkpoint store (see checkpoints.CheckpointStore), units that
+    already have a checkpoint are not tokenized again, and every newly
+    counted unit is checkpointed as soon as it is done, so an interrupted
+    analysis resumes where it stopped and only new units of a book are
+    ever tokenized.
+    Arguments:
+    units: Sequence[str] - The units of text, see split_units
+    mt - A mecab tagger, used when the units are tokenized serially
+    workers: int - The number of worker processes to use
+    progress: Callable[[float], None] (optional) - Called with the
+    fraction of the text counted so far after every unit
+    lemmas: bool (optional, default = False) - Whether to count lemmas too
+    checkpoints: CheckpointStore (optional) - Where to keep the counts of each unit
+    index: bool (optional, default = False) - Whether to also record the
+    sentences each word occurs in, numbering the sentences of all the units
+    together, see TokenCounts.sentences
+    ngrams: bool (optional, default = False) - Whether to also count the
+    most common n-grams, merging the summaries of the units (so n-grams do
+    not span units), see TokenCounts.ngrams
+    on_unit: Callable[[int, TokenCounts], None] (optional) - Called with
+    the number and the counts of every unit, in order, as it is merged
+    """
+    missing = {i for i, unit in enumerate(units) if checkpoints is None or unit not in checkpoints}
+    texts = [units[i] for i in sorted(missing)]
+    if workers <= 1 or sum(map(len, texts)) < MIN_PARALLEL_LENGTH:
+        counted = (count_tokens(text, mt, lemmas, index, ngrams) for text in texts)
+    else:
+        # a unit is at most UNIT_LENGTH long, so a book with few units would
+        # only keep as many workers busy; split the units into about
+        # SHARDS_PER_WORKER shards per worker and merge each unit's shards
+        size = max(sum(map(len, texts)) // (workers * SHARDS_PER_WORKER), 1)
+        unit_shards = [split_chunks(text, size) for text in texts]
+        results = get_pool(workers).map(_count_shard, [shard for shards in unit_shards for shard in shards],
+                                        repeat(lemmas), repeat(index), repeat(ngrams))
+        counted = (merge_counts([next(results) for _ in shards], lemmas, index, ngrams)
+                   for shards in unit_shards)
+
+    counts = TokenCounts(Counter(), Counter() if lemmas else None, {} if index else None,
+                         {} if ngrams else None)
+    total = sum(map(len, units))
+    done = 0
+    n_sentences = 0
+    # counted yields the missing units in order, so every unit is merged
+    # in turn and words are inserted into counts in the order of the text
+    for i, unit in enumerate(units):
+        if i in missing:
+            unit_counts = next(counted)
+            new = True
+        else:
+            unit_counts = checkpoints.load(unit)
+            # the checkpoint could not be read, or has no sentences or n-grams
+            new = (unit_counts is None
+                   or (index and unit_counts.sentences is None)
+                   or (ngrams and unit_counts.ngrams is None))
+            if new:
+                unit_counts = count_tokens(unit, mt, lemmas, index, ngrams)
+        if unit_counts.n_sentences is None:
+            # checkpoints made before sentences were counted
+            unit_counts = unit_counts._replace(n_sentences=sum(1 for _ in split_sentences(unit)))
+        if new and checkpoints is not None:
+            checkpoints.save(unit, unit_counts)
+        counts.words.update(unit_counts.words)
+        if lemmas:
+            counts.lemmas.update(unit_counts.lemmas)
+        if index:
+            for word, ids in unit_counts.sentences.items():
+                sentences = counts.sentences.setdefault(word, [])
+                sentences.extend(ids if not n_sentences else [i + n_sentences for i in ids])
+        n_sentences += unit_counts.n_sentences
+        if ngrams:
+            merge_ngrams(counts.ngrams, unit_counts.ngrams)
+        if on_unit:
+            on_unit(i, unit_counts)
+        done += len(unit)
+        if progress:
+            progress(done / total if total else 1.0)
+    return counts._replace(n_sentences=n_sentences)
@@ -0,0 +1,110 @@
+import hashlib
+import os
+import shutil
+import uuid
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from flask import Request, current_app
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+
+from constants import MAX_UPLOAD_SIZE
+
+# Name of an uploaded file while it is being received
+PART_FILE = 'upload.part'
+
+class HashingFile:
+    """
+    A file in its own directory under the upload folder that an uploaded
+    file is streamed into, computing the sha256 hash of the file as it is
+    written so that it never has to be read back to be hashed.
+    Arguments:
+    directory: Path - The directory to create the file in, created if needed
+    max_size: int (optional, default = MAX_UPLOAD_SIZE) - The size in bytes
+    at which to give up on the upload
+    """
+    def __init__(self, directory: Path, max_size: int = MAX_UPLOAD_SIZE):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True)
+        self.path = self.directory / PART_FILE
+        self.max_size = max_size
+        self.size = 0
+        self._hash = hashlib.sha256()
+        self._file = open(self.path, 'w+b')
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        # the request's Content-Length is checked against MAX_CONTENT_LENGTH
+        # before anything is read, this catches uploads without one
+        if self.size > self.max_size:
+            raise RequestEntityTooLarge()
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self) -> str:
+        """Returns the sha256 hash of everything written so far"""
+        return self._hash.hexdigest()
+
+    def __getattr__(self, name: str):
+        return getattr(self._file, name)
+
+    def keep(self, filename: str) -> Path:
+        """
+        Closes the file and gives it the given name (made safe with
+        secure_filename), so that the file is not deleted at the end of the
+        request. The file (and its directory) then belongs to the caller,
+        see jobs.remove_upload. Returns the new path of the file.
+        Arguments:
+        filename: str - The name of the file as uploaded
+        """
+        self._file.close()
+        path = self.directory / secure_filename(filename)
+        os.replace(self.path, path)
+        self.path = path
+        return path
+
+    def discard(self) -> None:
+        """Deletes the file and its directory, unless it has been kept"""
+        self._file.close()
+        if self.path.name == PART_FILE:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+class UploadRequest(Request):
+    """
+    Request that streams every uploaded file into a HashingFile of its own
+    instead of keeping it in memory or an anonymous temporary file. Files
+    not kept with keep_upload are deleted when the request ends, see
+    discard_uploads.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.uploads: List[HashingFile] = []
+
+    def _get_file_stream(self,
+                         total_content_length: Optional[int],
+                         content_type: Optional[str],
+                         filename: Optional[str] = None,
+                         content_length: Optional[int] = None
+                         ) -> HashingFile:
+        directory = Path(current_app.config['UPLOAD_FOLDER']) / uuid.uuid4().hex
+        upload = HashingFile(directory, max_size=current_app.config.get('MAX_CONTENT_LENGTH')
+                             or MAX_UPLOAD_SIZE)
+        self.uploads.append(upload)
+        return upload
+
+    def discard_uploads(self) -> None:
+        """Deletes the uploaded files of this request that were not kept"""
+        for upload in self.uploads:
+            upload.discard()
+
+def keep_upload(file: FileStorage) -> Tuple[Path, str]:
+    """
+    Keeps a file uploaded with an UploadRequest, see HashingFile.keep.
+    Returns the path of the file and its sha256 hash.
+    Arguments:
+    file: FileStorage - The uploaded file, from request.files
+    """
+    upload = file.stream
+    return upload.keep(file.filename), upload.hexdigest()
@@ -0,0 +1,321 @@
+from collections import Counter
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from frequency_lists import Word
+
+if TYPE_CHECKING:
+    from frequency_index import FrequencyIndex
+
+# Upper bounds (inclusive) of the frequency ranks for 5, 4, 3, 2 and 1 stars,
+# see frequency_lists.stars_from_frequency
+STAR_BOUNDS = np.array([1500, 5000, 15000, 30000, 60000])
+# The orders the items of a Vocabulary can be listed in, see Vocabulary.order
+SORT_ORDERS = ('occurences', 'frequency', 'stars')
+
+def stars_from_frequencies(frequencies: np.ndarray) -> np.ndarray:
+    """
+    Vectorised version of frequency_lists.stars_from_frequency. Returns
+    the number of frequency stars for every frequency in the given array.
+    Entries that are 0 (meaning 'no frequency') get 0 stars.
+    Arguments:
+    frequencies: np.ndarray - Array of frequency ranks
+    """
+    stars = 5 - np.searchsorted(STAR_BOUNDS, frequencies, side='left')
+    return np.where(frequencies > 0, stars, 0)
+
+def overall_frequencies(ranks: np.ndarray) -> np.ndarray:
+    """
+    Given a (words x frequency lists) array of ranks, where 0 means the
+    word is not in that list, returns the overall frequency of every word:
+    the reciprocal of the average of 1 / rank over the lists it is in, or 0
+    for words that are not in any of the lists.
+    Arguments:
+    ranks: np.ndarray - 2d array of frequency ranks
+    """
+    present = ranks > 0
+    n_present = present.sum(axis=1)
+    with np.errstate(divide='ignore'):
+        scores = np.where(present, 1 / np.where(present, ranks, 1), 0).sum(axis=1)
+    overall = np.zeros(len(ranks), dtype=np.int64)
+    found = n_present > 0
+    overall[found] = np.rint(1 / scores[found] * n_present[found])
+    return overall
+
+class Vocabulary:
+    """
+    Compact table of the unique items (words or characters) in a book.
+    Each item is interned once in the items list, and everything else is
+    stored in NumPy arrays indexed by item id:
+    counts - the number of occurences of each item
+    ranks - (items x frequency lists) frequency ranks, 0 if not in the list
+    overall - the overall frequency rank, 0 if not in any list
+    pos - (lemma tables only) the id of the part of speech of each item
+    in pos_names, since the same base form can be e.g. both a verb and
+    an auxiliary verb. The item and its part of speech together are unique.
+    Items are sorted by number of occurences, most common first; the
+    other SORT_ORDERS are kept as arrays of item ids, see order.
+    Dictionaries in the old list-of-dicts format are only built when
+    they are asked for, through rows().
+    """
+    def __init__(self,
+                 items: Sequence[str],
+                 counts: np.ndarray,
+                 key: str = 'word',
+                 list_names: Sequence[str] = (),
+                 ranks: Optional[np.ndarray] = None,
+                 overall: Optional[np.ndarray] = None,
+                 pos: Optional[np.ndarray] = None,
+                 pos_names: Sequence[str] = (),
+                 orders: Optional[Dict[str, np.ndarray]] = None
+                 ):
+        self.items = items
+        self.counts = counts
+        self.key = key
+        self.list_names = list(list_names)
+        self.pos = pos
+        self.pos_names = list(pos_names)
+        if ranks is None:
+            ranks = np.zeros((len(items), len(self.list_names)), dtype=np.int32)
+        self.ranks = ranks
+        if overall is None and len(self.list_names):
+            overall = overall_frequencies(ranks)
+        self.overall = overall
+        self.orders = dict(orders or {})
+        self._ids: Optional[Dict[str, int]] = None
+
+    @classmethod
+    def from_counts(cls,
+                    counts: Counter,
+                    key: str = 'word',
+                    frequency_index: Optional['FrequencyIndex'] = None
+                    ) -> 'Vocabulary':
+        """
+        Builds a Vocabulary from a Counter of occurences, looking up all
+        the items in the given frequency index at once.
+        Arguments:
+        counts: Counter - The number of occurences of each item
+        key: str (optional, default = 'word') - The name of the item column
+        in rows(), e.g. 'word' or 'character'
+        frequency_index: FrequencyIndex (optional) - The frequency
+        lists to look the items up in
+        """
+        items = [item for item, _ in counts.most_common()]
+        occurences = np.fromiter((counts[item] for item in items),
+                                 dtype=np.int64, count=len(items))
+        if frequency_index is None or not frequency_index.list_names:
+            return cls(items, occurences, key=key)
+        ranks, overall = frequency_index.lookup(items)
+        return cls(items, occurences, key=key,
+                   list_names=frequency_index.list_names,
+                   ranks=ranks,
+                   overall=overall)
+
+    @classmethod
+    def from_lemma_counts(cls,
+                          counts: Counter,
+                          frequency_index: Optional['FrequencyIndex'] = None
+                          ) -> 'Vocabulary':
+        """
+        Builds a lemma Vocabulary from a Counter of occurences keyed by
+        (base form, part of speech), looking up the base forms in the
+        given frequency index.
+        Arguments:
+        counts: Counter - The number of occurences of each lemma,
+        see tokenizer.TokenCounts
+        frequency_index: FrequencyIndex (optional) - The frequency
+        lists to look the base forms up in
+        """
+        lemmas = counts.most_common()
+        items = [base_form for (base_form, _), _ in lemmas]
+        pos_names = sorted({pos for (_, pos), _ in lemmas})
+        pos_ids = {name: i for i, name in enumerate(pos_names)}
+        pos = np.fromiter((pos_ids[pos] for (_, pos), _ in lemmas),
+                          dtype=np.int16, count=len(lemmas))
+        occurences = np.fromiter((n for _, n in lemmas), dtype=np.int64, count=len(lemmas))
+        if frequency_index is None or not frequency_index.list_names:
+            return cls(items, occurences, key='lemma', pos=pos, pos_names=pos_names)
+        ranks, overall = frequency_index.lookup(items)
+        return cls(items, occurences, key='lemma',
+                   list_names=frequency_index.list_names,
+                   ranks=ranks,
+                   overall=overall,
+                   pos=pos,
+                   pos_names=pos_names)
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __repr__(self) -> str:
+        return f'Vocabulary({len(self)} {self.key}s, {self.total} occurences)'
+
+    @property
+    def total(self) -> int:
+        """The total number of (non-unique) occurences"""
+        return int(self.counts.sum())
+
+    @property
+    def used_once(self) -> np.ndarray:
+        """Boolean mask of the items used only once"""
+        return self.counts == 1
+
+    def id(self, item: str) -> Optional[int]:
+        """
+        Returns the id of the given item, or None if it is not in the vocabulary
+        Arguments:
+        item: str - The word or character to look up
+        """
+        if self._ids is None:
+            if hasattr(self.items, 'find'):
+                # stored tables are searched without decoding every item
+                return self.items.find(item)
+            self._ids = {item: i for i, item in enumerate(self.items)}
+        return self._ids.get(item)
+
+    @property
+    def stars(self) -> np.ndarray:
+        """The number of overall frequency stars of each item, 0 if not in any list"""
+        if self.overall is None:
+            return np.zeros(len(self), dtype=np.int64)
+        return stars_from_frequencies(np.asarray(self.overall))
+
+    def order(self, by: str = 'occurences') -> np.ndarray:
+        """
+        Returns the ids of all the items, sorted by the given column:
+        'occurences' - most common first (the order of the ids)
+        'frequency' - lowest overall frequency rank first, items that
+        are not in any frequency list last
+        'stars' - most frequency stars first, then most common first
+        Ties keep the order of the ids. Each order is only computed once,
+        and stored with the table by storage.save_table.
+        Arguments:
+        by: str (optional, default = 'occurences') - One of SORT_ORDERS
+        """
+        if by not in SORT_ORDERS:
+            raise ValueError(f'Cannot sort by {by}, must be one of {", ".join(SORT_ORDERS)}')
+        if by not in self.orders:
+            if by == 'occurences' or self.overall is None:
+                order = np.arange(len(self), dtype=np.int32)
+            elif by == 'frequency':
+                overall = np.asarray(self.overall)
+                missing = overall.max(initial=0) + 1
+                order = np.argsort(np.where(overall > 0, overall, missing), kind='stable')
+            else:
+                order = np.argsort(-self.stars, kind='stable')
+            self.orders[by] = order.astype(np.int32)
+        return self.orders[by]
+
+    def select(self,
+               min_stars: Optional[int] = None,
+               max_stars: Optional[int] = None,
+               min_occurences: Optional[int] = None,
+               max_occurences: Optional[int] = None,
+               used_once: Optional[bool] = None,
+               pos: Optional[str] = None
+               ) -> np.ndarray:
+        """
+        Returns a boolean mask of the items matching all the given filters.
+        Filters that are None are not applied.
+        Arguments:
+        min_stars: int (optional) - The least number of overall frequency stars
+        max_stars: int (optional) - The most number of overall frequency stars
+        min_occurences: int (optional) - The least number of occurences
+        max_occurences: int (optional) - The most number of occurences
+        used_once: bool (optional) - Whether the items must be used once,
+        or more than once
+        pos: str (optional) - The part of speech (lemma tables only)
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if min_stars is not None or max_stars is not None:
+            stars = self.stars
+            if min_stars is not None:
+                mask &= stars >= min_stars
+            if max_stars is not None:
+                mask &= stars <= max_stars
+        if min_occurences is not None:
+            mask &= self.counts >= min_occurences
+        if max_occurences is not None:
+            mask &= self.counts <= max_occurences
+        if used_once is not None:
+            mask &= self.used_once == used_once
+        if pos is not None:
+            if self.pos is None or pos not in self.pos_names:
+                mask[:] = False
+            else:
+                mask &= self.pos == self.pos_names.index(pos)
+        return mask
+
+    def query(self,
+              sort: str = 'occurences',
+              order: str = 'desc',
+              offset: int = 0,
+              limit: Optional[int] = None,
+              **filters
+              ) -> Tuple[np.ndarray, int]:
+        """
+        Returns the ids of one page of the items matching the given filters
+        (see select) in the given order, and the number of matching items.
+        Arguments:
+        sort: str (optional, default = 'occurences') - One of SORT_ORDERS
+        order: str (optional, default = 'desc') - 'desc' for the order
+        given by sort, 'asc' for the reverse
+        offset: int (optional, default = 0) - The number of matching items to skip
+        limit: int (optional) - The most number of ids to return, all if None
+        filters - Passed on to select. Filters that are None are not applied.
+        """
+        if order not in ('asc', 'desc'):
+            raise ValueError(f"Order must be 'asc' or 'desc', not {order}")
+        ids = self.order(sort)
+        if order == 'asc':
+            ids = ids[::-1]
+        if any(value is not None for value in filters.values()):
+            ids = ids[self.select(**filters)[ids]]
+        end = None if limit is None else offset + limit
+        return np.asarray(ids[offset:end]), len(ids)
+
+    def frequency(self, i: int) -> Dict[str, Union[Word, str]]:
+        """
+        Returns the frequencies of item i by frequency list name,
+        with its overall frequency as 'Overall' ('N/A' if it has none)
+        Arguments:
+        i: int - The id of the item
+        """
+        frequencies = {}
+        for j, name in enumerate(self.list_names):
+            rank = int(self.ranks[i, j])
+            if rank:
+                frequencies[name] = Word(rank, int(stars_from_frequencies(rank)))
+        overall = int(self.overall[i])
+        frequencies['Overall'] = Word(overall, int(stars_from_frequencies(overall))) if overall else 'N/A'
+        return frequencies
+
+    def row(self, i: int) -> dict:
+        """
+        Returns item i as a dictionary, e.g.
+        {'word': ..., 'frequency': {...}, 'occurences': ...}
+        Arguments:
+        i: int - The id of the item
+        """
+        row = {self.key: self.items[i]}
+        if self.pos is not None:
+            row['pos'] = self.pos_names[self.pos[i]]
+        if self.overall is not None:
+            row['frequency'] = self.frequency(i)
+        row['occurences'] = int(self.counts[i])
+        return row
+
+    def rows(self) -> Iterator[dict]:
+        """
+        Lazily yields every item as a dictionary (see row),
+        most common first
+        """
+        for i in range(len(self.items)):
+            yield self.row(i)
+
+    def for_json(self) -> Iterator[dict]:
+        """
+        Used by simplejson (with for_json=True and iterable_as_array=True)
+        to stream the rows to a file without building them all at once
+        """
+        return self.rows()